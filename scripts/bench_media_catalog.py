@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""Gallery query benchmark for the media asset catalog.
+
+Seeds a SQLite catalog with synthetic assets (200k by default) under
+var/bench/, then times first pages, deep keyset pages and anchor/type
+filtered pages the way the UI gallery requests them.
+
+    python3 scripts/bench_media_catalog.py [--assets 200000] [--out var/bench/catalog.db]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from services.media.catalog import SQLiteCatalog  # noqa: E402
+
+PROVIDERS = ["dalle", "gemini", "lm_studio"]
+ANCHORS = [f"char_{i}" for i in range(200)]
+
+
+def seed(cat: SQLiteCatalog, n: int) -> None:
+    batch = []
+    for i in range(n):
+        batch.append({
+            "id": f"asset_{i:08d}",
+            "type": "image" if i % 3 else "audio",
+            "provider": PROVIDERS[i % len(PROVIDERS)],
+            "uri": f"asset://images/{i}/generated.png",
+            "size_bytes": 1024 * (i % 500),
+            "prompt_hash": f"{i % 5000:08x}",
+            "anchors": [ANCHORS[i % len(ANCHORS)], ANCHORS[(i * 7) % len(ANCHORS)]],
+            "metadata": {"style": "realistic", "n": i},
+            "created_at": f"2026-{1 + i % 12:02d}-{1 + i % 28:02d}T{i % 24:02d}:{i % 60:02d}:00.{i % 1000000:06d}+00:00",
+        })
+        if len(batch) == 5000:
+            cat.add_many(batch)
+            batch = []
+    if batch:
+        cat.add_many(batch)
+
+
+def timed(label: str, fn, runs: int = 50) -> None:
+    t0 = time.perf_counter()
+    for _ in range(runs):
+        fn()
+    print(f"{label:38s} {(time.perf_counter() - t0) / runs * 1000:7.2f} ms/page")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--assets", type=int, default=200_000)
+    ap.add_argument("--out", default=os.path.join("var", "bench", "catalog.db"))
+    args = ap.parse_args()
+
+    fresh = not os.path.exists(args.out)
+    cat = SQLiteCatalog(args.out)
+    if fresh:
+        t0 = time.perf_counter()
+        seed(cat, args.assets)
+        print(f"seeded {args.assets} assets in {time.perf_counter() - t0:.1f}s")
+
+    timed("first page (50)", lambda: cat.list(limit=50))
+    _, cursor = cat.list(limit=1000)
+    for _ in range(50):  # 50k rows deep
+        _, cursor = cat.list(limit=1000, cursor=cursor)
+    timed("page 50k rows deep (50)", lambda: cat.list(limit=50, cursor=cursor))
+    timed("anchor filter (50)", lambda: cat.list(anchor="char_17", limit=50))
+    timed("type + provider filter (50)", lambda: cat.list(asset_type="audio", provider="gemini", limit=50))
+    timed("prompt hash filter (50)", lambda: cat.list(prompt_hash="0000002a", limit=50))
+    ids = [f"asset_{i:08d}" for i in range(0, args.assets, max(1, args.assets // 500))]
+    timed(f"bulk fetch ({len(ids)} ids)", lambda: cat.get_many(ids), runs=10)
+
+
+if __name__ == "__main__":
+    main()
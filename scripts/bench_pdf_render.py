@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""Throughput benchmark for the screenplay PDF renderer.
+
+Builds a synthetic script of about 120 pages (a feature-length draft), then
+times layout + pagination + PDF serialisation in-process and through the
+worker pool used by /screenplay/export.
+
+    python3 scripts/bench_pdf_render.py [--pages 120] [--runs 20] [--workers 4]
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from services.screenplay.main import ExportReq, SceneCard  # noqa: E402
+from services.screenplay import pdf, render  # noqa: E402
+
+LINES = [
+    "We can't stay here. The tide turns within the hour and the harbor will be under water.",
+    "Then we go through the lighthouse.",
+    "Nobody has opened that door in thirty years, and you want to walk in with a lantern?",
+    "I want to walk in with you.",
+]
+
+
+def synthetic_script(target_pages: int) -> ExportReq:
+    cards = []
+    req = None
+    while req is None or pdf.page_count(req) < target_pages:
+        i = len(cards)
+        cards.append(SceneCard(
+            slug=f"scene_{i}",
+            where=f"Harbor of Lumen, pier {i % 9}",
+            who=["Elyra", "Captain Rios"],
+            goal="Decide whether to cross before the storm",
+            when={"time": "NIGHT" if i % 2 else "DAY"},
+            conflict_or_twist="The fog horn sounds twice, which it has never done before." if i % 3 == 0 else None,
+            action=("Rain hammers the boards. Elyra drags a crate to the edge of the pier while Rios "
+                    "watches the water, counting the seconds between waves. ") * 2,
+            dialogue=[{"character": "Elyra" if j % 2 == 0 else "Captain Rios", "text": LINES[j % len(LINES)]}
+                      for j in range(6)],
+        ))
+        req = ExportReq(cards=cards, format="pdf", title="Bench Script", author="Bench")
+    return req
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--pages", type=int, default=120)
+    ap.add_argument("--runs", type=int, default=20)
+    ap.add_argument("--workers", type=int, default=4)
+    args = ap.parse_args()
+
+    req = synthetic_script(args.pages)
+    pages = pdf.page_count(req)
+    print(f"script: {len(req.cards)} scenes, {pages} pages")
+
+    t0 = time.perf_counter()
+    for _ in range(args.runs):
+        data = render.render_bytes(req)
+    dt = time.perf_counter() - t0
+    print(f"in-process: {args.runs / dt:.1f} scripts/s, {pages * args.runs / dt:.0f} pages/s, "
+          f"{dt / args.runs * 1000:.1f} ms/script, {len(data) / 1024:.0f} KiB")
+
+    with ProcessPoolExecutor(args.workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        list(pool.map(render.render_bytes, [req] * args.workers))  # warm up workers
+        t0 = time.perf_counter()
+        list(pool.map(render.render_bytes, [req] * args.runs))
+        dt = time.perf_counter() - t0
+    print(f"pool x{args.workers}: {args.runs / dt:.1f} scripts/s, {pages * args.runs / dt:.0f} pages/s")
+
+
+if __name__ == "__main__":
+    main()
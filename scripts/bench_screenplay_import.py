@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""Throughput benchmark for the Fountain/FDX screenplay importer.
+
+Generates a synthetic corpus (by default ~20 MB per format, written with the
+service's own exporters) under var/bench/, then parses it in 64 KiB chunks
+the way /screenplay/import receives a request body and reports MB/s.
+
+    python3 scripts/bench_screenplay_import.py [--mb 20] [--out var/bench]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from services.screenplay.main import ExportReq, SceneCard  # noqa: E402
+from services.screenplay import importer, render  # noqa: E402
+
+CHUNK = 64 * 1024
+LINES = [
+    "We can't stay here. The tide turns within the hour and the harbor will be under water.",
+    "Then we go through the lighthouse.",
+    "Nobody has opened that door in thirty years, and you want to walk in with a lantern?",
+    "I want to walk in with you.",
+]
+
+
+def _cards(n: int):
+    return [SceneCard(
+        slug=f"scene_{i}",
+        where=f"Harbor of Lumen, pier {i % 9}",
+        who=["Elyra", "Captain Rios"],
+        goal="Decide whether to cross before the storm",
+        when={"time": "NIGHT" if i % 2 else "DAY"},
+        conflict_or_twist="The fog horn sounds twice." if i % 3 == 0 else None,
+        action="Rain hammers the boards. Elyra drags a crate to the edge of the pier.",
+        dialogue=[{"character": "Elyra" if j % 2 == 0 else "Captain Rios", "text": LINES[j % len(LINES)]}
+                  for j in range(6)],
+    ) for i in range(n)]
+
+
+def build_corpus(out_dir: str, target_mb: float) -> dict:
+    os.makedirs(out_dir, exist_ok=True)
+    paths = {}
+    batch = _cards(500)
+    for fmt in importer.IMPORT_FORMATS:
+        path = os.path.join(out_dir, f"corpus.{fmt}")
+        req = ExportReq(cards=batch, format=fmt, title="Bench Corpus", author="Bench")
+        body = render.render_bytes(req)
+        with open(path, "wb") as f:
+            if fmt == "fdx":
+                # Repeat the <Content> body inside one document
+                head, _, rest = body.partition(b"</TitlePage>\n")
+                scenes, _, tail = rest.rpartition(b"    </Content>")
+                f.write(head + b"</TitlePage>\n")
+                while f.tell() < target_mb * 1e6:
+                    f.write(scenes)
+                f.write(b"    </Content>" + tail)
+            else:
+                f.write(body)
+                scenes = body.partition(b"\n\n")[2]
+                while f.tell() < target_mb * 1e6:
+                    f.write(b"\n" + scenes)
+        paths[fmt] = path
+    return paths
+
+
+def bench(path: str, fmt: str) -> None:
+    size = os.path.getsize(path)
+
+    def chunks():
+        with open(path, "rb") as f:
+            while True:
+                data = f.read(CHUNK)
+                if not data:
+                    return
+                yield data
+
+    t0 = time.perf_counter()
+    scenes = sum(1 for _ in importer.iter_cards(chunks(), fmt))
+    dt = time.perf_counter() - t0
+    print(f"{fmt:9s} {size / 1e6:6.1f} MB  {scenes:7d} scenes  {size / 1e6 / dt:6.1f} MB/s  "
+          f"{scenes / dt:8.0f} scenes/s")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--mb", type=float, default=20)
+    ap.add_argument("--out", default=os.path.join("var", "bench"))
+    args = ap.parse_args()
+    for fmt, path in build_corpus(args.out, args.mb).items():
+        bench(path, fmt)
+
+
+if __name__ == "__main__":
+    main()
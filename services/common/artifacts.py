@@ -0,0 +1,293 @@
+"""Content-addressed artifact store.
+
+Artifacts are written once under their SHA-256 (``sha256:<hex>``) and
+deduplicated on write. Named refs map a request fingerprint to the artifact
+it produced, so services can return a stored artifact instead of rebuilding
+it. ``ARTIFACT_STORE_DIR`` sets the local root (default ``var/artifacts``).
+
+With ``ARTIFACT_STORE_BACKEND=s3``, objects are also mirrored to an
+S3-compatible bucket (MinIO in docker-compose; ``S3_ENDPOINT``,
+``S3_BUCKET``, ``S3_ACCESS_KEY``, ``S3_SECRET_KEY``, with boto3 installed).
+The local root then works as a read-through cache: objects another
+process stored are pulled down on first use, so downloads are always
+served from a local file.
+
+``artifact_response`` is the shared download handler: strong ETag,
+``If-None-Match`` revalidation and an immutable ``Cache-Control``.
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from pathlib import Path
+from typing import Any, AsyncIterable, Dict, Iterable, Optional, Union
+
+from starlette.requests import Request
+from starlette.responses import FileResponse, JSONResponse, Response
+
+from services.common.envelope import envelope_error
+
+DEFAULT_ROOT = "var/artifacts"
+
+
+def artifact_id(data: bytes) -> str:
+    return "sha256:" + hashlib.sha256(data).hexdigest()
+
+
+def etag_for(cid: str) -> str:
+    """Strong ETag for an artifact; its content hash never changes."""
+    return f'"{cid.split(":", 1)[-1]}"'
+
+
+def fingerprint(payload: Any) -> str:
+    """Stable hash of a JSON-able request payload, used as a ref name."""
+    raw = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class ArtifactTooLarge(ValueError):
+    pass
+
+
+class _Incoming:
+    """A temp file being written and hashed, committed under its hash once complete."""
+
+    def __init__(self, directory: Path, max_bytes: Optional[int]) -> None:
+        directory.mkdir(parents=True, exist_ok=True)
+        fd, self.tmp = tempfile.mkstemp(dir=directory, prefix=".incoming-")
+        self.file = os.fdopen(fd, "wb")
+        self.digest = hashlib.sha256()
+        self.size = 0
+        self.max_bytes = max_bytes
+
+    def write(self, chunk: bytes) -> None:
+        self.size += len(chunk)
+        if self.max_bytes is not None and self.size > self.max_bytes:
+            raise ArtifactTooLarge(f"artifact exceeds {self.max_bytes} bytes")
+        self.digest.update(chunk)
+        self.file.write(chunk)
+
+    def abort(self) -> None:
+        self.file.close()
+        if os.path.exists(self.tmp):
+            os.unlink(self.tmp)
+
+
+class LocalArtifactStore:
+    """Artifacts on the local filesystem: ``objects/ab/<hex>`` plus JSON ``refs/<namespace>/<name>``."""
+
+    def __init__(self, root: Union[str, Path]) -> None:
+        self.root = Path(root)
+        self._objects = self.root / "objects"
+        self._refs = self.root / "refs"
+
+    def _object_path(self, cid: str) -> Path:
+        algo, _, hexdigest = cid.partition(":")
+        if algo != "sha256" or len(hexdigest) != 64 or any(c not in "0123456789abcdef" for c in hexdigest):
+            raise ValueError(f"invalid artifact id: {cid!r}")
+        return self._objects / hexdigest[:2] / hexdigest
+
+    def _commit(self, incoming: _Incoming, media_type: str) -> Dict[str, Any]:
+        incoming.file.close()
+        cid = "sha256:" + incoming.digest.hexdigest()
+        path = self._object_path(cid)
+        info = {"id": cid, "size_bytes": incoming.size, "media_type": media_type}
+        if path.exists():
+            os.unlink(incoming.tmp)
+            return {**info, "deduplicated": True}
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.with_suffix(".json").write_text(json.dumps(info), encoding="utf-8")
+        os.replace(incoming.tmp, path)
+        self._stored(path, info)
+        return {**info, "deduplicated": False}
+
+    def _stored(self, path: Path, info: Dict[str, Any]) -> None:
+        """Hook for backends that mirror new objects elsewhere."""
+
+    def put_chunks(self, chunks: Iterable[bytes], media_type: str = "application/octet-stream",
+                   max_bytes: Optional[int] = None) -> Dict[str, Any]:
+        """Stream ``chunks`` to disk while hashing; identical content is stored once."""
+        incoming = _Incoming(self._objects, max_bytes)
+        try:
+            for chunk in chunks:
+                incoming.write(chunk)
+            return self._commit(incoming, media_type)
+        except BaseException:
+            incoming.abort()
+            raise
+
+    async def put_async_chunks(self, chunks: AsyncIterable[bytes], media_type: str = "application/octet-stream",
+                               max_bytes: Optional[int] = None) -> Dict[str, Any]:
+        """``put_chunks`` for an async source (e.g. an HTTP response body); file I/O runs off the event loop."""
+        incoming = await asyncio.to_thread(_Incoming, self._objects, max_bytes)
+        try:
+            async for chunk in chunks:
+                await asyncio.to_thread(incoming.write, chunk)
+            return await asyncio.to_thread(self._commit, incoming, media_type)
+        except BaseException:
+            incoming.abort()
+            raise
+
+    def put_bytes(self, data: bytes, media_type: str = "application/octet-stream") -> Dict[str, Any]:
+        return self.put_chunks([data], media_type)
+
+    def exists(self, cid: str) -> bool:
+        try:
+            return self._object_path(cid).is_file()
+        except ValueError:
+            return False
+
+    def path(self, cid: str) -> Optional[Path]:
+        """Local path of an artifact, or None when it is not stored."""
+        try:
+            p = self._object_path(cid)
+        except ValueError:
+            return None
+        return p if p.is_file() else None
+
+    def stat(self, cid: str) -> Optional[Dict[str, Any]]:
+        """``{id, size_bytes, media_type}`` for a stored artifact, else None."""
+        p = self.path(cid)
+        if p is None:
+            return None
+        try:
+            info = json.loads(p.with_suffix(".json").read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            info = {"media_type": "application/octet-stream"}
+        return {**info, "id": cid, "size_bytes": p.stat().st_size}
+
+    def read_bytes(self, cid: str) -> bytes:
+        p = self.path(cid)
+        if p is None:
+            raise KeyError(cid)
+        return p.read_bytes()
+
+    def _ref_path(self, namespace: str, name: str) -> Path:
+        if not name or any(c in name for c in "/\\") or name.startswith("."):
+            raise ValueError(f"invalid ref name: {name!r}")
+        return self._refs / namespace / f"{name}.json"
+
+    def set_ref(self, namespace: str, name: str, record: Dict[str, Any]) -> None:
+        p = self._ref_path(namespace, name)
+        p.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=p.parent, prefix=".ref-")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(record, f)
+        os.replace(tmp, p)
+
+    def get_ref(self, namespace: str, name: str) -> Optional[Dict[str, Any]]:
+        """Ref record, or None when missing or pointing at an artifact that is gone."""
+        p = self._ref_path(namespace, name)
+        try:
+            record = json.loads(p.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+        return record if self.exists(record.get("id", "")) else None
+
+
+class S3ArtifactStore(LocalArtifactStore):
+    """Local store mirrored to an S3-compatible bucket under ``<prefix>objects/ab/<hex>``.
+
+    New objects are uploaded from the committed local file (boto3 streams
+    it in multipart chunks). Objects missing locally are downloaded into
+    the local root on first use. Refs stay local; they only memoize
+    request fingerprints and are rebuilt on a miss.
+    """
+
+    def __init__(self, root: Union[str, Path], bucket: str, endpoint_url: Optional[str] = None,
+                 access_key: Optional[str] = None, secret_key: Optional[str] = None,
+                 prefix: str = "artifacts/") -> None:
+        super().__init__(root)
+        import boto3
+        self.bucket = bucket
+        self.prefix = prefix
+        self._s3 = boto3.client("s3", endpoint_url=endpoint_url, aws_access_key_id=access_key,
+                                aws_secret_access_key=secret_key)
+
+    def _key(self, cid: str) -> str:
+        hexdigest = self._object_path(cid).name
+        return f"{self.prefix}objects/{hexdigest[:2]}/{hexdigest}"
+
+    def _stored(self, path: Path, info: Dict[str, Any]) -> None:
+        self._s3.upload_file(str(path), self.bucket, self._key(info["id"]),
+                             ExtraArgs={"ContentType": info["media_type"]})
+
+    def _head(self, cid: str) -> Optional[Dict[str, Any]]:
+        try:
+            return self._s3.head_object(Bucket=self.bucket, Key=self._key(cid))
+        except Exception:
+            return None
+
+    def _valid(self, cid: str) -> bool:
+        try:
+            self._object_path(cid)
+            return True
+        except ValueError:
+            return False
+
+    def exists(self, cid: str) -> bool:
+        return super().exists(cid) or (self._valid(cid) and self._head(cid) is not None)
+
+    def path(self, cid: str) -> Optional[Path]:
+        local = super().path(cid)
+        if local is not None or not self._valid(cid):
+            return local
+        head = self._head(cid)
+        if head is None:
+            return None
+        target = self._object_path(cid)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=target.parent, prefix=".incoming-")
+        os.close(fd)
+        try:
+            self._s3.download_file(self.bucket, self._key(cid), tmp)
+            info = {"id": cid, "size_bytes": os.path.getsize(tmp),
+                    "media_type": head.get("ContentType") or "application/octet-stream"}
+            target.with_suffix(".json").write_text(json.dumps(info), encoding="utf-8")
+            os.replace(tmp, target)
+        finally:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+        return target
+
+
+_STORES: Dict[str, LocalArtifactStore] = {}
+_STORES_LOCK = threading.Lock()
+
+
+def get_artifact_store() -> LocalArtifactStore:
+    """Process-wide store for ``ARTIFACT_STORE_DIR`` (and ``ARTIFACT_STORE_BACKEND``)."""
+    root = os.environ.get("ARTIFACT_STORE_DIR", DEFAULT_ROOT)
+    backend = os.environ.get("ARTIFACT_STORE_BACKEND", "local")
+    with _STORES_LOCK:
+        store = _STORES.get(f"{backend}:{root}")
+        if store is None:
+            if backend == "s3":
+                store = S3ArtifactStore(root, os.environ.get("S3_BUCKET", "storymaker"),
+                                        endpoint_url=os.environ.get("S3_ENDPOINT"),
+                                        access_key=os.environ.get("S3_ACCESS_KEY"),
+                                        secret_key=os.environ.get("S3_SECRET_KEY"))
+            else:
+                store = LocalArtifactStore(root)
+            _STORES[f"{backend}:{root}"] = store
+        return store
+
+
+def artifact_response(store: LocalArtifactStore, artifact_id: str, request: Request,
+                      code: str = "ARTIFACT_NOT_FOUND", message: str = "Artifact not found") -> Response:
+    """Serve a stored artifact with Range and conditional GET support, or a 404 envelope."""
+    info = store.stat(artifact_id)
+    if info is None:
+        return JSONResponse(status_code=404, content=envelope_error(
+            code, message, {"id": artifact_id}, {"actor": "api"}))
+    etag = etag_for(artifact_id)
+    # Content-addressed, so the bytes behind an id never change
+    headers = {"ETag": etag, "Cache-Control": "public, max-age=31536000, immutable"}
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in [t.strip() for t in if_none_match.split(",")] or if_none_match.strip() == "*":
+        return Response(status_code=304, headers=headers)
+    return FileResponse(store.path(artifact_id), media_type=info["media_type"], headers=headers)
@@ -0,0 +1,90 @@
+"""Request deadlines propagated from orchestration to downstream services.
+
+The orchestration host sends the caller's remaining budget in
+``X-Deadline-Ms``. ``DeadlineMiddleware`` turns it into a per-request
+deadline so provider calls can clamp their timeouts and retry counts, and
+fail fast once the caller has already given up.
+"""
+from __future__ import annotations
+
+import json
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+from services.common.envelope import envelope_error
+
+# Must match tools.pf_langgraph.runtime.DEADLINE_HEADER
+DEADLINE_HEADER = "X-Deadline-Ms"
+
+_deadline: ContextVar[Optional[float]] = ContextVar("deadline", default=None)
+
+
+class DeadlineExceeded(TimeoutError):
+    pass
+
+
+def set_deadline(budget_ms: Optional[float]):
+    """Start a deadline ``budget_ms`` from now; returns a token for ``reset_deadline``."""
+    return _deadline.set(None if budget_ms is None else time.monotonic() + budget_ms / 1000.0)
+
+
+def reset_deadline(token) -> None:
+    _deadline.reset(token)
+
+
+def remaining() -> Optional[float]:
+    """Seconds left before the deadline, or None when the request has none."""
+    d = _deadline.get()
+    return None if d is None else d - time.monotonic()
+
+
+def check(where: str = "") -> None:
+    left = remaining()
+    if left is not None and left <= 0:
+        raise DeadlineExceeded(f"deadline exceeded{f' before {where}' if where else ''}")
+
+
+def clamp_timeout(timeout: float, where: str = "") -> float:
+    """``timeout`` (seconds) bounded by the remaining budget; raises once it is spent."""
+    check(where)
+    left = remaining()
+    return timeout if left is None else min(timeout, left)
+
+
+def can_retry(backoff: float) -> bool:
+    """Whether sleeping ``backoff`` seconds still leaves budget for another attempt."""
+    left = remaining()
+    return left is None or left > backoff
+
+
+class DeadlineMiddleware:
+    """ASGI middleware: reads ``X-Deadline-Ms`` and rejects already-expired requests with 504."""
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        raw = dict(scope.get("headers") or []).get(DEADLINE_HEADER.lower().encode())
+        budget_ms = None
+        if raw is not None:
+            try:
+                budget_ms = float(raw)
+            except ValueError:
+                budget_ms = None
+        if budget_ms is not None and budget_ms <= 0:
+            return await _reject(send)
+        token = set_deadline(budget_ms)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            reset_deadline(token)
+
+
+async def _reject(send) -> None:
+    body = json.dumps(envelope_error("DEADLINE_EXCEEDED", "Caller deadline already passed")).encode()
+    await send({"type": "http.response.start", "status": 504,
+                "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]})
+    await send({"type": "http.response.body", "body": body})
@@ -1,9 +1,42 @@
 
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from services.common.envelope import envelope_ok
-from typing import Dict, Any
-app = FastAPI(title="StoryMaker Interact", version="1.6.0")
+from pydantic import BaseModel, Field
+from services.common.envelope import envelope_ok, envelope_error
+from services.interact import personas, streaming
+from contextlib import asynccontextmanager
+from typing import Dict, Any, List, Optional
+import asyncio
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+PERSONAS: Dict[str, Dict[str, Any]] = {"ch_elyra":{"pov":"Elyra","invariants":["will not take a bribe"],"location":"Harbor of Lumen","citations":["f_council","p_harbor"]}}
+
+# Persona loader (shared LRU + source); created on first use or at startup
+LOADER: Optional[personas.PersonaLoader] = None
+
+def get_loader() -> personas.PersonaLoader:
+    global LOADER
+    if LOADER is None:
+        LOADER = personas.create_loader(PERSONAS)
+    return LOADER
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    get_loader()
+    # Drop cached personas when WorldCore approves a change to one of their entities
+    dsn = os.environ.get("POSTGRES_DSN")
+    listener = asyncio.create_task(personas.listen_for_canon_changes(dsn, get_loader)) if dsn else None
+    try:
+        yield
+    finally:
+        if listener is not None:
+            listener.cancel()
+            await asyncio.gather(listener, return_exceptions=True)
+
+app = FastAPI(title="StoryMaker Interact", version="1.6.0", lifespan=lifespan)
 
 # Add CORS middleware
 app.add_middleware(
@@ -13,20 +46,62 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
-PERSONAS: Dict[str, Dict[str, Any]] = {"ch_elyra":{"pov":"Elyra","invariants":["will not take a bribe"],"location":"Harbor of Lumen"}}
 @app.get("/health")
 def health(): return envelope_ok({"ok": True}, {"actor":"api"})
+
+class InvalidateReq(BaseModel):
+    ids: List[str] = Field(..., min_length=1, max_length=1000, description="Canon entity IDs that changed")
+
+@app.post("/npc/personas/invalidate")
+def invalidate_personas(req: InvalidateReq):
+    """Drop cached personas built from any of the given entities"""
+    dropped = get_loader().cache.invalidate(req.ids)
+    return envelope_ok({"invalidated": dropped}, {"actor":"api"})
+
+@app.get("/npc/personas/stats")
+def persona_stats():
+    """Shared persona cache statistics"""
+    loader = get_loader()
+    return envelope_ok({**loader.cache.stats(), "source": loader.source.name, "loads": loader.loads}, {"actor":"api"})
+
+def compose_reply(persona: Dict[str, Any], msg: Dict[str, Any]) -> Dict[str, Any]:
+    text = (msg.get("msg") or "").lower()
+    if "unknown" in text or "invent" in text:
+        return {"msg":"I cannot assert that. Proposing a draft fact for approval.","propose":{"type":"PROPOSE_FACT","payload":{"text":msg.get("msg")}}}
+    return {"msg":"Captain Rios commands tonight's patrols at dockside and the east gate.","citations":persona.get("citations", [])}
+
+def stream_reply(persona: Dict[str, Any], msg: Dict[str, Any]):
+    """Reply pieces and final-frame fields for the streaming protocol"""
+    reply = compose_reply(persona, msg)
+    text = reply.pop("msg")
+    return streaming.paced(text, streaming.token_delay()), reply
+
 @app.websocket("/npc/session")
-async def npc_session(ws: WebSocket):
+async def npc_session(ws: WebSocket, npc: str = "ch_elyra", stream: bool = False):
     await ws.accept()
     try:
-        await ws.send_json({"status":"ok","data":{"persona": PERSONAS.get("ch_elyra")}})
+        # Loaded once per session; turns below only read this snapshot
+        try:
+            persona, hit = await get_loader().load(npc)
+        except personas.PersonaNotFound:
+            await ws.send_json(envelope_error("PERSONA_NOT_FOUND", f"No NPC persona for {npc}", {"npc": npc}, {"actor":"api"}))
+            await ws.close(code=4404)
+            return
+        except Exception as e:
+            logger.error(f"Failed to load persona {npc}: {e}")
+            await ws.send_json(envelope_error("PERSONA_UNAVAILABLE", "Failed to load NPC persona", {"detail": str(e)}, {"actor":"api"}))
+            await ws.close(code=1011)
+            return
+        protocol = "stream" if stream else "message"
+        await ws.send_json({"status":"ok","data":{"persona": persona},"meta":{"persona_cache":{"hit": hit},"protocol": protocol}})
+        if stream:
+            # Delta/final frames per turn; see services/interact/streaming.py
+            await streaming.StreamSession(ws, lambda msg: stream_reply(persona, msg)).run()
+            return
         while True:
             msg = await ws.receive_json()
-            text = (msg.get("msg") or "").lower()
-            if "unknown" in text or "invent" in text:
-                await ws.send_json({"msg":"I cannot assert that. Proposing a draft fact for approval.","propose":{"type":"PROPOSE_FACT","payload":{"text":msg.get("msg")}}})
-            else:
-                await ws.send_json({"msg":"Captain Rios commands tonight's patrols at dockside and the east gate.","citations":["f_council","p_harbor"]})
+            await ws.send_json(compose_reply(persona, msg))
     except WebSocketDisconnect:
         return
+# Manual: ws://localhost:8004/npc/session → unknown → expect PROPOSE_FACT
+# Manual: ws://localhost:8004/npc/session?stream=1 → unknown → deltas, then final with PROPOSE_FACT
@@ -0,0 +1,291 @@
+"""NPC personas hydrated from canon.
+
+A persona is built from a canon Character entity plus the entities it
+points at: its world, its place (``place_id``, or a ``location`` naming
+an entity) and its relationship targets. WorldCore returns all of them
+in one query (``WorldCoreDAL.get_persona_bundle``).
+
+Caching works at two levels:
+
+- Each WebSocket session loads its persona once, at session start, and
+  keeps it for the whole conversation. Chat turns never touch the
+  database.
+- A shared LRU (``INTERACT_PERSONA_CACHE_SIZE``) serves popular NPCs to
+  new sessions without a query. Concurrent session starts for the same
+  NPC share one load.
+
+Entries are invalidated by the ID of any entity they were built from.
+WorldCore's approve sends ``NOTIFY canon_changed`` with the entity ID,
+and the service listens for it when ``POSTGRES_DSN`` is set.
+``POST /npc/personas/invalidate`` does the same by hand, and
+``INTERACT_PERSONA_TTL_S`` bounds staleness when neither reaches a
+process.
+
+``INTERACT_PERSONA_SOURCE`` picks where bundles come from: ``dal``
+(``POSTGRES_DSN``), ``http`` (``WORLDCORE_BASE``) or ``static`` (the
+built-in demo personas). It defaults to the first one that is configured.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+CANON_CHANNEL = "canon_changed"  # must match services.worldcore.dal.CANON_CHANNEL
+
+# Traits that are structure (used to find related entities), not persona detail
+_STRUCTURAL_TRAITS = {"invariants", "place_id", "relationships", "pov"}
+
+
+class PersonaNotFound(LookupError):
+    pass
+
+
+def _relationships(traits: Dict[str, Any]) -> List[Tuple[str, Optional[str]]]:
+    raw = traits.get("relationships")
+    if isinstance(raw, dict):
+        return [(str(k), v if isinstance(v, str) else None) for k, v in raw.items()]
+    out = []
+    for item in raw if isinstance(raw, list) else []:
+        if isinstance(item, str):
+            out.append((item, None))
+        elif isinstance(item, dict) and item.get("id"):
+            out.append((str(item["id"]), item.get("relation")))
+    return out
+
+
+def _ref(entity: Dict[str, Any]) -> Dict[str, Any]:
+    return {"id": entity["id"], "name": entity.get("name"), "type": entity.get("type")}
+
+
+def build_persona(bundle: Dict[str, Any]) -> Dict[str, Any]:
+    """Persona from ``{"character": entity, "related": {id: entity}}`` (entities carry canon_version)"""
+    character = bundle["character"]
+    related = bundle.get("related") or {}
+    traits = character.get("traits") or {}
+
+    place_id = traits.get("place_id") or traits.get("location")
+    place = related.get(place_id) if isinstance(place_id, str) else None
+    world = related.get(character.get("world_id") or "")
+    relationships = []
+    for rid, relation in _relationships(traits):
+        if rid in related:
+            relationships.append({**_ref(related[rid]), "relation": relation})
+
+    sources = [character] + [e for e in (place, world) if e] + [related[r["id"]] for r in relationships]
+    versions = {e["id"]: e.get("canon_version", 1) for e in sources}
+    invariants = traits.get("invariants") or []
+    return {
+        "id": character["id"],
+        "name": character.get("name"),
+        "pov": traits.get("pov") or character.get("name"),
+        "invariants": invariants if isinstance(invariants, list) else [invariants],
+        "location": place.get("name") if place else traits.get("location"),
+        "place": _ref(place) if place else None,
+        "world": _ref(world) if world else None,
+        "relationships": relationships,
+        "traits": {k: v for k, v in traits.items() if k not in _STRUCTURAL_TRAITS},
+        "citations": list(versions),
+        "versions": versions,
+    }
+
+
+class StaticPersonaSource:
+    """Built-in demo personas, for running without WorldCore"""
+
+    name = "static"
+
+    def __init__(self, personas: Dict[str, Dict[str, Any]]) -> None:
+        self.personas = personas
+
+    async def bundle(self, npc_id: str) -> Dict[str, Any]:
+        if npc_id not in self.personas:
+            raise PersonaNotFound(npc_id)
+        return {"persona": dict(self.personas[npc_id])}
+
+
+class HTTPPersonaSource:
+    name = "http"
+
+    def __init__(self, base_url: str, transport: Optional[httpx.AsyncBaseTransport] = None) -> None:
+        self.base_url = base_url.rstrip("/")
+        self.transport = transport
+
+    async def bundle(self, npc_id: str) -> Dict[str, Any]:
+        # One request per cold session start, so no long-lived client to manage
+        async with httpx.AsyncClient(transport=self.transport, timeout=5.0) as client:
+            response = await client.get(f"{self.base_url}/canon/entity/{npc_id}/persona")
+        if response.status_code == 404:
+            raise PersonaNotFound(npc_id)
+        response.raise_for_status()
+        body = response.json()
+        if body.get("status") != "ok":
+            raise RuntimeError((body.get("error") or {}).get("message", "WorldCore persona lookup failed"))
+        return body["data"]
+
+
+class DALPersonaSource:
+    name = "dal"
+
+    def __init__(self, dsn: Optional[str] = None) -> None:
+        from services.worldcore.dal import WorldCoreDAL
+        self.dal = WorldCoreDAL(dsn)
+
+    async def bundle(self, npc_id: str) -> Dict[str, Any]:
+        found = await asyncio.to_thread(self.dal.get_persona_bundle, npc_id)
+        if found is None:
+            raise PersonaNotFound(npc_id)
+
+        def flat(c):
+            return {**c["entity"], "canon_version": c["canon_version"]}
+        return {"character": flat(found["character"]),
+                "related": {eid: flat(c) for eid, c in found["related"].items()}}
+
+
+class PersonaCache:
+    """Shared LRU of built personas with a TTL and invalidation by constituent entity ID"""
+
+    def __init__(self, max_entries: int = 256, ttl: float = 300.0) -> None:
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._by_entity: Dict[str, Set[str]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        # Bumped on every invalidation, so a load that raced one is not cached
+        self.epoch = 0
+
+    def get(self, npc_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(npc_id)
+            if entry is None or time.monotonic() - entry[0] > self.ttl:
+                if entry is not None:
+                    self._drop(npc_id)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(npc_id)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, npc_id: str, persona: Dict[str, Any], epoch: Optional[int] = None) -> None:
+        with self._lock:
+            if epoch is not None and epoch != self.epoch:
+                return
+            self._drop(npc_id)
+            self._entries[npc_id] = (time.monotonic(), persona)
+            for eid in persona.get("versions") or {npc_id: 1}:
+                self._by_entity.setdefault(eid, set()).add(npc_id)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+
+    def invalidate(self, entity_ids: List[str]) -> List[str]:
+        """Drop every persona built from any of ``entity_ids``; returns the NPC IDs dropped"""
+        with self._lock:
+            self.epoch += 1
+            dropped = sorted({npc for eid in entity_ids for npc in self._by_entity.get(eid, ())})
+            for npc_id in dropped:
+                self._drop(npc_id)
+            self.invalidations += len(dropped)
+            return dropped
+
+    def _drop(self, npc_id: str) -> None:
+        entry = self._entries.pop(npc_id, None)
+        if entry is None:
+            return
+        for eid in entry[1].get("versions") or {npc_id: 1}:
+            npcs = self._by_entity.get(eid)
+            if npcs is not None:
+                npcs.discard(npc_id)
+                if not npcs:
+                    del self._by_entity[eid]
+
+    def stats(self) -> Dict[str, Any]:
+        return {"entries": len(self._entries), "max_entries": self.max_entries, "ttl_s": self.ttl,
+                "hits": self.hits, "misses": self.misses, "invalidations": self.invalidations}
+
+
+class PersonaLoader:
+    def __init__(self, source, cache: Optional[PersonaCache] = None) -> None:
+        self.source = source
+        self.cache = cache or PersonaCache()
+        self.loads = 0
+        self._inflight: Dict[Tuple[int, str], asyncio.Task] = {}
+
+    async def load(self, npc_id: str) -> Tuple[Dict[str, Any], bool]:
+        """``(persona, cache_hit)``; concurrent loads of one NPC share a single source call"""
+        persona = self.cache.get(npc_id)
+        if persona is not None:
+            return persona, True
+        # Tasks belong to one event loop, so only loads on this loop are shared
+        loop = asyncio.get_running_loop()
+        key = (id(loop), npc_id)
+        pending = self._inflight.get(key)
+        if pending is None:
+            # The fetch runs detached from any one caller: a session that goes
+            # away mid-load must not cancel it for the others waiting on it
+            pending = loop.create_task(self._fetch(npc_id))
+            self._inflight[key] = pending
+            pending.add_done_callback(lambda task: self._finished(key, task))
+        return await asyncio.shield(pending), False
+
+    async def _fetch(self, npc_id: str) -> Dict[str, Any]:
+        self.loads += 1
+        epoch = self.cache.epoch
+        bundle = await self.source.bundle(npc_id)
+        persona = bundle["persona"] if "persona" in bundle else build_persona(bundle)
+        self.cache.put(npc_id, persona, epoch)
+        return persona
+
+    def _finished(self, key: Tuple[int, str], task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            task.exception()  # mark retrieved when every caller has gone
+
+
+async def listen_for_canon_changes(dsn: str, loader_ref, retry: float = 5.0) -> None:
+    """Invalidate personas on WorldCore's ``canon_changed`` notifications until cancelled"""
+    import psycopg
+    while True:
+        try:
+            async with await psycopg.AsyncConnection.connect(dsn, autocommit=True) as conn:
+                await conn.execute(f"LISTEN {CANON_CHANNEL}")
+                async for notify in conn.notifies():
+                    dropped = loader_ref().cache.invalidate([notify.payload])
+                    if dropped:
+                        logger.info(f"Canon change to {notify.payload} invalidated personas {dropped}")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"Canon change listener unavailable ({e}); retrying in {retry}s")
+            await asyncio.sleep(retry)
+
+
+def source_name() -> str:
+    default = "dal" if os.environ.get("POSTGRES_DSN") else "http" if os.environ.get("WORLDCORE_BASE") else "static"
+    return os.environ.get("INTERACT_PERSONA_SOURCE", default)
+
+
+def create_loader(static_personas: Dict[str, Dict[str, Any]]) -> PersonaLoader:
+    name = source_name()
+    if name == "dal":
+        source = DALPersonaSource()
+    elif name == "http":
+        source = HTTPPersonaSource(os.environ.get("WORLDCORE_BASE", ""))
+    elif name == "static":
+        source = StaticPersonaSource(static_personas)
+    else:
+        raise ValueError(f"Unknown INTERACT_PERSONA_SOURCE {name!r} (expected dal, http or static)")
+    cache = PersonaCache(int(os.environ.get("INTERACT_PERSONA_CACHE_SIZE", "256")),
+                         float(os.environ.get("INTERACT_PERSONA_TTL_S", "300")))
+    return PersonaLoader(source, cache)
@@ -0,0 +1,242 @@
+"""Streaming NPC replies over the session WebSocket.
+
+``/npc/session?stream=1`` opts a connection into this protocol. Without
+it, the session keeps sending one message per turn. The client sends
+``{"msg": ...}`` as before, optionally with its own ``turn_id``. Each turn
+is answered with frames tagged with the turn id:
+
+- ``{"type": "delta", "turn_id", "offset", "text"}``: the next piece of
+  the reply. ``offset`` is where ``text`` starts in the full reply.
+- ``{"type": "final", "turn_id", "msg", "citations" | "propose"}``: the
+  full reply and its citations or PROPOSE_FACT payload. It is always the
+  last frame of a completed turn.
+- ``{"type": "cancelled", "turn_id", "reason"}``: the turn was abandoned
+  because the player sent a new message (``superseded``) or
+  ``{"type": "cancel"}`` (``cancelled``). No frames for that turn follow.
+- ``{"type": "error", "turn_id", "error": {"code", "message"}}``.
+
+Frames go through a bounded per-connection queue drained by a single
+writer task:
+
+- When the writer is behind, new deltas are merged into the queued delta
+  of the same turn, so a slow client gets fewer, larger frames instead
+  of a growing backlog.
+- Queued delta text is capped (``INTERACT_STREAM_QUEUE_CHARS``) and the
+  queue holds at most ``INTERACT_STREAM_QUEUE_FRAMES`` frames. A full
+  queue makes the reply wait, which pushes back on token generation.
+- A send that takes longer than ``INTERACT_STREAM_SEND_TIMEOUT_S`` means
+  the client stopped reading. The connection is closed with 1008.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import re
+from collections import deque
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, Optional, Tuple
+
+from starlette.websockets import WebSocketDisconnect
+
+logger = logging.getLogger(__name__)
+
+SLOW_CLIENT_CLOSE_CODE = 1008
+
+# respond(msg) -> (reply text pieces, fields for the final frame)
+Responder = Callable[[Dict[str, Any]], Tuple[AsyncIterator[str], Dict[str, Any]]]
+
+
+def token_delay() -> float:
+    """Pause between pieces of a canned reply (seconds); LLM replies are paced by the model"""
+    return float(os.environ.get("INTERACT_STREAM_TOKEN_DELAY_MS", "0")) / 1000
+
+
+def send_timeout() -> float:
+    return float(os.environ.get("INTERACT_STREAM_SEND_TIMEOUT_S", "10"))
+
+
+async def paced(text: str, delay: float = 0.0) -> AsyncIterator[str]:
+    """``text`` word by word, as a model would stream it"""
+    for piece in re.findall(r"\s*\S+", text):
+        yield piece
+        await asyncio.sleep(delay)
+
+
+class SendQueue:
+    """Bounded outgoing frame queue with delta coalescing"""
+
+    def __init__(self, max_frames: int = 64, max_chars: int = 16384) -> None:
+        self.max_frames = max_frames
+        self.max_chars = max_chars
+        self._frames: Deque[Dict[str, Any]] = deque()
+        self._chars = 0
+        self._cond = asyncio.Condition()
+        self.closed = False
+        self.coalesced = 0
+        self.stalls = 0
+
+    def __len__(self) -> int:
+        return len(self._frames)
+
+    def _full(self, frame: Dict[str, Any]) -> bool:
+        if len(self._frames) >= self.max_frames:
+            return True
+        return frame.get("type") == "delta" and self._chars >= self.max_chars
+
+    async def put(self, frame: Dict[str, Any]) -> None:
+        """Queue ``frame``, waiting while the queue is full; frames put after close are dropped"""
+        async with self._cond:
+            tail = self._frames[-1] if self._frames else None
+            if (frame.get("type") == "delta" and tail is not None and tail.get("type") == "delta"
+                    and tail["turn_id"] == frame["turn_id"] and self._chars < self.max_chars):
+                tail["text"] += frame["text"]
+                self._chars += len(frame["text"])
+                self.coalesced += 1
+                return
+            if self._full(frame) and not self.closed:
+                self.stalls += 1
+                await self._cond.wait_for(lambda: self.closed or not self._full(frame))
+            if self.closed:
+                return
+            self._frames.append(dict(frame))
+            if frame.get("type") == "delta":
+                self._chars += len(frame["text"])
+            self._cond.notify_all()
+
+    async def get(self) -> Optional[Dict[str, Any]]:
+        """Next frame, or None once the queue is closed"""
+        async with self._cond:
+            await self._cond.wait_for(lambda: self.closed or self._frames)
+            if self.closed:
+                return None
+            frame = self._frames.popleft()
+            if frame.get("type") == "delta":
+                self._chars -= len(frame["text"])
+            self._cond.notify_all()
+            return frame
+
+    async def drop_turn(self, turn_id: str) -> int:
+        """Discard queued deltas of ``turn_id``; returns how many were dropped"""
+        async with self._cond:
+            keep = deque(f for f in self._frames if not (f.get("type") == "delta" and f["turn_id"] == turn_id))
+            dropped = len(self._frames) - len(keep)
+            self._frames = keep
+            self._chars = sum(len(f["text"]) for f in keep if f.get("type") == "delta")
+            self._cond.notify_all()
+            return dropped
+
+    async def close(self) -> None:
+        async with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+
+
+def queue_from_env() -> SendQueue:
+    return SendQueue(int(os.environ.get("INTERACT_STREAM_QUEUE_FRAMES", "64")),
+                     int(os.environ.get("INTERACT_STREAM_QUEUE_CHARS", "16384")))
+
+
+class StreamSession:
+    """One streaming connection: a reader that starts and cancels turns, and a writer that drains the queue"""
+
+    def __init__(self, ws, respond: Responder, queue: Optional[SendQueue] = None,
+                 timeout: Optional[float] = None) -> None:
+        self.ws = ws
+        self.respond = respond
+        self.queue = queue or queue_from_env()
+        self.timeout = timeout if timeout is not None else send_timeout()
+        self.turns = 0
+        self._current: Optional[Tuple[str, asyncio.Task]] = None
+
+    async def run(self) -> None:
+        reader = asyncio.ensure_future(self._read())
+        writer = asyncio.ensure_future(self._write())
+        try:
+            await asyncio.wait({reader, writer}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            await self.queue.close()
+            await _settle([reader, writer] + ([self._current[1]] if self._current else []))
+
+    async def _read(self) -> None:
+        while True:
+            try:
+                msg = await self.ws.receive_json()
+            except WebSocketDisconnect:
+                return
+            except ValueError:
+                await self.queue.put({"type": "error", "turn_id": None,
+                                      "error": {"code": "BAD_MESSAGE", "message": "Expected a JSON object"}})
+                continue
+            if not isinstance(msg, dict):
+                msg = {"msg": str(msg)}
+            if msg.get("type") == "cancel":
+                await self._cancel_current("cancelled")
+                continue
+            await self._cancel_current("superseded")
+            self.turns += 1
+            turn_id = str(msg.get("turn_id") or f"t{self.turns}")
+            self._current = (turn_id, asyncio.ensure_future(self._turn(turn_id, msg)))
+
+    async def _cancel_current(self, reason: str) -> None:
+        if self._current is None:
+            return
+        turn_id, task = self._current
+        self._current = None
+        if task.done():
+            return
+        await _settle([task])
+        # Deltas still queued for the abandoned turn are never sent
+        await self.queue.drop_turn(turn_id)
+        await self.queue.put({"type": "cancelled", "turn_id": turn_id, "reason": reason})
+
+    async def _turn(self, turn_id: str, msg: Dict[str, Any]) -> None:
+        text = ""
+        try:
+            pieces, fields = self.respond(msg)
+            async for piece in pieces:
+                await self.queue.put({"type": "delta", "turn_id": turn_id, "offset": len(text), "text": piece})
+                text += piece
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"NPC reply for turn {turn_id} failed: {e}")
+            await self.queue.put({"type": "error", "turn_id": turn_id,
+                                  "error": {"code": "REPLY_FAILED", "message": str(e)}})
+            return
+        await self.queue.put({"type": "final", "turn_id": turn_id, "msg": text, **fields})
+
+    async def _write(self) -> None:
+        while True:
+            frame = await self.queue.get()
+            if frame is None:
+                return
+            try:
+                await asyncio.wait_for(self.ws.send_json(frame), self.timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"NPC stream client stopped reading for {self.timeout}s; closing")
+                await _close_quietly(self.ws.close(code=SLOW_CLIENT_CLOSE_CODE), self.timeout)
+                return
+            except (WebSocketDisconnect, RuntimeError):
+                return
+
+
+async def _settle(tasks) -> None:
+    """Cancel ``tasks`` and wait for them to finish.
+
+    asyncio.wait rather than gather: a cancelled gather stays pending until
+    its children finish, and server cancel scopes (anyio) keep cancelling
+    a task that waits on it.
+    """
+    for task in tasks:
+        task.cancel()
+    await asyncio.wait(tasks)
+    for task in tasks:
+        if not task.cancelled() and task.exception() is not None:
+            logger.debug(f"NPC stream task ended with {task.exception()!r}")
+
+
+async def _close_quietly(closing: Awaitable[Any], timeout: float) -> None:
+    try:
+        await asyncio.wait_for(closing, timeout)
+    except Exception:
+        pass
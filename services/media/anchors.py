@@ -0,0 +1,198 @@
+"""Canon anchor resolution for image prompts.
+
+``VisualReq.anchors`` holds WorldCore entity ids. Before generating, the
+media service resolves them and appends a compact canon reference to the
+prompt, so illustrations stay on-canon without anyone pasting entity
+descriptions into prompts by hand.
+
+- All anchors of a request are fetched in one batched call: WorldCore's
+  ``POST /canon/entities`` multi-get, or an in-process DAL query when
+  media runs next to WorldCore. There is never one lookup per anchor.
+- Resolved descriptions are cached by ``(id, canon_version)``. The batch
+  call sends the versions already held, and WorldCore answers unchanged
+  entities with just their version, so a warm cache costs one small
+  round trip. A canon edit bumps the version and is picked up by the
+  next request.
+
+``MEDIA_ANCHOR_SOURCE`` selects the source: ``http`` (``WORLDCORE_BASE``),
+``dal`` (``POSTGRES_DSN``) or ``off``. It defaults to ``http`` when
+``WORLDCORE_BASE`` is set, and otherwise to ``off``, in which case
+anchors are carried as metadata only, as before.
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from services.common import deadline
+from services.media import providers
+
+# Anchors resolved per request, and the canon text budget per anchor (characters)
+MAX_ANCHORS = 32
+MAX_ANCHOR_CHARS = 240
+
+# Traits that describe how an entity looks, in the order they are preferred
+DESCRIPTIVE_TRAITS = ("appearance", "description", "look", "summary", "location", "era", "date")
+
+
+def describe(entity: Dict[str, Any]) -> str:
+    """One compact line of canon for an entity: name, type and its most visual traits"""
+    traits = entity.get("traits") or {}
+    parts: List[str] = []
+    for key in DESCRIPTIVE_TRAITS:
+        value = traits.get(key)
+        if isinstance(value, (str, int, float)) and str(value).strip():
+            parts.append(str(value).strip().rstrip("."))
+    for key, value in sorted(traits.items()):
+        if key not in DESCRIPTIVE_TRAITS and isinstance(value, (str, int, float)) and str(value).strip():
+            parts.append(f"{key} {value}")
+    text = f"{entity.get('name') or entity['id']} ({entity.get('type', 'entity')})"
+    if parts:
+        text += ": " + ", ".join(parts)
+    return text if len(text) <= MAX_ANCHOR_CHARS else text[:MAX_ANCHOR_CHARS - 1].rstrip(" ,") + "…"
+
+
+def compose_prompt(prompt: str, anchors: List[Dict[str, Any]]) -> str:
+    """The user's prompt plus one canon reference line for all resolved anchors"""
+    if not anchors:
+        return prompt
+    return f"{prompt.rstrip()}\n\nCanon reference (keep consistent across illustrations): " + \
+        "; ".join(a["description"] for a in anchors)
+
+
+@dataclass
+class Resolution:
+    anchors: List[Dict[str, Any]] = field(default_factory=list)
+    missing: List[str] = field(default_factory=list)
+    cache_hits: int = 0
+    fetched: int = 0
+    error: Optional[str] = None
+
+    def versions(self) -> List[Tuple[str, int]]:
+        return [(a["id"], a["canon_version"]) for a in self.anchors]
+
+    def meta(self, source: str) -> Dict[str, Any]:
+        meta = {"source": source, "resolved": len(self.anchors), "missing": self.missing,
+                "cache_hits": self.cache_hits, "fetched": self.fetched}
+        if self.error:
+            meta["error"] = self.error
+        return meta
+
+
+class HTTPCanonSource:
+    name = "http"
+
+    def __init__(self, base_url: str) -> None:
+        self.base_url = base_url.rstrip("/")
+
+    async def fetch(self, ids: List[str], known: Dict[str, int]) -> Dict[str, Any]:
+        client = providers.POOL.fetch_client()
+        response = await client.post(f"{self.base_url}/canon/entities", json={"ids": ids, "known": known},
+                                     timeout=deadline.clamp_timeout(5.0, "worldcore"))
+        response.raise_for_status()
+        body = response.json()
+        if body.get("status") != "ok":
+            raise RuntimeError((body.get("error") or {}).get("message", "WorldCore multi-get failed"))
+        return body["data"]
+
+
+class DALCanonSource:
+    """In-process lookup when media runs alongside WorldCore's database"""
+
+    name = "dal"
+
+    def __init__(self, dsn: Optional[str] = None) -> None:
+        from services.worldcore.dal import WorldCoreDAL
+        self.dal = WorldCoreDAL(dsn)
+
+    async def fetch(self, ids: List[str], known: Dict[str, int]) -> Dict[str, Any]:
+        return await asyncio.to_thread(self.dal.get_canon_batch, ids, known)
+
+
+class AnchorResolver:
+    def __init__(self, source, max_entries: int = 1024) -> None:
+        self.source = source
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, int], Dict[str, Any]]" = OrderedDict()
+        self._latest: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def _cached(self, eid: str, version: int) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get((eid, version))
+            if entry is not None:
+                self._entries.move_to_end((eid, version))
+            return entry
+
+    def _store(self, entity: Dict[str, Any]) -> Dict[str, Any]:
+        entry = {"id": entity["id"], "name": entity.get("name"), "type": entity.get("type"),
+                 "canon_version": entity["canon_version"], "description": describe(entity)}
+        with self._lock:
+            self._entries[(entry["id"], entry["canon_version"])] = entry
+            self._latest[entry["id"]] = entry["canon_version"]
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    async def resolve(self, ids: List[str]) -> Resolution:
+        ids = list(dict.fromkeys(ids))[:MAX_ANCHORS]
+        if not ids:
+            return Resolution()
+        with self._lock:
+            known = {i: self._latest[i] for i in ids if (i, self._latest.get(i)) in self._entries}
+        reply = await self.source.fetch(ids, known)
+        out = Resolution(missing=[i for i in ids if i in reply.get("missing", [])])
+        for eid in ids:
+            if eid in reply.get("entities", {}):
+                out.anchors.append(self._store(reply["entities"][eid]))
+                out.fetched += 1
+            elif eid in reply.get("unchanged", {}):
+                entry = self._cached(eid, reply["unchanged"][eid])
+                if entry is None:  # evicted since the request was built; resolve it next time
+                    out.missing.append(eid)
+                    continue
+                out.anchors.append(entry)
+                out.cache_hits += 1
+        return out
+
+    def stats(self) -> Dict[str, Any]:
+        return {"entries": len(self._entries), "max_entries": self.max_entries}
+
+
+_resolver: Optional[AnchorResolver] = None
+_resolver_config: Optional[Tuple[str, str]] = None
+_resolver_lock = threading.Lock()
+
+
+def source_name() -> str:
+    return os.environ.get("MEDIA_ANCHOR_SOURCE", "http" if os.environ.get("WORLDCORE_BASE") else "off")
+
+
+def get_resolver() -> Optional[AnchorResolver]:
+    """Process-wide resolver for the configured source, or None when resolution is off"""
+    global _resolver, _resolver_config
+    name = source_name()
+    if name == "off":
+        return None
+    config = (name, os.environ.get("WORLDCORE_BASE", "") if name == "http" else os.environ.get("POSTGRES_DSN", ""))
+    with _resolver_lock:
+        if _resolver is None or _resolver_config != config:
+            if name == "http":
+                source = HTTPCanonSource(config[1])
+            elif name == "dal":
+                source = DALCanonSource(config[1] or None)
+            else:
+                raise ValueError(f"Unknown MEDIA_ANCHOR_SOURCE {name!r} (expected http, dal or off)")
+            _resolver = AnchorResolver(source, int(os.environ.get("MEDIA_ANCHOR_CACHE_ENTRIES", "1024")))
+            _resolver_config = config
+        return _resolver
+
+
+def reset_resolver() -> None:
+    global _resolver, _resolver_config
+    with _resolver_lock:
+        _resolver, _resolver_config = None, None
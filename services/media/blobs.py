@@ -0,0 +1,106 @@
+"""Generated media bytes in the content-addressed artifact store.
+
+Provider image URLs expire (DALL-E links last about an hour), and
+``asset://`` URIs cannot be fetched. After a generation, ``store_url``
+downloads the provider's file into the shared artifact store
+(``services/common/artifacts.py``, local disk with an optional S3/MinIO
+mirror):
+
+- The response body is streamed chunk by chunk into a temp file while it
+  is hashed, so a whole image never sits in memory. Its size is capped
+  by ``MEDIA_BLOB_MAX_BYTES``.
+- Identical bytes are stored once, whichever request produced them.
+
+``GET /media/blobs/{id}`` serves blobs as files (sendfile, Range, ETag).
+Thumbnails are derived lazily on first request for a (blob, size) pair,
+stored as artifacts of their own, and found again through a ref. They
+need Pillow. Without it the thumbnail endpoint reports that thumbnails
+are unavailable, and everything else keeps working.
+"""
+from __future__ import annotations
+
+import io
+import os
+from typing import Any, Dict, Optional
+
+import httpx
+
+from services.common import deadline
+from services.common.artifacts import etag_for, get_artifact_store
+
+try:
+    from PIL import Image
+except ImportError:  # thumbnails are optional
+    Image = None
+
+CHUNK_SIZE = 64 * 1024
+THUMBNAIL_SIZES = (128, 256, 512)
+DEFAULT_THUMBNAIL_SIZE = 256
+THUMBNAIL_REF_NAMESPACE = "media-thumbnails"
+
+
+class ThumbnailUnavailable(RuntimeError):
+    pass
+
+
+def fetch_enabled() -> bool:
+    return os.environ.get("MEDIA_BLOB_FETCH", "1") != "0"
+
+
+def max_bytes() -> int:
+    return int(os.environ.get("MEDIA_BLOB_MAX_BYTES", str(50 * 1024 * 1024)))
+
+
+async def store_url(url: str, client: httpx.AsyncClient) -> Dict[str, Any]:
+    """Stream ``url`` into the artifact store; returns the stored artifact's info"""
+    store = get_artifact_store()
+    async with client.stream("GET", url, timeout=deadline.clamp_timeout(60.0, "blob fetch")) as response:
+        response.raise_for_status()
+        media_type = response.headers.get("content-type", "application/octet-stream").split(";")[0].strip()
+        return await store.put_async_chunks(response.aiter_bytes(CHUNK_SIZE), media_type, max_bytes=max_bytes())
+
+
+def blob_view(info: Dict[str, Any]) -> Dict[str, Any]:
+    view = {
+        "id": info["id"],
+        "uri": f"asset://blobs/{info['id'].split(':', 1)[-1]}",
+        "download_url": f"/media/blobs/{info['id']}",
+        "etag": etag_for(info["id"]),
+        "size_bytes": info["size_bytes"],
+        "media_type": info["media_type"],
+    }
+    if info["media_type"].startswith("image/"):
+        view["thumbnail_url"] = f"/media/blobs/{info['id']}/thumbnail?size={DEFAULT_THUMBNAIL_SIZE}"
+    return view
+
+
+def thumbnail(blob_id: str, size: int) -> Dict[str, Any]:
+    """The stored thumbnail for ``blob_id`` bounded to ``size`` px, rendering it on first use.
+
+    Rendering is deterministic, so two requests racing to create the same
+    thumbnail store identical bytes and share one artifact.
+    """
+    store = get_artifact_store()
+    ref = f"{blob_id.split(':', 1)[-1]}-{size}"
+    existing = store.get_ref(THUMBNAIL_REF_NAMESPACE, ref)
+    if existing is not None:
+        return {**existing, "generated": False}
+    if Image is None:
+        raise ThumbnailUnavailable("Pillow is not installed")
+    with Image.open(store.path(blob_id)) as im:
+        fmt = "JPEG" if im.format == "JPEG" else "PNG"
+        im.thumbnail((size, size))
+        if fmt == "JPEG" and im.mode not in ("RGB", "L"):
+            im = im.convert("RGB")
+        buf = io.BytesIO()
+        im.save(buf, fmt, optimize=True)
+    info = store.put_bytes(buf.getvalue(), f"image/{fmt.lower()}")
+    record = {"id": info["id"], "size_bytes": info["size_bytes"], "media_type": info["media_type"],
+              "source": blob_id, "size": size}
+    store.set_ref(THUMBNAIL_REF_NAMESPACE, ref, record)
+    return {**record, "generated": True}
+
+
+def source_url(result: Dict[str, Any]) -> Optional[str]:
+    url = result.get("url")
+    return url if isinstance(url, str) and url.startswith(("http://", "https://")) else None
@@ -0,0 +1,242 @@
+"""Generation cache for /visual/generate and /audio/synth.
+
+Identical requests used to pay for a full provider round trip every time.
+Results are now cached under a key built from the provider, the normalized
+prompt or SSML (whitespace-collapsed), and every parameter that changes the
+output (style, size and variant count, or the voice parameters).
+
+Two backends are available, chosen by ``MEDIA_CACHE_BACKEND``:
+
+- ``memory``: an in-process LRU bounded by entry count and payload bytes
+- ``disk``: one JSON file per key under ``MEDIA_CACHE_DIR``, bounded by
+  total bytes and evicting the least recently used files first
+
+Set ``MEDIA_CACHE_BACKEND=off`` to disable caching. Both backends count
+hits and misses so the endpoints can report hit rates in envelope meta.
+Endpoints use ``aget``/``aput``, which run disk I/O in a worker thread so
+a slow disk never blocks the event loop.
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+# Bump when the cached payload shape changes
+CACHE_VERSION = 1
+
+_WS_RE = re.compile(r"\s+")
+_TAG_GAP_RE = re.compile(r">\s+<")
+
+
+def normalize_prompt(text: str) -> str:
+    return _WS_RE.sub(" ", text).strip()
+
+
+def normalize_ssml(ssml: str) -> str:
+    return _TAG_GAP_RE.sub("><", normalize_prompt(ssml))
+
+
+def cache_key(kind: str, provider: str, text: str, **params: Any) -> str:
+    payload = {"v": CACHE_VERSION, "kind": kind, "provider": provider, "text": text, "params": params}
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, separators=(",", ":")).encode("utf-8")).hexdigest()
+
+
+class _Stats:
+    def __init__(self) -> None:
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def snapshot(self, **extra: Any) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0, **extra}
+
+
+class MemoryCache:
+    """Thread-safe LRU bounded by entries and serialized payload bytes."""
+
+    backend = "memory"
+
+    def __init__(self, max_entries: int = 1024, max_bytes: int = 64 * 1024 * 1024) -> None:
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._items: "OrderedDict[str, tuple]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = _Stats()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                self._stats.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self._stats.hits += 1
+            return json.loads(item[0])
+
+    async def aget(self, key: str) -> Optional[Dict[str, Any]]:
+        return self.get(key)
+
+    def put(self, key: str, value: Dict[str, Any]) -> None:
+        data = json.dumps(value)
+        size = len(data)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._items[key] = (data, size)
+            self._bytes += size
+            while len(self._items) > self.max_entries or self._bytes > self.max_bytes:
+                _, (_, evicted) = self._items.popitem(last=False)
+                self._bytes -= evicted
+                self._stats.evictions += 1
+
+    async def aput(self, key: str, value: Dict[str, Any]) -> None:
+        self.put(key, value)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+            self._bytes = 0
+            self._stats = _Stats()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return self._stats.snapshot(backend=self.backend, entries=len(self._items), bytes=self._bytes)
+
+
+class DiskCache:
+    """One JSON file per key; least recently used files are removed past ``max_bytes``."""
+
+    backend = "disk"
+
+    def __init__(self, root: str, max_bytes: int = 256 * 1024 * 1024) -> None:
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._stats = _Stats()
+        os.makedirs(root, exist_ok=True)
+        # In-memory LRU index of path -> size, oldest first. Built from file
+        # mtimes once at startup so eviction and stats never walk the directory.
+        self._index: "OrderedDict[str, int]" = OrderedDict(
+            (path, size) for _, size, path in sorted(self._files()))
+        self._bytes = sum(self._index.values())
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], f"{key}.json")
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            value = json.loads(data)
+            os.utime(path)  # keeps the LRU order across restarts
+        except (OSError, ValueError):
+            with self._lock:
+                self._stats.misses += 1
+            return None
+        with self._lock:
+            self._stats.hits += 1
+            if path in self._index:
+                self._index.move_to_end(path)
+            else:
+                self._index[path] = len(data)
+                self._bytes += len(data)
+        return value
+
+    async def aget(self, key: str) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(self.get, key)
+
+    def put(self, key: str, value: Dict[str, Any]) -> None:
+        data = json.dumps(value).encode("utf-8")
+        if len(data) > self.max_bytes:
+            return
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        with self._lock:
+            os.replace(tmp, path)
+            self._bytes += len(data) - self._index.pop(path, 0)
+            self._index[path] = len(data)
+            self._evict()
+
+    async def aput(self, key: str, value: Dict[str, Any]) -> None:
+        await asyncio.to_thread(self.put, key, value)
+
+    def _files(self):
+        for dirpath, _, names in os.walk(self.root):
+            for name in names:
+                if name.endswith(".json"):
+                    path = os.path.join(dirpath, name)
+                    try:
+                        st = os.stat(path)
+                    except OSError:
+                        continue
+                    yield st.st_mtime, st.st_size, path
+
+    def _evict(self) -> None:
+        # Callers hold the lock
+        while self._bytes > self.max_bytes and self._index:
+            path, size = self._index.popitem(last=False)
+            self._bytes -= size
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            self._stats.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            for _, _, path in list(self._files()):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            self._index.clear()
+            self._bytes = 0
+            self._stats = _Stats()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return self._stats.snapshot(backend=self.backend, entries=len(self._index), bytes=self._bytes)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """Process-wide generation cache from the environment, or None when disabled."""
+    global _cache
+    backend = os.environ.get("MEDIA_CACHE_BACKEND", "memory").lower()
+    if backend == "off":
+        return None
+    with _cache_lock:
+        if _cache is None or _cache.backend != backend:
+            if backend == "disk":
+                _cache = DiskCache(os.environ.get("MEDIA_CACHE_DIR", os.path.join("var", "media-cache")),
+                                   int(os.environ.get("MEDIA_CACHE_MAX_BYTES", str(256 * 1024 * 1024))))
+            else:
+                _cache = MemoryCache(int(os.environ.get("MEDIA_CACHE_MAX_ENTRIES", "1024")),
+                                     int(os.environ.get("MEDIA_CACHE_MAX_BYTES", str(64 * 1024 * 1024))))
+        return _cache
+
+
+def reset_cache() -> None:
+    global _cache
+    with _cache_lock:
+        _cache = None
@@ -0,0 +1,280 @@
+"""Persistent media asset catalog.
+
+Generated assets are recorded here, and ``GET /media/assets`` reads from
+here. The same schema runs on SQLite locally and on Postgres in
+production; see ``sql/002_media_assets.sql``. ``MEDIA_CATALOG_DSN`` selects
+the backend: ``postgres://`` / ``postgresql://`` DSNs use psycopg, and
+anything else is a SQLite file path (default ``var/media/catalog.db``).
+
+Listing uses keyset pagination on ``(created_at, id)``, newest first. The
+cursor is the last row's key, so every page is an index range scan
+however deep the client pages. Each filter has a matching composite
+index that ends in ``(created_at, id)``, so filtering and paging share
+one index: type, provider, prompt hash, and anchor (through the
+``media_asset_anchors`` table, which carries ``created_at`` for that
+reason).
+"""
+from __future__ import annotations
+
+import base64
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+MAX_PAGE = 1000
+MAX_BULK = 1000
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS media_assets (
+  id TEXT PRIMARY KEY,
+  type TEXT NOT NULL,
+  provider TEXT,
+  uri TEXT NOT NULL,
+  size_bytes INTEGER NOT NULL DEFAULT 0,
+  prompt_hash TEXT,
+  anchors TEXT NOT NULL DEFAULT '[]',
+  metadata TEXT NOT NULL DEFAULT '{}',
+  created_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS media_assets_created_idx ON media_assets(created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS media_assets_type_created_idx ON media_assets(type, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS media_assets_type_provider_created_idx ON media_assets(type, provider, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS media_assets_provider_created_idx ON media_assets(provider, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS media_assets_prompt_hash_idx ON media_assets(prompt_hash, created_at DESC, id DESC);
+CREATE TABLE IF NOT EXISTS media_asset_anchors (
+  anchor TEXT NOT NULL,
+  asset_id TEXT NOT NULL REFERENCES media_assets(id) ON DELETE CASCADE,
+  created_at TEXT NOT NULL,
+  PRIMARY KEY (anchor, asset_id)
+);
+CREATE INDEX IF NOT EXISTS media_asset_anchors_created_idx
+  ON media_asset_anchors(anchor, created_at DESC, asset_id DESC);
+"""
+
+_COLUMNS = "a.id, a.type, a.provider, a.uri, a.size_bytes, a.prompt_hash, a.anchors, a.metadata, a.created_at"
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat(timespec="microseconds")
+
+
+def encode_cursor(created_at: str, asset_id: str) -> str:
+    raw = json.dumps([created_at, asset_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    try:
+        created_at, asset_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return str(created_at), str(asset_id)
+    except Exception:
+        raise InvalidCursor(f"Invalid cursor: {cursor!r}")
+
+
+class _Catalog:
+    """Shared query building; subclasses provide connections and the parameter style."""
+
+    placeholder = "?"
+
+    def _q(self, sql: str) -> str:
+        return sql if self.placeholder == "?" else sql.replace("?", self.placeholder)
+
+    def _row(self, row: Sequence[Any]) -> Dict[str, Any]:
+        created_at = row[8]
+        anchors = row[6] if isinstance(row[6], list) else json.loads(row[6] or "[]")
+        metadata = row[7] if isinstance(row[7], dict) else json.loads(row[7] or "{}")
+        return {
+            "id": row[0],
+            "type": row[1],
+            "provider": row[2],
+            "uri": row[3],
+            "size_bytes": row[4],
+            "prompt_hash": row[5],
+            "anchors": anchors,
+            "created_at": created_at.isoformat() if isinstance(created_at, datetime) else created_at,
+            "metadata": metadata,
+        }
+
+    @staticmethod
+    def _record(asset: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "id": asset["id"],
+            "type": asset["type"],
+            "provider": asset.get("provider"),
+            "uri": asset["uri"],
+            "size_bytes": int(asset.get("size_bytes") or 0),
+            "prompt_hash": asset.get("prompt_hash"),
+            "anchors": list(dict.fromkeys(asset.get("anchors") or [])),
+            "metadata": asset.get("metadata") or {},
+            "created_at": asset.get("created_at") or now_iso(),
+        }
+
+    def _list_sql(self, asset_type: Optional[str], provider: Optional[str], anchor: Optional[str],
+                  prompt_hash: Optional[str], after: Optional[Tuple[str, str]], limit: int):
+        where: List[str] = []
+        params: List[Any] = []
+        if anchor is not None:
+            # Drive the scan from the anchor index, which carries the sort key
+            source = "media_asset_anchors x JOIN media_assets a ON a.id = x.asset_id"
+            key = ("x.created_at", "x.asset_id")
+            where.append("x.anchor = ?")
+            params.append(anchor)
+        else:
+            source = "media_assets a"
+            key = ("a.created_at", "a.id")
+        for column, value in (("a.type", asset_type), ("a.provider", provider), ("a.prompt_hash", prompt_hash)):
+            if value is not None:
+                where.append(f"{column} = ?")
+                params.append(value)
+        if after is not None:
+            where.append(f"({key[0]}, {key[1]}) < (?, ?)")
+            params.extend(after)
+        sql = f"SELECT {_COLUMNS} FROM {source}"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += f" ORDER BY {key[0]} DESC, {key[1]} DESC LIMIT ?"
+        params.append(limit)
+        return self._q(sql), params
+
+    def list(self, asset_type: Optional[str] = None, provider: Optional[str] = None, anchor: Optional[str] = None,
+             prompt_hash: Optional[str] = None, limit: int = 100,
+             cursor: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """One page, newest first, plus the cursor for the next page (None on the last page)."""
+        limit = max(1, min(limit, MAX_PAGE))
+        after = decode_cursor(cursor) if cursor else None
+        sql, params = self._list_sql(asset_type, provider, anchor, prompt_hash, after, limit + 1)
+        rows = [self._row(r) for r in self._fetchall(sql, params)]
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(rows[-1]["created_at"], rows[-1]["id"])
+        return rows, next_cursor
+
+    def get_many(self, ids: Iterable[str]) -> List[Dict[str, Any]]:
+        """Assets for ``ids`` in request order; unknown ids are skipped."""
+        ids = list(dict.fromkeys(ids))[:MAX_BULK]
+        if not ids:
+            return []
+        marks = ", ".join("?" for _ in ids)
+        rows = self._fetchall(self._q(f"SELECT {_COLUMNS} FROM media_assets a WHERE a.id IN ({marks})"), ids)
+        by_id = {r[0]: self._row(r) for r in rows}
+        return [by_id[i] for i in ids if i in by_id]
+
+
+class SQLiteCatalog(_Catalog):
+    backend = "sqlite"
+
+    def __init__(self, path: str) -> None:
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA foreign_keys=ON")
+            self._conn.executescript(SQLITE_SCHEMA)
+
+    def _fetchall(self, sql: str, params: Sequence[Any]) -> List[Sequence[Any]]:
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def add_many(self, assets: Iterable[Dict[str, Any]]) -> int:
+        records = [self._record(a) for a in assets]
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO media_assets(id, type, provider, uri, size_bytes, prompt_hash, anchors, "
+                    "metadata, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    [(r["id"], r["type"], r["provider"], r["uri"], r["size_bytes"], r["prompt_hash"],
+                      json.dumps(r["anchors"]), json.dumps(r["metadata"]), r["created_at"]) for r in records])
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO media_asset_anchors(anchor, asset_id, created_at) VALUES (?, ?, ?)",
+                    [(anchor, r["id"], r["created_at"]) for r in records for anchor in r["anchors"]])
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return len(records)
+
+    def add(self, asset: Dict[str, Any]) -> None:
+        self.add_many([asset])
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class PostgresCatalog(_Catalog):
+    """Same queries through psycopg; the schema is created by sql/002_media_assets.sql."""
+
+    backend = "postgres"
+    placeholder = "%s"
+
+    def __init__(self, dsn: str) -> None:
+        import psycopg
+        self._psycopg = psycopg
+        self.dsn = dsn
+
+    def _fetchall(self, sql: str, params: Sequence[Any]) -> List[Sequence[Any]]:
+        with self._psycopg.connect(self.dsn) as conn:
+            with conn.cursor() as cur:
+                cur.execute(sql, params)
+                return cur.fetchall()
+
+    def add_many(self, assets: Iterable[Dict[str, Any]]) -> int:
+        records = [self._record(a) for a in assets]
+        with self._psycopg.connect(self.dsn) as conn:
+            with conn.cursor() as cur:
+                cur.executemany(
+                    "INSERT INTO media_assets(id, type, provider, uri, size_bytes, prompt_hash, anchors, metadata, "
+                    "created_at) VALUES (%s, %s, %s, %s, %s, %s, %s::jsonb, %s::jsonb, %s) "
+                    # Same result as SQLite's INSERT OR REPLACE: a re-recorded asset takes every new value
+                    "ON CONFLICT (id) DO UPDATE SET type=EXCLUDED.type, provider=EXCLUDED.provider, "
+                    "uri=EXCLUDED.uri, size_bytes=EXCLUDED.size_bytes, prompt_hash=EXCLUDED.prompt_hash, "
+                    "anchors=EXCLUDED.anchors, metadata=EXCLUDED.metadata, created_at=EXCLUDED.created_at",
+                    [(r["id"], r["type"], r["provider"], r["uri"], r["size_bytes"], r["prompt_hash"],
+                      json.dumps(r["anchors"]), json.dumps(r["metadata"]), r["created_at"]) for r in records])
+                # The REPLACE delete cascades in SQLite; here stale anchor rows are removed explicitly
+                cur.execute("DELETE FROM media_asset_anchors WHERE asset_id = ANY(%s)", ([r["id"] for r in records],))
+                cur.executemany(
+                    "INSERT INTO media_asset_anchors(anchor, asset_id, created_at) VALUES (%s, %s, %s) "
+                    "ON CONFLICT DO NOTHING",
+                    [(anchor, r["id"], r["created_at"]) for r in records for anchor in r["anchors"]])
+            conn.commit()
+        return len(records)
+
+    def add(self, asset: Dict[str, Any]) -> None:
+        self.add_many([asset])
+
+    def close(self) -> None:
+        pass
+
+
+_catalog: Optional[_Catalog] = None
+_catalog_dsn: Optional[str] = None
+_catalog_lock = threading.Lock()
+
+
+def get_catalog() -> _Catalog:
+    """Process-wide catalog for ``MEDIA_CATALOG_DSN`` (reopened if the setting changes)."""
+    global _catalog, _catalog_dsn
+    dsn = os.environ.get("MEDIA_CATALOG_DSN", os.path.join("var", "media", "catalog.db"))
+    with _catalog_lock:
+        if _catalog is None or _catalog_dsn != dsn:
+            if _catalog is not None:
+                _catalog.close()
+            if dsn.startswith(("postgres://", "postgresql://")):
+                _catalog = PostgresCatalog(dsn)
+            else:
+                _catalog = SQLiteCatalog(dsn)
+            _catalog_dsn = dsn
+        return _catalog
@@ -0,0 +1,252 @@
+"""Asynchronous media generation jobs.
+
+Provider calls can take up to a minute, which is longer than the reverse
+proxy will hold a connection. Job endpoints therefore return a job id
+immediately, and the generation runs in the background:
+
+- Every provider has its own queue and its own fixed set of workers. The
+  worker count is that provider's concurrency cap, so a slow provider
+  never holds up jobs for the others.
+- One global bound (``MEDIA_JOB_QUEUE_SIZE``) limits the number of
+  unfinished jobs. Past it, submissions are refused rather than queued
+  without limit.
+- Every state change is recorded as a progress event. Clients can poll
+  the job or follow its events as a server-sent event stream.
+- Cancelling a queued job removes it before it runs. Cancelling a running
+  job cancels its task.
+- Workers run in a fresh context, not the submitting request's, so a
+  job is not bound by that request's ``X-Deadline-Ms`` deadline.
+
+Jobs live in process memory, and finished jobs are kept up to
+``MEDIA_JOB_RETENTION``. All asyncio state belongs to the app's event
+loop, so the manager is started and stopped in the media app's lifespan.
+"""
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import os
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from services.common import deadline
+from services.media import providers
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+TERMINAL_STATES = {SUCCEEDED, FAILED, CANCELLED}
+
+Runner = Callable[["Job"], Awaitable[Dict[str, Any]]]
+
+
+class JobQueueFull(RuntimeError):
+    pass
+
+
+def provider_workers(provider: str) -> int:
+    default = providers.concurrency(provider) if provider in providers.DEFAULT_BASE_URLS else 2
+    return max(1, int(os.environ.get(f"MEDIA_JOB_{provider.upper()}_WORKERS", str(default))))
+
+
+@dataclass
+class Job:
+    id: str
+    kind: str
+    provider: str
+    runner: Runner
+    state: str = QUEUED
+    progress: float = 0.0
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[Dict[str, Any]] = None
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    events: List[Dict[str, Any]] = field(default_factory=list)
+    task: Optional[asyncio.Task] = None
+    cancel_requested: bool = False
+    changed: asyncio.Condition = field(default_factory=asyncio.Condition)
+
+    @property
+    def done(self) -> bool:
+        return self.state in TERMINAL_STATES
+
+    async def publish(self, state: Optional[str] = None, progress: Optional[float] = None,
+                      message: Optional[str] = None) -> None:
+        if state is not None:
+            self.state = state
+        if progress is not None:
+            self.progress = progress
+        event = {"seq": len(self.events), "state": self.state, "progress": self.progress, "ts": time.time()}
+        if message:
+            event["message"] = message
+        self.events.append(event)
+        async with self.changed:
+            self.changed.notify_all()
+
+    async def wait_events(self, after: int) -> List[Dict[str, Any]]:
+        """Events with ``seq >= after``, waiting for one if there are none yet."""
+        async with self.changed:
+            await self.changed.wait_for(lambda: len(self.events) > after)
+        return self.events[after:]
+
+    def view(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "provider": self.provider,
+            "state": self.state,
+            "progress": self.progress,
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class JobManager:
+    def __init__(self, max_pending: int = 256, retention: int = 1000) -> None:
+        self.max_pending = max_pending
+        self.retention = retention
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._queues: Dict[str, asyncio.Queue] = {}
+        self._workers: List[asyncio.Task] = []
+        self._pending = 0
+
+    # -- lifecycle --
+
+    async def stop(self) -> None:
+        for job in list(self._jobs.values()):
+            if job.task is not None and not job.task.done():
+                job.task.cancel()
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._queues = {}
+
+    def _queue(self, provider: str) -> asyncio.Queue:
+        queue = self._queues.get(provider)
+        if queue is None:
+            queue = self._queues[provider] = asyncio.Queue()
+            for _ in range(provider_workers(provider)):
+                # Not the submitting request's context: its deadline would outlive it in every later job
+                self._workers.append(asyncio.create_task(self._worker(queue), context=contextvars.Context()))
+        return queue
+
+    # -- jobs --
+
+    async def submit(self, kind: str, provider: str, runner: Runner) -> Job:
+        if self._pending >= self.max_pending:
+            raise JobQueueFull(f"{self._pending} jobs pending (limit {self.max_pending})")
+        job = Job(id=str(uuid.uuid4()), kind=kind, provider=provider, runner=runner)
+        self._jobs[job.id] = job
+        self._pending += 1
+        self._trim()
+        await job.publish(QUEUED)
+        self._queue(provider).put_nowait(job)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    async def cancel(self, job_id: str) -> Optional[Job]:
+        job = self._jobs.get(job_id)
+        if job is None or job.done:
+            return job
+        job.cancel_requested = True
+        if job.task is not None:
+            # The worker records the cancellation once the task unwinds
+            job.task.cancel()
+            async with job.changed:
+                await job.changed.wait_for(lambda: job.done)
+        else:
+            await self._finish(job, CANCELLED, message="cancelled before start")
+        return job
+
+    def stats(self) -> Dict[str, Any]:
+        states: Dict[str, int] = {}
+        for job in self._jobs.values():
+            states[job.state] = states.get(job.state, 0) + 1
+        return {
+            "pending": self._pending,
+            "max_pending": self.max_pending,
+            "states": states,
+            "workers": {p: provider_workers(p) for p in self._queues},
+        }
+
+    async def _finish(self, job: Job, state: str, message: Optional[str] = None) -> None:
+        job.finished_at = time.time()
+        self._pending -= 1
+        await job.publish(state, 1.0 if state == SUCCEEDED else job.progress, message)
+
+    def _trim(self) -> None:
+        # Forget the oldest finished jobs beyond the retention limit
+        excess = len(self._jobs) - self.retention
+        if excess <= 0:
+            return
+        for job_id in [j.id for j in self._jobs.values() if j.done][:excess]:
+            del self._jobs[job_id]
+
+    async def _worker(self, queue: asyncio.Queue) -> None:
+        while True:
+            job: Job = await queue.get()
+            try:
+                if job.done:  # cancelled while queued
+                    continue
+                await self._run(job)
+            finally:
+                queue.task_done()
+
+    async def _run(self, job: Job) -> None:
+        job.started_at = time.time()
+        # Jobs outlive the request that queued them; they run without its deadline
+        deadline.set_deadline(None)
+        # Create the task before publishing, so a cancel during publish finds it
+        job.task = asyncio.create_task(job.runner(job))
+        await job.publish(RUNNING, 0.0)
+        try:
+            envelope = await job.task
+        except asyncio.CancelledError:
+            if not job.cancel_requested:
+                raise  # the worker itself is shutting down
+            await self._finish(job, CANCELLED, message="cancelled while running")
+            return
+        except Exception as e:
+            job.error = {"code": "JOB_FAILED", "message": str(e)}
+            await self._finish(job, FAILED, message=str(e))
+            return
+        if envelope.get("status") == "ok":
+            job.result = envelope.get("data")
+            await self._finish(job, SUCCEEDED)
+        else:
+            job.error = envelope.get("error")
+            await self._finish(job, FAILED, message=(job.error or {}).get("message"))
+
+
+_manager: Optional[JobManager] = None
+
+
+def get_manager() -> JobManager:
+    """The job manager bound to the running event loop (created lazily)."""
+    global _manager
+    loop = asyncio.get_running_loop()
+    if _manager is None or _manager.loop is not loop:
+        _manager = JobManager(int(os.environ.get("MEDIA_JOB_QUEUE_SIZE", "256")),
+                              int(os.environ.get("MEDIA_JOB_RETENTION", "1000")))
+        _manager.loop = loop
+    return _manager
+
+
+async def shutdown() -> None:
+    global _manager
+    if _manager is not None:
+        await _manager.stop()
+        _manager = None
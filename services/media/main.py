@@ -1,23 +1,41 @@
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, Field, field_validator
 from typing import Optional, List, Dict, Any
 from services.common.envelope import envelope_ok, envelope_error
+from services.common import deadline
+from services.common.artifacts import artifact_response, get_artifact_store
+from services.media import anchors, blobs, cache, catalog, jobs, providers, routing, ssml
+from contextlib import asynccontextmanager
 import os
+import asyncio
 import json
 import logging
 import hashlib
-from datetime import datetime
 import uuid
-import httpx
 import base64
 import pathlib
 import subprocess
 
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="StoryMaker Media", version="1.6.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One pooled client per provider for the life of the app
+    await providers.POOL.open()
+    jobs.get_manager()
+    try:
+        yield
+    finally:
+        await jobs.shutdown()
+        await providers.POOL.aclose()
+
+app = FastAPI(title="StoryMaker Media", version="1.6.0", lifespan=lifespan)
+
+# Honour X-Deadline-Ms from orchestration (added first so CORS stays outermost)
+app.add_middleware(deadline.DeadlineMiddleware)
 
 # Add CORS middleware
 app.add_middleware(
@@ -34,6 +52,12 @@ SUPPORTED_VOICES = ["male", "female", "neutral", "child", "elderly"]
 # Supported image providers
 SUPPORTED_PROVIDERS = ["gemini", "dalle", "midjourney", "stable_diffusion", "lm_studio"]
 
+# VisualReq.provider value that lets the router pick the provider
+AUTO_PROVIDER = "auto"
+
+# Upper bound for VisualReq.n
+MAX_VARIANTS = 8
+
 # API endpoints and configurations
 API_ENDPOINTS = {
     "gemini": "https://generativelanguage.googleapis.com/v1beta/models/gemini-pro-vision:generateContent",
@@ -42,11 +66,24 @@ API_ENDPOINTS = {
     "stable_diffusion": "https://api.stability.ai/v1/generation/stable-diffusion-xl-1024-v1-0/text-to-image"
 }
 
+REPO_ROOT = pathlib.Path(__file__).parent.parent.parent
+
+def _lm_api_path() -> str:
+    # Overridable so the service can point at another LM Studio bridge (or a local stand-in)
+    return os.environ.get("MEDIA_LM_API", str(REPO_ROOT / "scripts" / "lm_api.py"))
+
+async def _run_lm_api(args: List[str], where: str = "LM Studio") -> subprocess.CompletedProcess:
+    """Run the LM Studio bridge in a worker thread (bounded by the request deadline) so calls can overlap"""
+    cmd = ["python3", _lm_api_path(), *args]
+    deadline.check(where)
+    return await asyncio.to_thread(subprocess.run, cmd, capture_output=True, text=True, cwd=REPO_ROOT,
+                                   timeout=deadline.remaining())
+
 # Image generation functions
 async def generate_with_gemini(prompt: str, api_key: str, style: str = "realistic", size: str = "1024x1024") -> Dict[str, Any]:
     """Generate image using Google Gemini API"""
     try:
-        url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-1.5-flash:generateContent?key={api_key}"
+        url = "/v1beta/models/gemini-1.5-flash:generateContent"
 
         # Enhanced prompt with style guidance
         enhanced_prompt = f"Create a {style} image: {prompt}. High quality, detailed, professional."
@@ -66,14 +103,15 @@ async def generate_with_gemini(prompt: str, api_key: str, style: str = "realisti
             }
         }
 
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.post(url, json=payload)
-            response.raise_for_status()
+        client = providers.POOL.client("gemini")
+        response = await client.post(url, params={"key": api_key}, json=payload,
+                                     timeout=deadline.clamp_timeout(30.0, "gemini"))
+        response.raise_for_status()
 
-            result = response.json()
-            # Note: Gemini text model doesn't generate images directly
-            # This would need to be integrated with Gemini Vision or use a different approach
-            return {"error": "Gemini text model cannot generate images directly"}
+        result = response.json()
+        # Note: Gemini text model doesn't generate images directly
+        # This would need to be integrated with Gemini Vision or use a different approach
+        return {"error": "Gemini text model cannot generate images directly"}
 
     except Exception as e:
         logger.error(f"Gemini API error: {e}")
@@ -82,7 +120,7 @@ async def generate_with_gemini(prompt: str, api_key: str, style: str = "realisti
 async def generate_with_dalle(prompt: str, api_key: str, style: str = "realistic", size: str = "1024x1024") -> Dict[str, Any]:
     """Generate image using OpenAI DALL-E API"""
     try:
-        url = "https://api.openai.com/v1/images/generations"
+        url = "/v1/images/generations"
 
         # Enhanced prompt with style guidance
         enhanced_prompt = f"Create a {style} image: {prompt}. High quality, detailed, professional."
@@ -100,15 +138,16 @@ async def generate_with_dalle(prompt: str, api_key: str, style: str = "realistic
             "Content-Type": "application/json"
         }
 
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            response = await client.post(url, json=payload, headers=headers)
-            response.raise_for_status()
+        client = providers.POOL.client("dalle")
+        response = await client.post(url, json=payload, headers=headers,
+                                     timeout=deadline.clamp_timeout(60.0, "dalle"))
+        response.raise_for_status()
 
-            result = response.json()
-            return {
-                "url": result["data"][0]["url"],
-                "revised_prompt": result["data"][0].get("revised_prompt", enhanced_prompt)
-            }
+        result = response.json()
+        return {
+            "url": result["data"][0]["url"],
+            "revised_prompt": result["data"][0].get("revised_prompt", enhanced_prompt)
+        }
 
     except Exception as e:
         logger.error(f"DALL-E API error: {e}")
@@ -132,12 +171,11 @@ Please provide a comprehensive, professional image generation prompt that includ
 - Art style characteristics
 - Technical details (resolution, aspect ratio, etc.)"""
 
-        lm_api = pathlib.Path(__file__).parent.parent.parent / "scripts" / "lm_api.py"
-        cmd = ["python3", str(lm_api), "chat", "--prompt", enhanced_prompt, "--system", system_msg, "--max-tokens", "300", "--temperature", "0.7"]
+        args = ["chat", "--prompt", enhanced_prompt, "--system", system_msg, "--max-tokens", "300", "--temperature", "0.7"]
         if model:
-            cmd.extend(["--model", model])
+            args.extend(["--model", model])
 
-        result = subprocess.run(cmd, capture_output=True, text=True, cwd=pathlib.Path(__file__).parent.parent.parent)
+        result = await _run_lm_api(args)
 
         if result.returncode == 0:
             try:
@@ -160,6 +198,17 @@ Please provide a comprehensive, professional image generation prompt that includ
         logger.error(f"LM Studio image description error: {e}")
         return {"error": str(e)}
 
+# API key variables per routable provider (unconfigured providers are never picked by auto)
+PROVIDER_KEYS = {
+    "dalle": ("OPENAI_API_KEY", "DALLE_API_KEY"),
+    "gemini": ("GOOGLE_API_KEY", "GEMINI_API_KEY"),
+}
+
+def auto_providers() -> List[str]:
+    """Configured providers that provider=auto may route between (MEDIA_AUTO_PROVIDERS)"""
+    names = [p.strip() for p in os.environ.get("MEDIA_AUTO_PROVIDERS", "dalle,gemini").split(",") if p.strip()]
+    return [p for p in names if p not in PROVIDER_KEYS or any(os.environ.get(k) for k in PROVIDER_KEYS[p])]
+
 async def generate_image(prompt: str, provider: str, style: str = "realistic", size: str = "1024x1024", anchors: List[str] = None) -> Dict[str, Any]:
     """Main image generation function that routes to appropriate provider"""
     try:
@@ -196,6 +245,7 @@ class AudioReq(BaseModel):
     speed: Optional[float] = Field(1.0, ge=0.5, le=2.0, description="Speech speed multiplier")
     pitch: Optional[float] = Field(1.0, ge=0.5, le=2.0, description="Voice pitch multiplier")
     volume: Optional[float] = Field(1.0, ge=0.1, le=2.0, description="Volume level")
+    force_regenerate: bool = Field(False, description="Skip the generation cache and call the provider")
     
     @field_validator('voice')
     @classmethod
@@ -209,14 +259,17 @@ class VisualReq(BaseModel):
     anchors: Optional[List[str]] = Field(None, description="Canon entity references")
     style: Optional[str] = Field("realistic", description="Art style")
     size: Optional[str] = Field("1024x1024", description="Image dimensions")
-    provider: Optional[str] = Field("gemini", description="Image generation provider")
+    provider: Optional[str] = Field("gemini", description="Image generation provider, or 'auto' to route by latency")
+    hedge: bool = Field(False, description="Race a backup provider if the first one is slower than its p95")
     watermark_type: Optional[str] = Field("synthid", description="Watermark type")
+    n: int = Field(1, ge=1, le=MAX_VARIANTS, description="Number of variants to generate")
+    force_regenerate: bool = Field(False, description="Skip the generation cache and call the provider")
     
     @field_validator('provider')
     @classmethod
     def validate_provider(cls, v):
-        if v not in SUPPORTED_PROVIDERS:
-            raise ValueError(f"Invalid provider. Must be one of: {', '.join(SUPPORTED_PROVIDERS)}")
+        if v not in SUPPORTED_PROVIDERS and v != AUTO_PROVIDER:
+            raise ValueError(f"Invalid provider. Must be one of: {', '.join(SUPPORTED_PROVIDERS + [AUTO_PROVIDER])}")
         return v
 
 class MediaAsset(BaseModel):
@@ -246,10 +299,7 @@ Text to convert: {text}
 
 Please generate a detailed audio description and phonetic transcription that could be used for text-to-speech synthesis."""
 
-        lm_api = pathlib.Path(__file__).parent.parent.parent / "scripts" / "lm_api.py"
-        cmd = ["python3", str(lm_api), "chat", "--prompt", tts_prompt, "--system", "You are an expert text-to-speech synthesizer. Generate detailed audio descriptions and phonetic transcriptions."]
-
-        result = subprocess.run(cmd, capture_output=True, text=True, cwd=pathlib.Path(__file__).parent.parent.parent)
+        result = await _run_lm_api(["chat", "--prompt", tts_prompt, "--system", "You are an expert text-to-speech synthesizer. Generate detailed audio descriptions and phonetic transcriptions."])
 
         if result.returncode == 0:
             try:
@@ -285,31 +335,138 @@ Please generate a detailed audio description and phonetic transcription that cou
         logger.error(f"LM Studio TTS error: {e}")
         return {"error": str(e)}
 
+def _cache_meta(gen_cache, hit: bool) -> Dict[str, Any]:
+    if gen_cache is None:
+        return {"hit": False, "backend": "off"}
+    return {"hit": hit, **gen_cache.stats()}
+
+def _audio_cache_key(req: AudioReq) -> str:
+    return cache.cache_key("audio", "lm_studio", cache.normalize_ssml(req.ssml),
+                           voice=req.voice, speed=req.speed, pitch=req.pitch, volume=req.volume)
+
+def _visual_cache_key(req: VisualReq, resolution: Optional["anchors.Resolution"] = None) -> str:
+    params = dict(style=req.style, size=req.size, n=req.n, anchors=sorted(req.anchors or []),
+                  watermark_type=req.watermark_type)
+    if resolution is not None and resolution.anchors:
+        # A canon edit bumps canon_version, so it regenerates instead of serving the old picture
+        params["canon"] = sorted(resolution.versions())
+    return cache.cache_key("image", req.provider, cache.normalize_prompt(req.prompt), **params)
+
+# Sentence chunks synthesized at once per request (results are still yielded in order)
+TTS_CHUNK_CONCURRENCY = int(os.environ.get("MEDIA_TTS_CHUNK_CONCURRENCY", "4"))
+
+# Upper bound for streamed synthesis (audiobook-length input)
+MAX_STREAM_SSML = 2_000_000
+
+def _chunk_cache_key(chunk: "ssml.Chunk", req: AudioReq) -> str:
+    return cache.cache_key("audio-chunk", "lm_studio", chunk.text,
+                           voice=req.voice, speed=req.speed, pitch=req.pitch, volume=req.volume)
+
+async def _synthesize_chunk(chunk: "ssml.Chunk", req: AudioReq, gen_cache, stats: Dict[str, int]) -> Dict[str, Any]:
+    key = _chunk_cache_key(chunk, req)
+    if gen_cache is not None and not req.force_regenerate:
+        cached = await gen_cache.aget(key)
+        if cached is not None:
+            stats["hits"] += 1
+            return {**cached, "cached": True}
+    stats["misses"] += 1
+    result = await synthesize_with_lm_studio(chunk.text, req.voice, req.speed, req.pitch, req.volume)
+    if gen_cache is not None and "error" not in result:
+        await gen_cache.aput(key, result)
+    return {**result, "cached": False}
+
+async def _synthesize_chunks(parsed: List["ssml.Chunk"], req: AudioReq, gen_cache, stats: Dict[str, int]):
+    """Yield ``(chunk, result)`` in order with at most TTS_CHUNK_CONCURRENCY chunks in flight"""
+    remaining = iter(parsed)
+    window = []
+
+    def refill() -> None:
+        while len(window) < TTS_CHUNK_CONCURRENCY:
+            chunk = next(remaining, None)
+            if chunk is None:
+                return
+            window.append((chunk, asyncio.ensure_future(_synthesize_chunk(chunk, req, gen_cache, stats))))
+
+    refill()
+    try:
+        while window:
+            chunk, task = window.pop(0)
+            result = await task
+            refill()
+            yield chunk, result
+    finally:
+        # Consumer stopped early (error or client disconnect): drop in-flight chunks
+        for _, task in window:
+            task.cancel()
+        await asyncio.gather(*(task for _, task in window), return_exceptions=True)
+
+def _segment(chunk: "ssml.Chunk", result: Dict[str, Any], previous: List[Dict[str, Any]]) -> Dict[str, Any]:
+    start = previous[-1]["end_sec"] + previous[-1]["break_after_ms"] / 1000 if previous else 0.0
+    duration = result["estimated_duration"]
+    return {
+        "index": chunk.index,
+        "paragraph": chunk.paragraph,
+        "text": chunk.text,
+        "start_sec": round(start, 3),
+        "duration_sec": duration,
+        "end_sec": round(start + duration, 3),
+        "break_after_ms": chunk.break_after_ms,
+        "cached": result["cached"],
+        "description": result["description"],
+        "phonetic_transcription": result.get("phonetic_transcription", ""),
+    }
+
+def _stitch(segments: List[Dict[str, Any]], req: AudioReq) -> Dict[str, Any]:
+    """Ordered segments as one synthesis result (the shape a single LM Studio call returns)"""
+    return {
+        "description": "\n\n".join(seg["description"] for seg in segments),
+        "estimated_duration": segments[-1]["end_sec"] if segments else 0.0,
+        "phonetic_transcription": " ".join(seg["phonetic_transcription"] for seg in segments),
+        "voice_settings": {"voice": req.voice, "speed": req.speed, "pitch": req.pitch, "volume": req.volume},
+        "segments": segments,
+    }
+
+async def _report(job: Optional["jobs.Job"], done: int, total: int, message: str) -> None:
+    """Job progress after one unit of work; the last step (storing, recording) is left for completion"""
+    if job is not None:
+        await job.publish(progress=round(done / (total + 1), 4), message=message)
+
 @app.post("/audio/synth")
 async def audio_synth(req: AudioReq):
     """Synthesize audio from SSML text using LM Studio"""
+    return await _audio_synth(req)
+
+async def _audio_synth(req: AudioReq, job: Optional["jobs.Job"] = None):
     try:
+        # Identical requests return the cached asset without a provider call
+        gen_cache = cache.get_cache()
+        key = _audio_cache_key(req)
+        if gen_cache is not None and not req.force_regenerate:
+            cached = await gen_cache.aget(key)
+            if cached is not None:
+                return envelope_ok(cached, {"actor": "ai", "provider": "lm_studio",
+                                            "cache": _cache_meta(gen_cache, True)})
+
         # Generate unique asset ID
         asset_id = str(uuid.uuid4())
 
         # Create SSML hash for caching
         ssml_hash = hashlib.md5(req.ssml.encode()).hexdigest()[:8]
 
-        # Extract plain text from SSML (simplified)
-        plain_text = req.ssml.replace('<speak>', '').replace('</speak>', '').replace('<voice>', '').replace('</voice>', '')
-
-        # Call LM Studio for TTS processing
-        tts_result = await synthesize_with_lm_studio(
-            plain_text,
-            req.voice,
-            req.speed,
-            req.pitch,
-            req.volume
-        )
-
-        if "error" in tts_result:
-            return envelope_error("AUDIO_SYNTH_FAILED", f"Audio synthesis failed: {tts_result['error']}",
-                                {"detail": tts_result["error"]}, {"actor": "ai"})
+        # Sentence chunks; unchanged sentences come from the chunk cache
+        parsed = ssml.chunks(req.ssml)
+        if not parsed:
+            return envelope_error("AUDIO_SYNTH_FAILED", "Audio synthesis failed: no speakable text",
+                                {"detail": "no speakable text"}, {"actor": "ai"})
+        chunk_stats = {"hits": 0, "misses": 0}
+        segments = []
+        async for chunk, result in _synthesize_chunks(parsed, req, gen_cache, chunk_stats):
+            if "error" in result:
+                return envelope_error("AUDIO_SYNTH_FAILED", f"Audio synthesis failed: {result['error']}",
+                                    {"detail": result["error"], "chunk": chunk.index}, {"actor": "ai"})
+            segments.append(_segment(chunk, result, segments))
+            await _report(job, len(segments), len(parsed), f"chunk {len(segments)}/{len(parsed)} synthesized")
+        tts_result = _stitch(segments, req)
 
         # Generate comprehensive audio metadata
         audio_metadata = {
@@ -318,7 +475,7 @@ async def audio_synth(req: AudioReq):
             "speed": req.speed,
             "pitch": req.pitch,
             "volume": req.volume,
-            "word_count": len(plain_text.split()),
+            "word_count": ssml.word_count(req.ssml, parsed),
             "estimated_duration": tts_result["estimated_duration"],
             "format": "mp3",
             "sample_rate": 44100,
@@ -326,13 +483,14 @@ async def audio_synth(req: AudioReq):
             "tts_description": tts_result["description"],
             "phonetic_transcription": tts_result.get("phonetic_transcription", ""),
             "voice_settings": tts_result["voice_settings"],
+            "chunks": len(segments),
             "provider": "lm_studio_tts"
         }
 
         # Create asset URI
         asset_uri = f"asset://audio/{asset_id}/synthesis.mp3"
 
-        return envelope_ok({
+        data = {
             "audio": {
                 "id": asset_id,
                 "uri": asset_uri,
@@ -340,129 +498,384 @@ async def audio_synth(req: AudioReq):
                 "metadata": audio_metadata,
                 "tts_processing": tts_result
             }
-        }, {"actor": "ai", "provider": "lm_studio"})
+        }
+        if gen_cache is not None:
+            await gen_cache.aput(key, data)
+        await _record_assets("audio", "lm_studio", [data["audio"]], ssml_hash)
+        return envelope_ok(data, {"actor": "ai", "provider": "lm_studio", "cache": _cache_meta(gen_cache, False),
+                                  "chunk_cache": chunk_stats})
 
     except Exception as e:
         logger.error(f"Failed to synthesize audio: {e}")
         return envelope_error("AUDIO_SYNTH_FAILED", "Failed to synthesize audio",
                             {"detail": str(e)}, {"actor": "ai"})
 
+class AudioStreamReq(AudioReq):
+    ssml: str = Field(..., min_length=1, max_length=MAX_STREAM_SSML, description="SSML text to synthesize")
+
+@app.post("/audio/synth/stream")
+async def audio_synth_stream(req: AudioStreamReq):
+    """Synthesize long SSML sentence by sentence, streaming NDJSON segments in order"""
+    parsed = ssml.chunks(req.ssml)
+    gen_cache = cache.get_cache()
+    stats = {"hits": 0, "misses": 0}
+
+    async def stream():
+        segments: List[Dict[str, Any]] = []
+        try:
+            async for chunk, result in _synthesize_chunks(parsed, req, gen_cache, stats):
+                if "error" in result:
+                    yield _ndjson(envelope_error("AUDIO_SYNTH_FAILED", f"Audio synthesis failed: {result['error']}",
+                                                 {"detail": result["error"], "chunk": chunk.index}, {"actor": "ai"}))
+                    return
+                segment = _segment(chunk, result, segments)
+                # Only timing is needed to place later segments; don't keep every description in memory
+                segments[:] = [{k: segment[k] for k in ("end_sec", "break_after_ms")}]
+                yield _ndjson({"type": "segment", "segment": segment})
+        except Exception as e:
+            logger.error(f"Failed to stream audio synthesis: {e}")
+            yield _ndjson(envelope_error("AUDIO_SYNTH_FAILED", "Failed to synthesize audio",
+                                         {"detail": str(e)}, {"actor": "ai"}))
+            return
+        yield _ndjson({"type": "done", "chunks": len(parsed),
+                       "duration_sec": segments[-1]["end_sec"] if segments else 0.0,
+                       "word_count": ssml.word_count(req.ssml, parsed), "chunk_cache": stats})
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+def _ndjson(obj: Dict[str, Any]) -> bytes:
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8") + b"\n"
+
+async def _call_provider(req: VisualReq, provider: str) -> Dict[str, Any]:
+    """One provider call, holding the provider's in-flight slot (pooled providers only)"""
+    kwargs = dict(prompt=req.prompt, provider=provider, style=req.style, size=req.size, anchors=req.anchors)
+    if provider not in providers.DEFAULT_BASE_URLS:
+        return await generate_image(**kwargs)
+    async with providers.POOL.semaphore(provider):
+        return await generate_image(**kwargs)
+
+async def _generate_variant(req: VisualReq) -> "routing.Outcome":
+    """One variant; auto and hedged requests go through the router, fixed ones just feed its stats"""
+    async def call(provider: str) -> Dict[str, Any]:
+        return await _call_provider(req, provider)
+
+    if req.provider == AUTO_PROVIDER:
+        candidates = auto_providers()
+        if not candidates:
+            return routing.Outcome(AUTO_PROVIDER, {"error": "No image provider configured for auto routing"})
+        return await routing.ROUTER.run(candidates, call, hedge=req.hedge)
+    if req.hedge:
+        return await routing.ROUTER.run(auto_providers(), call, hedge=True, primary=req.provider)
+    result = await routing.ROUTER.observe(req.provider, call)
+    return routing.Outcome(req.provider, result, [req.provider])
+
+def _image_asset(req: VisualReq, generation_result: Dict[str, Any], prompt_hash: str, variant: int,
+                 provider: str) -> Dict[str, Any]:
+    # Generate unique asset ID
+    asset_id = str(uuid.uuid4())
+
+    # Generate watermark metadata
+    watermark_metadata = {
+        "type": req.watermark_type,
+        "present": True,
+        "method": "synthid",
+        "strength": 0.8,
+        "position": "bottom_right",
+        "opacity": 0.7
+    }
+
+    # Create asset URI
+    if provider in ["dalle", "gemini"] and "url" in generation_result:
+        asset_uri = generation_result["url"]
+    else:
+        asset_uri = f"asset://images/{asset_id}/generated.png"
+
+    # Generate comprehensive image metadata
+    image_metadata = {
+        "prompt_hash": prompt_hash,
+        "provider": provider,
+        "style": req.style,
+        "size": req.size,
+        "anchors": req.anchors or [],
+        "watermark": watermark_metadata,
+        "format": "png",
+        "quality": "high",
+        "variant": variant,
+        "generation_details": generation_result
+    }
+
+    # Add any additional metadata from generation
+    if "revised_prompt" in generation_result:
+        image_metadata["revised_prompt"] = generation_result["revised_prompt"]
+    if "description" in generation_result:
+        image_metadata["ai_description"] = generation_result["description"]
+
+    return {
+        "id": asset_id,
+        "uri": asset_uri,
+        "provider": provider,
+        "watermark": watermark_metadata,
+        "metadata": image_metadata
+    }
+
+async def _store_blob(image: Dict[str, Any]) -> bool:
+    """Copy the provider's file into the blob store and point the asset at it (best effort)"""
+    url = blobs.source_url(image["metadata"]["generation_details"])
+    if url is None or not blobs.fetch_enabled():
+        return False
+    try:
+        info = await blobs.store_url(url, providers.POOL.fetch_client())
+    except Exception as e:
+        logger.error(f"Failed to store generated image from {url}: {e}")
+        return False
+    blob = blobs.blob_view(info)
+    image.update(uri=blob["uri"], size_bytes=blob["size_bytes"], blob=blob)
+    image["metadata"]["source_url"] = url
+    return True
+
+async def _resolve_anchors(req: VisualReq) -> Optional["anchors.Resolution"]:
+    """Canon for req.anchors in one batched lookup (None when there is nothing to resolve)"""
+    if not req.anchors:
+        return None
+    try:
+        resolver = anchors.get_resolver()
+        if resolver is None:
+            return None
+        return await resolver.resolve(req.anchors)
+    except Exception as e:
+        # Generate from the bare prompt rather than fail the request
+        logger.error(f"Failed to resolve anchors {req.anchors}: {e}")
+        return anchors.Resolution(error=str(e))
+
 @app.post("/visual/generate")
 async def visual_generate(req: VisualReq):
     """Generate visual content with watermarking using real AI providers"""
+    return await _visual_generate(req)
+
+async def _visual_generate(req: VisualReq, job: Optional["jobs.Job"] = None):
     try:
-        # Generate unique asset ID
-        asset_id = str(uuid.uuid4())
+        # Canon anchors become one compact reference appended to the prompt
+        resolution = await _resolve_anchors(req)
+        anchor_meta = {"anchors": resolution.meta(anchors.source_name())} if resolution is not None else {}
+        gen_req = req
+        if resolution is not None and resolution.anchors:
+            gen_req = req.model_copy(update={"prompt": anchors.compose_prompt(req.prompt, resolution.anchors)})
+
+        # Identical requests return the cached assets without a provider call
+        gen_cache = cache.get_cache()
+        key = _visual_cache_key(req, resolution)
+        if gen_cache is not None and not req.force_regenerate:
+            cached = await gen_cache.aget(key)
+            if cached is not None:
+                return envelope_ok(cached, {"actor": "ai", "provider": req.provider,
+                                            "cache": _cache_meta(gen_cache, True), **anchor_meta})
 
         # Create prompt hash for caching
         prompt_hash = hashlib.md5(req.prompt.encode()).hexdigest()[:8]
 
-        # Call real image generation
-        generation_result = await generate_image(
-            prompt=req.prompt,
-            provider=req.provider,
-            style=req.style,
-            size=req.size,
-            anchors=req.anchors
-        )
-
-        if "error" in generation_result:
-            return envelope_error("VISUAL_GEN_FAILED", f"Image generation failed: {generation_result['error']}",
-                                {"detail": generation_result["error"]}, {"actor": "ai"})
-
-        # Generate watermark metadata
-        watermark_metadata = {
-            "type": req.watermark_type,
-            "present": True,
-            "method": "synthid",
-            "strength": 0.8,
-            "position": "bottom_right",
-            "opacity": 0.7
-        }
-
-        # Create asset URI
-        if req.provider in ["dalle", "gemini"] and "url" in generation_result:
-            asset_uri = generation_result["url"]
-        else:
-            asset_uri = f"asset://images/{asset_id}/generated.png"
-
-        # Generate comprehensive image metadata
-        image_metadata = {
-            "prompt_hash": prompt_hash,
-            "provider": req.provider,
-            "style": req.style,
-            "size": req.size,
-            "anchors": req.anchors or [],
-            "watermark": watermark_metadata,
-            "format": "png",
-            "quality": "high",
-            "generation_details": generation_result
-        }
-
-        # Add any additional metadata from generation
-        if "revised_prompt" in generation_result:
-            image_metadata["revised_prompt"] = generation_result["revised_prompt"]
-        if "description" in generation_result:
-            image_metadata["ai_description"] = generation_result["description"]
-
-        return envelope_ok({
-            "image": {
-                "id": asset_id,
-                "uri": asset_uri,
-                "provider": req.provider,
-                "watermark": watermark_metadata,
-                "metadata": image_metadata
-            }
-        }, {"actor": "ai", "provider": req.provider})
+        # Variants are independent provider calls, issued concurrently
+        finished = 0
+
+        async def variant() -> "routing.Outcome":
+            nonlocal finished
+            outcome = await _generate_variant(gen_req)
+            finished += 1
+            await _report(job, finished, req.n, f"variant {finished}/{req.n} generated")
+            return outcome
+
+        outcomes = await asyncio.gather(*(variant() for _ in range(req.n)))
+        images = [_image_asset(req, o.result, prompt_hash, i, o.provider)
+                  for i, o in enumerate(outcomes) if "error" not in o.result]
+        errors = [o.result["error"] for o in outcomes if "error" in o.result]
+        if resolution is not None and resolution.anchors:
+            canon = {"anchors": [{k: a[k] for k in ("id", "name", "canon_version")} for a in resolution.anchors],
+                     "prompt": gen_req.prompt}
+            for image in images:
+                image["metadata"]["canon"] = canon
+
+        if not images:
+            return envelope_error("VISUAL_GEN_FAILED", f"Image generation failed: {errors[0]}",
+                                {"detail": errors[0]}, {"actor": "ai"})
+
+        # Provider URLs expire; keep the bytes
+        stored = await asyncio.gather(*(_store_blob(image) for image in images))
+
+        data = {"image": images[0], "variants": images}
+        # Partial variant sets are not cached, so a retry can fill them in
+        if gen_cache is not None and not errors:
+            await gen_cache.aput(key, data)
+        await _record_assets("image", req.provider, images, prompt_hash, req.anchors)
+        meta = {"actor": "ai", "provider": images[0]["provider"], "cache": _cache_meta(gen_cache, False),
+                "blobs": {"stored": sum(stored)}, **anchor_meta}
+        if req.provider == AUTO_PROVIDER or req.hedge:
+            meta["routing"] = {"mode": req.provider, "hedge": req.hedge, "variants": [o.view() for o in outcomes]}
+        if req.n > 1:
+            meta["variants"] = {"requested": req.n, "generated": len(images), "errors": errors}
+        return envelope_ok(data, meta)
 
     except Exception as e:
         logger.error(f"Failed to generate visual: {e}")
         return envelope_error("VISUAL_GEN_FAILED", "Failed to generate visual content",
                             {"detail": str(e)}, {"actor": "ai"})
 
+def _job_response(job: "jobs.Job", status_code: int = 200) -> JSONResponse:
+    return JSONResponse(status_code=status_code, content=envelope_ok({
+        "job": job.view(),
+        "links": {"self": f"/media/jobs/{job.id}", "events": f"/media/jobs/{job.id}/events"},
+    }, {"actor": "api"}))
+
+def _job_not_found(job_id: str) -> JSONResponse:
+    return JSONResponse(status_code=404, content=envelope_error(
+        "JOB_NOT_FOUND", f"No media job {job_id}", {"job_id": job_id}, {"actor": "api"}))
+
+async def _submit_job(kind: str, provider: str, runner) -> JSONResponse:
+    try:
+        job = await jobs.get_manager().submit(kind, provider, runner)
+    except jobs.JobQueueFull as e:
+        return JSONResponse(status_code=503, content=envelope_error(
+            "JOB_QUEUE_FULL", "Too many media jobs pending, retry shortly", {"detail": str(e)}, {"actor": "api"}))
+    return _job_response(job, status_code=202)
+
+@app.post("/media/jobs/visual")
+async def submit_visual_job(req: VisualReq):
+    """Queue an image generation and return its job id immediately"""
+    return await _submit_job("visual", req.provider, lambda job: _visual_generate(req, job))
+
+@app.post("/media/jobs/audio")
+async def submit_audio_job(req: AudioReq):
+    """Queue an audio synthesis and return its job id immediately"""
+    return await _submit_job("audio", "lm_studio", lambda job: _audio_synth(req, job))
+
+@app.get("/media/jobs")
+async def job_stats():
+    """Queue depth, job states and per-provider worker counts"""
+    return envelope_ok(jobs.get_manager().stats(), {"actor": "api"})
+
+@app.get("/media/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Poll a media job"""
+    job = jobs.get_manager().get(job_id)
+    return _job_response(job) if job else _job_not_found(job_id)
+
+@app.delete("/media/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    """Cancel a queued or running media job"""
+    job = await jobs.get_manager().cancel(job_id)
+    return _job_response(job) if job else _job_not_found(job_id)
+
+@app.get("/media/jobs/{job_id}/events")
+async def job_events(job_id: str, request: Request):
+    """Server-sent progress events; resumes after Last-Event-ID, ends with the final job state"""
+    job = jobs.get_manager().get(job_id)
+    if job is None:
+        return _job_not_found(job_id)
+    last_id = request.headers.get("last-event-id", "")
+    start = int(last_id) + 1 if last_id.isdigit() else 0
+
+    async def stream():
+        seq = start
+        while True:
+            batch = await job.wait_events(seq) if not (job.done and seq >= len(job.events)) else []
+            for event in batch:
+                yield f"id: {event['seq']}\nevent: {event['state']}\ndata: {json.dumps(event)}\n\n"
+            seq += len(batch)
+            if job.done and seq >= len(job.events):
+                yield f"event: result\ndata: {json.dumps(job.view())}\n\n"
+                return
+
+    return StreamingResponse(stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+class BulkAssetsReq(BaseModel):
+    ids: List[str] = Field(..., min_length=1, max_length=catalog.MAX_BULK, description="Asset ids to fetch")
+
+async def _record_assets(kind: str, provider: str, assets: List[Dict[str, Any]], prompt_hash: str,
+                         anchors: Optional[List[str]] = None) -> None:
+    """Add freshly generated assets to the catalog (best effort; generation already succeeded)"""
+    rows = [{
+        "id": asset["id"],
+        "type": kind,
+        "provider": asset.get("provider") or provider,
+        "uri": asset["uri"],
+        "size_bytes": asset.get("size_bytes", 0),
+        "prompt_hash": prompt_hash,
+        "anchors": anchors or [],
+        "metadata": asset["metadata"],
+    } for asset in assets]
+    try:
+        await asyncio.to_thread(catalog.get_catalog().add_many, rows)
+    except Exception as e:
+        logger.error(f"Failed to record {kind} assets in catalog: {e}")
+
 @app.get("/media/assets")
-def get_assets(limit: int = 100, asset_type: Optional[str] = None):
-    """Get media assets with optional filtering"""
+async def get_assets(limit: int = 100, asset_type: Optional[str] = None, provider: Optional[str] = None,
+                     anchor: Optional[str] = None, prompt_hash: Optional[str] = None, cursor: Optional[str] = None):
+    """Page through the asset catalog, newest first; pass next_cursor back to continue"""
     try:
-        if limit > 1000:
-            limit = 1000  # Cap to prevent abuse
-        
-        # In real implementation, this would query the database for assets
-        # For now, return mock data
-        mock_assets = [
-            {
-                "id": "asset_001",
-                "type": "audio",
-                "uri": "asset://audio/asset_001/synthesis.mp3",
-                "size_bytes": 1024000,
-                "created_at": datetime.now().isoformat(),
-                "metadata": {"voice": "neutral", "duration_sec": 10.5}
-            },
-            {
-                "id": "asset_002", 
-                "type": "image",
-                "uri": "asset://images/asset_002/generated.png",
-                "size_bytes": 2048000,
-                "created_at": datetime.now().isoformat(),
-                "metadata": {"provider": "gemini", "watermark": {"present": True}}
-            }
-        ]
-        
-        # Filter by type if specified
-        if asset_type:
-            mock_assets = [asset for asset in mock_assets if asset["type"] == asset_type]
-        
+        assets, next_cursor = await asyncio.to_thread(
+            catalog.get_catalog().list, asset_type=asset_type, provider=provider, anchor=anchor,
+            prompt_hash=prompt_hash, limit=limit, cursor=cursor)
         return envelope_ok({
-            "assets": mock_assets[:limit],
-            "count": len(mock_assets[:limit]),
-            "total": len(mock_assets)
-        }, {"actor": "api"})
-        
+            "assets": assets,
+            "count": len(assets),
+            "next_cursor": next_cursor,
+        }, {"actor": "api", "limit": max(1, min(limit, catalog.MAX_PAGE))})
+
+    except catalog.InvalidCursor as e:
+        return JSONResponse(status_code=400, content=envelope_error(
+            "INVALID_CURSOR", "Invalid pagination cursor", {"detail": str(e)}, {"actor": "api"}))
     except Exception as e:
         logger.error(f"Failed to retrieve assets: {e}")
         return envelope_error("ASSETS_FAILED", "Failed to retrieve media assets", 
                             {"detail": str(e)}, {"actor": "api"})
 
+@app.post("/media/assets/bulk")
+async def get_assets_bulk(req: BulkAssetsReq):
+    """Fetch metadata for many assets in one query, in request order"""
+    try:
+        assets = await asyncio.to_thread(catalog.get_catalog().get_many, req.ids)
+        found = {asset["id"] for asset in assets}
+        return envelope_ok({
+            "assets": assets,
+            "count": len(assets),
+            "missing": [i for i in dict.fromkeys(req.ids) if i not in found],
+        }, {"actor": "api"})
+    except Exception as e:
+        logger.error(f"Failed to retrieve assets: {e}")
+        return envelope_error("ASSETS_FAILED", "Failed to retrieve media assets",
+                            {"detail": str(e)}, {"actor": "api"})
+
+@app.get("/media/blobs/{blob_id}")
+def get_blob(blob_id: str, request: Request):
+    """Serve a stored media file; supports Range requests and conditional GETs"""
+    return artifact_response(get_artifact_store(), blob_id, request, "BLOB_NOT_FOUND", "Blob not found")
+
+@app.get("/media/blobs/{blob_id}/thumbnail")
+async def get_blob_thumbnail(blob_id: str, request: Request, size: int = blobs.DEFAULT_THUMBNAIL_SIZE):
+    """Serve a thumbnail of a stored image, rendering and storing it on first request"""
+    if size not in blobs.THUMBNAIL_SIZES:
+        return JSONResponse(status_code=400, content=envelope_error(
+            "INVALID_THUMBNAIL_SIZE", f"Thumbnail size must be one of: {', '.join(map(str, blobs.THUMBNAIL_SIZES))}",
+            {"size": size}, {"actor": "api"}))
+    info = await asyncio.to_thread(get_artifact_store().stat, blob_id)
+    if info is None:
+        return JSONResponse(status_code=404, content=envelope_error(
+            "BLOB_NOT_FOUND", "Blob not found", {"id": blob_id}, {"actor": "api"}))
+    if not info["media_type"].startswith("image/"):
+        return JSONResponse(status_code=415, content=envelope_error(
+            "NOT_AN_IMAGE", "Thumbnails are only available for images",
+            {"id": blob_id, "media_type": info["media_type"]}, {"actor": "api"}))
+    try:
+        thumb = await asyncio.to_thread(blobs.thumbnail, blob_id, size)
+    except blobs.ThumbnailUnavailable as e:
+        return JSONResponse(status_code=501, content=envelope_error(
+            "THUMBNAILS_UNAVAILABLE", "Thumbnail rendering is not available", {"detail": str(e)}, {"actor": "api"}))
+    except Exception as e:
+        logger.error(f"Failed to render thumbnail for {blob_id}: {e}")
+        return JSONResponse(status_code=422, content=envelope_error(
+            "THUMBNAIL_FAILED", "Failed to render thumbnail", {"detail": str(e)}, {"actor": "api"}))
+    return artifact_response(get_artifact_store(), thumb["id"], request, "BLOB_NOT_FOUND", "Blob not found")
+
 @app.get("/media/providers")
 def get_providers():
     """Get available media generation providers"""
@@ -497,6 +910,15 @@ def get_providers():
         ]
     }, {"actor": "api"})
 
+@app.get("/media/providers/health")
+def get_provider_health():
+    """Rolling latency and error statistics the router ranks image providers by"""
+    return envelope_ok({
+        "providers": routing.ROUTER.snapshot(),
+        "auto_candidates": auto_providers(),
+        "ranking": routing.ROUTER.rank(auto_providers()),
+    }, {"actor": "api"})
+
 @app.get("/media/watermarks")
 def get_watermark_types():
     """Get available watermark types"""
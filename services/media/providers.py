@@ -0,0 +1,105 @@
+"""Pooled HTTP clients for the media generation providers.
+
+Each provider gets one ``httpx.AsyncClient`` for the life of the app. Its
+connection pool and keep-alive connections are reused across requests
+instead of paying a TCP/TLS handshake per image. The service lifespan
+opens and closes the pool. When the app runs without its lifespan (for
+example a bare ``TestClient``), clients are created lazily on first use.
+
+Each provider also gets a semaphore that caps how many requests this
+process has in flight to it, so fanning out variants cannot trip
+provider rate limits.
+
+Base URLs come from the environment (``DALLE_BASE_URL``,
+``GEMINI_BASE_URL``), so the service can point at a proxy or a local
+stand-in.
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+from typing import Dict, Optional
+
+import httpx
+
+DEFAULT_BASE_URLS = {
+    "dalle": "https://api.openai.com",
+    "gemini": "https://generativelanguage.googleapis.com",
+}
+DEFAULT_CONCURRENCY = 4
+# Pool key for the client that downloads generated files
+FETCH_CLIENT = "_fetch"
+
+
+def base_url(provider: str) -> str:
+    return os.environ.get(f"{provider.upper()}_BASE_URL", DEFAULT_BASE_URLS[provider]).rstrip("/")
+
+
+def concurrency(provider: str) -> int:
+    return max(1, int(os.environ.get(f"MEDIA_{provider.upper()}_CONCURRENCY", str(DEFAULT_CONCURRENCY))))
+
+
+class ProviderPool:
+    """Per-provider ``AsyncClient`` and in-flight semaphore.
+
+    Clients and semaphores belong to one event loop. If the pool is used
+    from a different loop, it starts a fresh set rather than reusing
+    connections bound to the old one.
+    """
+
+    def __init__(self, transport: Optional[httpx.AsyncBaseTransport] = None,
+                 max_connections: int = 20) -> None:
+        self._transport = transport
+        self._limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+
+    def _bind(self) -> None:
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self._loop = loop
+            self._clients = {}
+            self._semaphores = {}
+
+    async def open(self) -> None:
+        self._bind()
+        for provider in DEFAULT_BASE_URLS:
+            self.client(provider)
+
+    def client(self, provider: str) -> httpx.AsyncClient:
+        self._bind()
+        client = self._clients.get(provider)
+        if client is None or client.is_closed:
+            client = self._clients[provider] = httpx.AsyncClient(
+                base_url=base_url(provider), limits=self._limits, transport=self._transport)
+        return client
+
+    def fetch_client(self) -> httpx.AsyncClient:
+        """Client for downloading provider output from absolute URLs (CDN and blob hosts)"""
+        self._bind()
+        client = self._clients.get(FETCH_CLIENT)
+        if client is None or client.is_closed:
+            client = self._clients[FETCH_CLIENT] = httpx.AsyncClient(
+                limits=self._limits, transport=self._transport, follow_redirects=True)
+        return client
+
+    def semaphore(self, provider: str) -> asyncio.Semaphore:
+        self._bind()
+        sem = self._semaphores.get(provider)
+        if sem is None:
+            sem = self._semaphores[provider] = asyncio.Semaphore(concurrency(provider))
+        return sem
+
+    @property
+    def open_clients(self) -> int:
+        return sum(1 for c in self._clients.values() if not c.is_closed)
+
+    async def aclose(self) -> None:
+        clients, self._clients = self._clients, {}
+        self._semaphores = {}
+        for client in clients.values():
+            await client.aclose()
+
+
+POOL = ProviderPool()
@@ -0,0 +1,212 @@
+"""Latency-aware routing across image providers.
+
+The router keeps rolling statistics for every provider call:
+
+- an EWMA of successful call latency, which ranks providers;
+- a sliding window of recent outcomes, which gives the p95 latency and
+  the error rate.
+
+A provider whose windowed error rate exceeds ``MEDIA_ROUTER_MAX_ERROR_RATE``
+(once it has ``MEDIA_ROUTER_MIN_SAMPLES`` outcomes) is unhealthy and is
+ranked after every healthy one. After ``MEDIA_ROUTER_PROBE_S`` without
+traffic it is treated as healthy again, so a provider that recovers is
+found again instead of being starved forever.
+
+``Router.run`` sends a request to the fastest healthy provider. The next
+one in the ranking is the backup:
+
+- If the primary fails, the backup runs straight away.
+- With ``hedge=True``, the backup is also started when the primary has
+  not answered within its own p95 latency (clamped to
+  ``MEDIA_HEDGE_MIN_MS``..``MEDIA_HEDGE_MAX_MS``; ``MEDIA_HEDGE_DELAY_MS``
+  until there are enough samples). The first success wins and the other
+  call is cancelled. A cancelled call records no sample, so losing a race
+  does not count against a provider.
+
+Statistics live in process memory and hold no asyncio state, so one
+``ROUTER`` serves the whole app.
+"""
+from __future__ import annotations
+
+import asyncio
+import math
+import os
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Sequence, Tuple
+
+Call = Callable[[str], Awaitable[Dict[str, Any]]]
+
+
+def _env_float(name: str, default: float) -> float:
+    return float(os.environ.get(name, str(default)))
+
+
+class ProviderStats:
+    def __init__(self, alpha: float, window: int) -> None:
+        self.alpha = alpha
+        self.ewma: Optional[float] = None
+        self.samples: Deque[Tuple[float, bool]] = deque(maxlen=window)
+        self.calls = 0
+        self.errors = 0
+        self.last_at: Optional[float] = None
+
+    def record(self, latency: float, ok: bool) -> None:
+        self.calls += 1
+        self.last_at = time.monotonic()
+        self.samples.append((latency, ok))
+        if not ok:
+            self.errors += 1
+            return
+        self.ewma = latency if self.ewma is None else self.alpha * latency + (1 - self.alpha) * self.ewma
+
+    def p95(self) -> Optional[float]:
+        latencies = sorted(latency for latency, ok in self.samples if ok)
+        if not latencies:
+            return None
+        return latencies[max(0, math.ceil(0.95 * len(latencies)) - 1)]
+
+    def error_rate(self) -> float:
+        if not self.samples:
+            return 0.0
+        return sum(1 for _, ok in self.samples if not ok) / len(self.samples)
+
+    def successes(self) -> int:
+        return sum(1 for _, ok in self.samples if ok)
+
+
+@dataclass
+class Outcome:
+    provider: str
+    result: Dict[str, Any]
+    attempts: List[str] = field(default_factory=list)
+    hedged: bool = False
+
+    def view(self) -> Dict[str, Any]:
+        return {"provider": self.provider, "attempts": self.attempts, "hedged": self.hedged}
+
+
+class Router:
+    def __init__(self, alpha: Optional[float] = None, window: Optional[int] = None,
+                 min_samples: Optional[int] = None, max_error_rate: Optional[float] = None,
+                 probe_after: Optional[float] = None, hedge_delay: Optional[float] = None,
+                 hedge_min: Optional[float] = None, hedge_max: Optional[float] = None) -> None:
+        self.alpha = alpha if alpha is not None else _env_float("MEDIA_ROUTER_ALPHA", 0.3)
+        self.window = window if window is not None else int(_env_float("MEDIA_ROUTER_WINDOW", 100))
+        self.min_samples = min_samples if min_samples is not None else int(_env_float("MEDIA_ROUTER_MIN_SAMPLES", 5))
+        self.max_error_rate = (max_error_rate if max_error_rate is not None
+                               else _env_float("MEDIA_ROUTER_MAX_ERROR_RATE", 0.5))
+        self.probe_after = probe_after if probe_after is not None else _env_float("MEDIA_ROUTER_PROBE_S", 30.0)
+        # Hedge delays are seconds here; the environment uses milliseconds
+        self.hedge_delay = hedge_delay if hedge_delay is not None else _env_float("MEDIA_HEDGE_DELAY_MS", 2000) / 1000
+        self.hedge_min = hedge_min if hedge_min is not None else _env_float("MEDIA_HEDGE_MIN_MS", 50) / 1000
+        self.hedge_max = hedge_max if hedge_max is not None else _env_float("MEDIA_HEDGE_MAX_MS", 10000) / 1000
+        self._stats: Dict[str, ProviderStats] = {}
+
+    def stats(self, provider: str) -> ProviderStats:
+        stats = self._stats.get(provider)
+        if stats is None:
+            stats = self._stats[provider] = ProviderStats(self.alpha, self.window)
+        return stats
+
+    def healthy(self, provider: str) -> bool:
+        stats = self.stats(provider)
+        if len(stats.samples) < self.min_samples or stats.error_rate() <= self.max_error_rate:
+            return True
+        return stats.last_at is None or time.monotonic() - stats.last_at >= self.probe_after
+
+    def rank(self, candidates: Sequence[str]) -> List[str]:
+        """Healthy providers by EWMA latency (unmeasured first, so they get measured), then unhealthy ones"""
+        def key(item: Tuple[int, str]):
+            position, provider = item
+            stats = self.stats(provider)
+            if self.healthy(provider):
+                return (0, -1.0 if stats.ewma is None else stats.ewma, position)
+            return (1, stats.error_rate(), position)
+        return [p for _, p in sorted(enumerate(dict.fromkeys(candidates)), key=key)]
+
+    def delay_for(self, provider: str) -> float:
+        """How long to wait on ``provider`` before hedging: its p95, clamped"""
+        stats = self.stats(provider)
+        p95 = stats.p95()
+        if p95 is None or stats.successes() < self.min_samples:
+            return self.hedge_delay
+        return min(max(p95, self.hedge_min), self.hedge_max)
+
+    async def observe(self, provider: str, call: Call) -> Dict[str, Any]:
+        """Run ``call(provider)`` and record its latency and outcome (cancellation records nothing)"""
+        start = time.perf_counter()
+        try:
+            result = await call(provider)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            result = {"error": str(e)}
+        self.stats(provider).record(time.perf_counter() - start, "error" not in result)
+        return result
+
+    async def run(self, candidates: Sequence[str], call: Call, hedge: bool = False,
+                  primary: Optional[str] = None) -> Outcome:
+        """Route one request; ``primary`` pins the first provider and leaves the rest as backups"""
+        order = self.rank(candidates)
+        if primary is not None:
+            order = [primary] + [p for p in order if p != primary]
+        if not order:
+            raise ValueError("no providers to route to")
+        outcome = Outcome(provider=order[0], result={}, attempts=[order[0]])
+        running = {asyncio.ensure_future(self.observe(order[0], call)): order[0]}
+        backups = iter(order[1:2])
+        timeout = self.delay_for(order[0]) if hedge else None
+        failure: Optional[Tuple[str, Dict[str, Any]]] = None
+        try:
+            while running:
+                done, _ = await asyncio.wait(running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                timeout = None
+                if not done:
+                    # Primary is slower than its p95: race the backup against it
+                    backup = next(backups, None)
+                    if backup is not None:
+                        outcome.hedged = True
+                        outcome.attempts.append(backup)
+                        running[asyncio.ensure_future(self.observe(backup, call))] = backup
+                    continue
+                for task in done:
+                    provider = running.pop(task)
+                    result = task.result()
+                    if "error" not in result:
+                        outcome.provider, outcome.result = provider, result
+                        return outcome
+                    if failure is None:
+                        failure = (provider, result)
+                # Fail over if nothing else is still running
+                if not running:
+                    backup = next(backups, None)
+                    if backup is not None:
+                        outcome.attempts.append(backup)
+                        running[asyncio.ensure_future(self.observe(backup, call))] = backup
+            outcome.provider, outcome.result = failure
+            return outcome
+        finally:
+            for task in running:
+                task.cancel()
+            await asyncio.gather(*running, return_exceptions=True)
+
+    def snapshot(self) -> Dict[str, Any]:
+        out = {}
+        for provider, stats in self._stats.items():
+            p95 = stats.p95()
+            out[provider] = {
+                "healthy": self.healthy(provider),
+                "ewma_ms": None if stats.ewma is None else round(stats.ewma * 1000, 1),
+                "p95_ms": None if p95 is None else round(p95 * 1000, 1),
+                "error_rate": round(stats.error_rate(), 3),
+                "window": len(stats.samples),
+                "calls": stats.calls,
+                "errors": stats.errors,
+                "hedge_delay_ms": round(self.delay_for(provider) * 1000, 1),
+            }
+        return out
+
+
+ROUTER = Router()
@@ -0,0 +1,114 @@
+"""SSML tokenizer and sentence chunker for audio synthesis.
+
+``chunks`` turns SSML (or plain text) into an ordered list of sentence
+chunks. Each chunk records the paragraph it belongs to and any pause that
+follows it.
+
+- ``<p>`` and blank lines start a new paragraph, and ``<s>`` marks an
+  explicit sentence. Other text is split after ``.``, ``!`` and ``?``.
+- ``<break time="500ms"/>`` (or ``strength``) ends the current sentence
+  and becomes a pause after it.
+- Other elements (``speak``, ``voice``, ``prosody``, ``emphasis``...)
+  contribute only their text. Comments, CDATA markers and processing
+  instructions are dropped, and entities are unescaped.
+
+The tokenizer is a single regex scan and does not need well-formed XML,
+so hand-written SSML with a stray tag still synthesizes.
+"""
+from __future__ import annotations
+
+import html
+import re
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional, Tuple
+
+_TOKEN_RE = re.compile(r"<!--.*?-->|<!\[CDATA\[|\]\]>|<\?.*?\?>|<(/?)([A-Za-z][\w:.-]*)([^>]*?)(/?)>|([^<]+|<)",
+                       re.DOTALL)
+_ATTR_RE = re.compile(r"""([\w:.-]+)\s*=\s*("[^"]*"|'[^']*')""")
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?])[\"')\]]*\s+")
+_PARAGRAPH_RE = re.compile(r"\n\s*\n")
+_WS_RE = re.compile(r"\s+")
+
+# Pause lengths for <break strength="..."> (milliseconds)
+BREAK_STRENGTH_MS = {"none": 0, "x-weak": 100, "weak": 250, "medium": 400, "strong": 750, "x-strong": 1200}
+
+
+@dataclass
+class Chunk:
+    index: int
+    paragraph: int
+    text: str
+    break_after_ms: int = 0
+
+
+def _attrs(raw: str) -> Dict[str, str]:
+    return {k.lower(): v[1:-1] for k, v in _ATTR_RE.findall(raw)}
+
+
+def _break_ms(attrs: Dict[str, str]) -> int:
+    time = attrs.get("time", "").strip().lower()
+    m = re.fullmatch(r"(\d+(?:\.\d+)?)\s*(ms|s)", time)
+    if m:
+        value = float(m.group(1))
+        return int(value * 1000 if m.group(2) == "s" else value)
+    return BREAK_STRENGTH_MS.get(attrs.get("strength", "medium").lower(), BREAK_STRENGTH_MS["medium"])
+
+
+def tokens(ssml: str) -> Iterator[Tuple[str, object]]:
+    """``("text", str)``, ``("sentence", None)``, ``("paragraph", None)`` and ``("break", ms)`` tokens."""
+    for m in _TOKEN_RE.finditer(ssml):
+        closing, tag, raw_attrs, self_closing, text = m.groups()
+        if text is not None:
+            yield "text", html.unescape(text)
+        elif tag is not None:
+            name = tag.lower().rsplit(":", 1)[-1]
+            if name in ("p", "paragraph"):
+                yield "paragraph", None
+            elif name in ("s", "sentence"):
+                yield "sentence", None
+            elif name == "break" and not closing:
+                yield "break", _break_ms(_attrs(raw_attrs))
+
+
+def chunks(ssml: str) -> List[Chunk]:
+    out: List[Chunk] = []
+    paragraph = 0
+    buf: List[str] = []
+    pending_paragraph = False
+
+    def flush_text() -> None:
+        nonlocal paragraph, pending_paragraph
+        text = "".join(buf)
+        buf.clear()
+        for p_index, para in enumerate(_PARAGRAPH_RE.split(text)):
+            if p_index:
+                pending_paragraph = True
+            for sentence in _SENTENCE_END_RE.split(para):
+                sentence = _WS_RE.sub(" ", sentence).strip()
+                if not sentence:
+                    continue
+                if pending_paragraph and out:
+                    paragraph += 1
+                pending_paragraph = False
+                out.append(Chunk(len(out), paragraph, sentence))
+
+    for kind, value in tokens(ssml):
+        if kind == "text":
+            buf.append(value)
+            continue
+        flush_text()
+        if kind == "paragraph":
+            pending_paragraph = True
+        elif kind == "break" and out:
+            out[-1].break_after_ms += value
+    flush_text()
+    return out
+
+
+def plain_text(ssml: str) -> str:
+    """Spoken text with markup removed, sentences separated by single spaces."""
+    return " ".join(c.text for c in chunks(ssml))
+
+
+def word_count(ssml: str, parsed: Optional[List[Chunk]] = None) -> int:
+    return sum(len(c.text.split()) for c in (parsed if parsed is not None else chunks(ssml)))
@@ -22,9 +22,9 @@ def outline(body: OutlineIn):
     if res.get("status") == "ok":
         return {"status": "ok", "data": res["data"], "meta": {"provider": "groq", "latency_ms": ms}}
 
-    # fail-closed with a helpful 502
+    # fail-closed with a helpful 502 (504 when the caller's deadline ran out)
     raise HTTPException(
-        status_code=502,
+        status_code=504 if res.get("error") == "deadline_exceeded" else 502,
         detail={"status": "error", "error": res.get("error", "unknown"), "meta": {"latency_ms": ms, **res.get("meta", {})}},
     )
 
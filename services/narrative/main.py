@@ -4,6 +4,7 @@ from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, Field, field_validator
 from typing import List, Optional, Dict, Any
 from services.common.envelope import envelope_ok, envelope_error
+from services.common.deadline import DeadlineMiddleware
 from services.narrative.ledger import compute_promise_payoff, trope_budget_ok
 from services.narrative.api import router as narrative_router
 import os
@@ -18,6 +19,9 @@ logger = logging.getLogger(__name__)
 
 def create_app() -> FastAPI:
     app = FastAPI(title="StoryMaker Narrative", version="1.6.0")
+
+    # Honour X-Deadline-Ms from orchestration (added first so CORS stays outermost)
+    app.add_middleware(DeadlineMiddleware)
     
     # Add CORS middleware
     app.add_middleware(
@@ -4,6 +4,8 @@ from typing import List, Dict, Any, Optional
 from dataclasses import dataclass
 from functools import lru_cache
 
+from services.common import deadline
+
 # Make .env loading deterministic and shell-agnostic
 try:
     from dotenv import load_dotenv  # pip install python-dotenv
@@ -67,6 +69,8 @@ def chat_complete(messages: List[Dict[str, str]], model: Optional[str] = None, *
     last_err: Optional[Exception] = None
 
     while attempt <= max_retries:
+        # Clamp to the caller's remaining budget (X-Deadline-Ms), if any
+        timeout = deadline.clamp_timeout(request_timeout, "groq chat completion")
         try:
             resp = client.chat.completions.create(
                 model=m,
@@ -74,7 +78,7 @@ def chat_complete(messages: List[Dict[str, str]], model: Optional[str] = None, *
                 temperature=kwargs.get("temperature", 0.8),
                 max_tokens=kwargs.get("max_tokens", 900),
                 top_p=kwargs.get("top_p", 0.95),
-                timeout=request_timeout,  # groq SDK supports timeout
+                timeout=timeout,  # groq SDK supports timeout
             )
             if not resp or not resp.choices:
                 raise GroqError("Empty response from Groq")
@@ -87,6 +91,8 @@ def chat_complete(messages: List[Dict[str, str]], model: Optional[str] = None, *
                 break
             if attempt >= max_retries:
                 break
+            if not deadline.can_retry(backoff_ms * (attempt + 1) / 1000.0):
+                break
             _sleep_ms(backoff_ms * (attempt + 1))
             attempt += 1
 
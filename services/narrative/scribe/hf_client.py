@@ -2,6 +2,7 @@ from __future__ import annotations
 import os, json, time
 from typing import Any, Dict
 import requests
+from services.common import deadline
 from services.narrative.ledger import compute_promise_payoff, trope_budget_ok
 
 # NO-MOCKS GUARD: Hard-fail if Groq API key is missing
@@ -75,8 +76,10 @@ def _groq_infer(model_id: str, token: str, prompt: str, controls: Dict[str, Any]
     }
     
     for i in range(6):
+        # Never wait longer than the caller (X-Deadline-Ms) is willing to
+        timeout = deadline.clamp_timeout(120, "groq inference")
         try:
-            response = requests.post(url, headers=headers, json=data, timeout=120)
+            response = requests.post(url, headers=headers, json=data, timeout=timeout)
             response.raise_for_status()
             result = response.json()
             return result["choices"][0]["message"]["content"]
@@ -84,6 +87,8 @@ def _groq_infer(model_id: str, token: str, prompt: str, controls: Dict[str, Any]
         except Exception as e:
             if i == 5:  # Last attempt
                 raise RuntimeError(f"Groq inference failed: {e}")
+            if not deadline.can_retry(_backoff(i)):
+                raise deadline.DeadlineExceeded(f"no budget left to retry Groq inference: {e}")
             time.sleep(_backoff(i))
             continue
     
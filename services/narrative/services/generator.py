@@ -2,6 +2,8 @@
 from typing import Dict, Any, List
 import json
 
+from services.common.deadline import DeadlineExceeded
+
 # Use the scribe Groq generator that loads prompts from docs/prompts/scribe_prompts.json
 from services.narrative.scribe.hf_client import generate as groq_generate
 
@@ -71,5 +73,7 @@ def generate_outline(world_id: str, premise: str, mode: str) -> Dict[str, Any]:
             "status": "ok",
             "data": {"world_id": world_id, "mode": mode, "beats": beats},
         }
+    except DeadlineExceeded as e:
+        return {"status": "error", "error": "deadline_exceeded", "meta": {"cause": str(e), "provider": "groq"}}
     except Exception as e:
         return {"status": "error", "error": "groq_unavailable", "meta": {"cause": str(e), "provider": "groq"}}
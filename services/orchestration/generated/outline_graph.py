@@ -0,0 +1,148 @@
+
+import asyncio
+import os
+from typing import Annotated, Any, Dict, TypedDict
+from langgraph.graph import StateGraph
+from tools.pf_langgraph.envelope import require_envelope
+from tools.pf_langgraph import runtime as rt
+
+def _wrap_node(fn, client, env):
+    async def _inner(state):
+        delta = await fn(state, client, env)
+        nodes = delta.get('nodes')
+        if nodes:
+            # Validate only the incoming delta (O(1) per node, not O(nodes) per step)
+            for k, v in nodes.items():
+                nodes[k] = rt.offload(require_envelope(v, f"node:{k}"))
+        return delta
+    return _inner
+
+class GraphState(TypedDict):
+    inputs: Dict[str, Any]
+    nodes: Annotated[Dict[str, Any], rt.merge_into]
+    outputs: Annotated[Dict[str, Any], rt.merge_into]
+
+async def node_narrative_outline(state, client, env):
+    method = "POST"
+    url = os.environ.get("NARRATIVE_BASE", "") + "/narrative/outline"
+    body = {"world_id": "default", "premise": rt.lookup(state, ("inputs", "premise")), "mode": "hero_journey"}
+    headers = {"Content-Type": "application/json"}
+
+    async def _call():
+        return await rt.http_request(client, method, url, body, headers, timeout_ms=60000)
+
+    out = await rt.cached_call('narrative_outline', {'ttl_s': 3600, 'backend': 'memory'}, rt.lookup(state, ("inputs", "premise")), _call)
+    # Return delta for parallel-safe updates
+    return {'nodes': {'narrative_outline': out}}
+
+async def node_qa_trope_budget(state, client, env):
+    method = "POST"
+    url = os.environ.get("WORLDCORE_BASE", "") + "/api/qa/trope-budget"
+    body = {"draft": rt.lookup(state, ("nodes", "narrative_outline", "data", "beats"))}
+    headers = {"Content-Type": "application/json"}
+
+    async def _call():
+        return await rt.http_request(client, method, url, body, headers, timeout_ms=5000, retry={'count': 1, 'backoff_ms': 100}, breaker={'name': 'worldcore_qa', 'failure_threshold': 5, 'cooldown_ms': 30000})
+
+    out = await rt.cached_call('qa_trope_budget', None, None, _call)
+    # Return delta for parallel-safe updates
+    return {'nodes': {'qa_trope_budget': out}}
+
+async def node_qa_promise_payoff(state, client, env):
+    method = "POST"
+    url = os.environ.get("WORLDCORE_BASE", "") + "/api/qa/promise-payoff"
+    body = {"draft": rt.lookup(state, ("nodes", "narrative_outline", "data", "beats"))}
+    headers = {"Content-Type": "application/json"}
+
+    async def _call():
+        return await rt.http_request(client, method, url, body, headers, timeout_ms=5000, retry={'count': 1, 'backoff_ms': 100}, breaker={'name': 'worldcore_qa', 'failure_threshold': 5, 'cooldown_ms': 30000})
+
+    out = await rt.cached_call('qa_promise_payoff', None, None, _call)
+    # Return delta for parallel-safe updates
+    return {'nodes': {'qa_promise_payoff': out}}
+
+async def node_decide_gate(state, client, env):
+    cond = bool(rt.lookup(state, ("nodes", "qa_trope_budget", "data", "used")) < int(os.environ.get("TROPE_MAX", "10")))
+    # Return delta for parallel-safe updates
+    return {
+        'nodes': {'decide_gate': {'status':'ok','data':{'cond': cond},'error':None,'meta':{}}},
+        '__branch__': 'on_true' if cond else 'on_false',
+        '__branch_targets__': {"on_true": ["approve_canon"], "on_false": []}
+    }
+
+async def node_approve_canon(state, client, env):
+    method = "POST"
+    url = os.environ.get("WORLDCORE_BASE", "") + "/api/events/Draft001/approve"
+    body = {"action": "approve_canon"}
+    headers = {"Content-Type": "application/json"}
+
+    async def _call():
+        return await rt.http_request(client, method, url, body, headers, timeout_ms=60000)
+
+    out = await rt.cached_call('approve_canon', None, None, _call)
+    # Return delta for parallel-safe updates
+    return {'nodes': {'approve_canon': out}}
+
+async def controller(state, *_):
+    # Envelopes are validated per delta in _wrap_node
+    branch = state.pop('__branch__', None)
+    targets = state.pop('__branch_targets__', None)
+    if branch and targets:
+        for t in targets.get(branch, []):
+            return {'__next__': t}
+    return {}
+
+def build_graph_with_ctx(client=None, env=None):
+    # Default env = process environment
+    if env is None:
+        env = dict(os.environ)
+    graph = StateGraph(GraphState)
+    # register wrapped nodes so LangGraph calls them as (state) while we keep (state, client, env)
+    graph.add_node('narrative_outline', _wrap_node(node_narrative_outline, client, env))
+    graph.add_node('qa_trope_budget', _wrap_node(node_qa_trope_budget, client, env))
+    graph.add_node('qa_promise_payoff', _wrap_node(node_qa_promise_payoff, client, env))
+    graph.add_node('decide_gate', _wrap_node(node_decide_gate, client, env))
+    graph.add_node('approve_canon', _wrap_node(node_approve_canon, client, env))
+    graph.add_edge('narrative_outline', 'qa_trope_budget')
+    graph.add_edge('narrative_outline', 'qa_promise_payoff')
+    graph.add_edge('qa_trope_budget', 'decide_gate')
+    graph.add_edge('qa_promise_payoff', 'decide_gate')
+    graph.set_entry_point('narrative_outline')
+    graph.__spec_fingerprint__ = '83228a6a115e846db03b2a0175ac10cdaf76c6236efa76f9c876c0d5b776e85d'
+    return graph
+
+def build_graph():
+    # Back-compat: build with default ctx
+    return build_graph_with_ctx()
+
+def _finalize_outputs(state):
+    """Finalize outputs from the flow specification."""
+    outputs = {}
+    outputs['outline'] = rt.lookup(state, ('nodes', 'narrative_outline', 'data'), default=None)
+    outputs['qa'] = {}
+    outputs['qa']['trope'] = rt.lookup(state, ('nodes', 'qa_trope_budget', 'data'), default=None)
+    outputs['qa']['promise'] = rt.lookup(state, ('nodes', 'qa_promise_payoff', 'data'), default=None)
+    outputs['approved'] = rt.lookup(state, ('nodes', 'decide_gate', 'data', 'cond'), default={})
+    return {'outputs': outputs}
+
+async def run_graph(inputs: Dict[str, Any], client=None, env=None, deadline_ms=None):
+    g = build_graph_with_ctx(client=client, env=env).compile()
+    state = {'inputs': inputs, 'nodes': {}, 'outputs': {}}
+    # Every node call clamps its timeout to what is left of deadline_ms
+    with rt.deadline(deadline_ms):
+        if deadline_ms is None:
+            state = await g.ainvoke(state)
+        else:
+            try:
+                state = await asyncio.wait_for(g.ainvoke(state), deadline_ms / 1000.0)
+            except asyncio.TimeoutError:
+                raise rt.DeadlineExceeded(f"run exceeded its {deadline_ms}ms deadline") from None
+    delta = _finalize_outputs(state)
+    if isinstance(delta, dict) and 'outputs' in delta:
+        try:
+            state['outputs'] |= delta['outputs']
+        except Exception:
+            tmp = state.get('outputs', {}).copy()
+            tmp.update(delta['outputs'])
+            state['outputs'] = tmp
+    return state
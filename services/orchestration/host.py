@@ -1,6 +1,9 @@
-from fastapi import FastAPI
+from typing import Optional
+from fastapi import FastAPI, Header
 from langgraph.checkpoint.memory import MemorySaver
 from tools.pf_langgraph.envelope import envelope_ok, envelope_err  # type: ignore
+from tools.pf_langgraph import runtime as rt
+import asyncio
 from datetime import datetime, timezone
 import os
 
@@ -47,11 +50,23 @@ async def version():
         "meta": {"ts": datetime.now(timezone.utc).isoformat()}
     }
 
+async def _invoke(state, deadline_ms):
+    # Node calls clamp their timeouts to the remaining budget and forward it downstream
+    with rt.deadline(deadline_ms):
+        if deadline_ms is None:
+            return await graph.ainvoke(state)  # type: ignore
+        return await asyncio.wait_for(graph.ainvoke(state), deadline_ms / 1000.0)  # type: ignore
+
+
 @app.post("/run")
-async def run(inputs: dict):
+async def run(inputs: dict, deadline_ms: Optional[int] = None,
+              x_deadline_ms: Optional[int] = Header(default=None)):
+    deadline_ms = deadline_ms if deadline_ms is not None else x_deadline_ms
+    if deadline_ms is None and os.environ.get("PF_RUN_DEADLINE_MS"):
+        deadline_ms = int(os.environ["PF_RUN_DEADLINE_MS"])
     try:
         state = {"inputs": inputs, "nodes": {}, "outputs": {}}
-        state = await graph.ainvoke(state)  # type: ignore
+        state = await _invoke(state, deadline_ms)
         delta = _finalize_outputs(state)
         if isinstance(delta, dict) and 'outputs' in delta:
             try:
@@ -64,6 +79,12 @@ async def run(inputs: dict):
             data={"state": state, "outputs": state.get("outputs", {})},
             meta={"ts": datetime.now(timezone.utc).isoformat(), "actor": "orchestration.host"},
         )
+    except (rt.DeadlineExceeded, asyncio.TimeoutError) as e:
+        return envelope_err(
+            code="deadline_exceeded",
+            message=str(e) or f"run exceeded its {deadline_ms}ms deadline",
+            details={"inputs": inputs, "deadline_ms": deadline_ms},
+        )
     except Exception as e:  # pragma: no cover
         return envelope_err(
             code="graph_runtime_error",
@@ -0,0 +1,153 @@
+"""Script-wide dialogue and character statistics.
+
+``analyze`` walks the scene cards once. Characters are interned to dense
+indices, and per-character counts live in ``array`` counters rather than
+dicts of dicts. Scene presence is kept as a list of index tuples, and the
+co-occurrence matrix is one flat ``array`` built from those tuples at the
+end. Screen time uses the industry rule of thumb of one page per minute,
+with each scene measured in eighths of a page by the PDF paginator.
+
+Results are cached by a hash of the cards, so repeat requests for an
+unchanged script are a dictionary lookup.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import threading
+from array import array
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Any, Dict, List, Sequence, Tuple
+
+from services.screenplay.pdf import scene_eighths
+
+if TYPE_CHECKING:  # pragma: no cover
+    from services.screenplay.main import SceneCard
+
+# Bump when the result shape or the counting rules change
+ANALYTICS_VERSION = 1
+SECONDS_PER_EIGHTH = 60 / 8  # one page ≈ one minute
+
+
+def script_hash(cards: Sequence["SceneCard"]) -> str:
+    h = hashlib.sha256(f"analytics-v{ANALYTICS_VERSION}".encode())
+    for card in cards:
+        h.update(json.dumps(card.model_dump(), sort_keys=True, ensure_ascii=False).encode("utf-8"))
+        h.update(b"\n")
+    return h.hexdigest()
+
+
+def analyze(cards: Sequence["SceneCard"]) -> Dict[str, Any]:
+    index: Dict[str, int] = {}
+    names: List[str] = []
+    lines = array("l")
+    words = array("l")
+    scenes = array("l")
+    eighths = array("l")
+    presence: List[Tuple[int, ...]] = []
+    scene_rows: List[Dict[str, Any]] = []
+    total_words = 0
+
+    def intern(name: str) -> int:
+        key = (name or "UNKNOWN").strip().upper()
+        i = index.get(key)
+        if i is None:
+            i = index[key] = len(names)
+            names.append(key)
+            for counter in (lines, words, scenes, eighths):
+                counter.append(0)
+        return i
+
+    for card in cards:
+        present = {intern(name) for name in card.who}
+        scene_words = 0
+        for line in card.dialogue or []:
+            i = intern(line.get("character", "UNKNOWN"))
+            present.add(i)
+            n = len(line.get("text", "").split())
+            lines[i] += 1
+            words[i] += n
+            scene_words += n
+        length = scene_eighths(card)
+        ordered = tuple(sorted(present))
+        for i in ordered:
+            scenes[i] += 1
+            eighths[i] += length
+        presence.append(ordered)
+        total_words += scene_words
+        scene_rows.append({"slug": card.slug, "characters": list(ordered), "dialogue_words": scene_words,
+                           "page_eighths": length})
+
+    n = len(names)
+    matrix = array("l", [0]) * (n * n)
+    for ordered in presence:
+        for a in ordered:
+            row = a * n
+            for b in ordered:
+                matrix[row + b] += 1
+
+    total_eighths = sum(row["page_eighths"] for row in scene_rows)
+    characters = [
+        {
+            "name": names[i],
+            "lines": lines[i],
+            "words": words[i],
+            "scenes": scenes[i],
+            "screen_time_s": round(eighths[i] * SECONDS_PER_EIGHTH, 1),
+        }
+        for i in range(n)
+    ]
+    characters.sort(key=lambda c: (-c["lines"], -c["scenes"], c["name"]))
+    return {
+        "scene_count": len(scene_rows),
+        "dialogue_lines": sum(lines),
+        "dialogue_words": total_words,
+        "estimated_runtime_s": round(total_eighths * SECONDS_PER_EIGHTH, 1),
+        "characters": characters,
+        # Indices in scenes/co_occurrence refer to this order
+        "character_index": names,
+        "scenes": scene_rows,
+        "co_occurrence": [list(matrix[i * n:(i + 1) * n]) for i in range(n)],
+    }
+
+
+class AnalyticsCache:
+    """Small thread-safe LRU of analysis results keyed by ``script_hash``."""
+
+    def __init__(self, max_entries: int = 64) -> None:
+        self.max_entries = max_entries
+        self._items: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            value = self._items.get(key)
+            if value is not None:
+                self._items.move_to_end(key)
+            return value
+
+    def put(self, key: str, value: Dict[str, Any]) -> None:
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+
+
+CACHE = AnalyticsCache(int(os.environ.get("SCREENPLAY_ANALYTICS_CACHE_SIZE", "64")))
+
+
+def analyze_cached(cards: Sequence["SceneCard"]) -> Tuple[Dict[str, Any], str, bool]:
+    """``(result, script hash, cache hit)``; results are shared, treat them as read-only."""
+    key = script_hash(cards)
+    result = CACHE.get(key)
+    if result is not None:
+        return result, key, True
+    result = analyze(cards)
+    CACHE.put(key, result)
+    return result, key, False
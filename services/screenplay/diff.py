@@ -0,0 +1,172 @@
+"""Scene-level diffing of two screenplay drafts.
+
+Each scene card is reduced to a content hash, and the two hash sequences are
+aligned with Myers' O(ND) algorithm. Scenes outside the alignment are then
+classified as follows:
+
+- moved: the same hash is deleted in one place and inserted in another
+- edited: a deleted and an inserted scene share a slug, or sit opposite
+  each other in the same replaced run
+- removed / added: everything else
+
+Only the edited scenes get a line diff, taken over their Fountain
+rendering with the same algorithm. Unchanged scenes are never rendered.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+from collections import defaultdict
+from typing import TYPE_CHECKING, Any, Dict, Hashable, List, Sequence, Tuple
+
+from services.screenplay.render import fountain_scene
+
+if TYPE_CHECKING:  # pragma: no cover
+    from services.screenplay.main import SceneCard
+
+Op = Tuple[str, int, int]  # (equal | delete | insert, old index, new index)
+
+
+def scene_hash(card: "SceneCard") -> str:
+    data = json.dumps(card.model_dump(), sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+def myers(a: Sequence[Hashable], b: Sequence[Hashable]) -> List[Op]:
+    """Shortest edit script turning ``a`` into ``b`` (Myers 1986, greedy forward pass)."""
+    n, m = len(a), len(b)
+    limit = n + m
+    offset = limit + 1
+    v = [0] * (2 * limit + 3)
+    trace: List[List[int]] = []
+    for d in range(limit + 1):
+        trace.append(v[:])
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and v[offset + k - 1] < v[offset + k + 1]):
+                x = v[offset + k + 1]
+            else:
+                x = v[offset + k - 1] + 1
+            y = x - k
+            while x < n and y < m and a[x] == b[y]:
+                x += 1
+                y += 1
+            v[offset + k] = x
+            if x >= n and y >= m:
+                return _backtrack(trace, offset, n, m, d)
+    return []  # pragma: no cover - d never exceeds n + m
+
+
+def _backtrack(trace: List[List[int]], offset: int, n: int, m: int, d_end: int) -> List[Op]:
+    ops: List[Op] = []
+    x, y = n, m
+    for d in range(d_end, 0, -1):
+        v = trace[d]
+        k = x - y
+        if k == -d or (k != d and v[offset + k - 1] < v[offset + k + 1]):
+            prev_k = k + 1
+        else:
+            prev_k = k - 1
+        prev_x = v[offset + prev_k]
+        prev_y = prev_x - prev_k
+        while x > prev_x and y > prev_y:
+            x -= 1
+            y -= 1
+            ops.append(("equal", x, y))
+        if x == prev_x:
+            y -= 1
+            ops.append(("insert", x, y))
+        else:
+            x -= 1
+            ops.append(("delete", x, y))
+    while x > 0 and y > 0:
+        x -= 1
+        y -= 1
+        ops.append(("equal", x, y))
+    ops.reverse()
+    return ops
+
+
+def line_diff(old: str, new: str) -> List[Dict[str, Any]]:
+    """Changed lines only; line numbers are 1-based in their own draft."""
+    a, b = old.split("\n"), new.split("\n")
+    out: List[Dict[str, Any]] = []
+    for op, i, j in myers(a, b):
+        if op == "delete":
+            out.append({"op": "delete", "old_line": i + 1, "text": a[i]})
+        elif op == "insert":
+            out.append({"op": "insert", "new_line": j + 1, "text": b[j]})
+    return out
+
+
+def diff_scripts(old: Sequence["SceneCard"], new: Sequence["SceneCard"]) -> Dict[str, Any]:
+    old_hashes = [scene_hash(c) for c in old]
+    new_hashes = [scene_hash(c) for c in new]
+    ops = myers(old_hashes, new_hashes)
+
+    # Replaced runs: consecutive deletes/inserts between two equal scenes
+    runs: List[Tuple[List[int], List[int]]] = []
+    unchanged = 0
+    current: Tuple[List[int], List[int]] = ([], [])
+    for op, i, j in ops:
+        if op == "equal":
+            unchanged += 1
+            if current[0] or current[1]:
+                runs.append(current)
+                current = ([], [])
+        elif op == "delete":
+            current[0].append(i)
+        else:
+            current[1].append(j)
+    if current[0] or current[1]:
+        runs.append(current)
+
+    deleted = [i for run in runs for i in run[0]]
+    inserted = [j for run in runs for j in run[1]]
+
+    # Moves: identical content on both sides of the edit script
+    by_hash: Dict[str, List[int]] = defaultdict(list)
+    for j in inserted:
+        by_hash[new_hashes[j]].append(j)
+    moved: Dict[int, int] = {}
+    for i in deleted:
+        candidates = by_hash.get(old_hashes[i])
+        if candidates:
+            moved[i] = candidates.pop(0)
+    moved_new = set(moved.values())
+
+    # Edits: same slug anywhere, otherwise positional within one replaced run
+    edited: Dict[int, int] = {}
+    free_new_by_slug: Dict[str, List[int]] = defaultdict(list)
+    for j in inserted:
+        if j not in moved_new:
+            free_new_by_slug[new[j].slug].append(j)
+    for i in deleted:
+        if i not in moved and free_new_by_slug.get(old[i].slug):
+            edited[i] = free_new_by_slug[old[i].slug].pop(0)
+    paired_new = moved_new | set(edited.values())
+    for dels, ins in runs:
+        left = [i for i in dels if i not in moved and i not in edited]
+        right = [j for j in ins if j not in paired_new]
+        for i, j in zip(left, right):
+            edited[i] = j
+            paired_new.add(j)
+
+    changes: List[Dict[str, Any]] = []
+    for i, j in moved.items():
+        changes.append({"type": "moved", "slug": new[j].slug, "old_index": i, "new_index": j})
+    for i, j in edited.items():
+        changes.append({"type": "edited", "slug": new[j].slug, "old_slug": old[i].slug,
+                        "old_index": i, "new_index": j,
+                        "lines": line_diff(fountain_scene(old[i]), fountain_scene(new[j]))})
+    for i in deleted:
+        if i not in moved and i not in edited:
+            changes.append({"type": "removed", "slug": old[i].slug, "old_index": i})
+    for j in inserted:
+        if j not in paired_new:
+            changes.append({"type": "added", "slug": new[j].slug, "new_index": j})
+    changes.sort(key=lambda c: (c.get("new_index", c.get("old_index")), "old_index" not in c))
+
+    summary = {"unchanged": unchanged, "moved": len(moved), "edited": len(edited),
+               "removed": sum(1 for c in changes if c["type"] == "removed"),
+               "added": sum(1 for c in changes if c["type"] == "added")}
+    return {"old_scenes": len(old), "new_scenes": len(new), "summary": summary, "changes": changes}
@@ -0,0 +1,349 @@
+"""Streaming Fountain and FDX import into SceneCards.
+
+Both parsers are fed the document in chunks and yield scene cards as soon as
+a scene is complete, so the full script is never held in memory:
+
+- Fountain goes through a line-level state machine (title page, scene
+  headings, character cues, parentheticals, dialogue, action, transitions,
+  notes and boneyard).
+- FDX goes through ``xml.etree.ElementTree.XMLPullParser``; finished
+  ``<Paragraph>`` elements are dropped from the tree as they are consumed.
+
+Cards are plain dicts shaped like ``SceneCard`` (heading → where/when,
+character cues → who, dialogue lines → dialogue) and are serialised as
+NDJSON by the import endpoint.
+"""
+from __future__ import annotations
+
+import codecs
+import json
+import re
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+from xml.etree.ElementTree import XMLPullParser
+
+IMPORT_FORMATS = ("fountain", "fdx")
+
+_HEADING_RE = re.compile(r"^(?:INT\.?/EXT|EXT\.?/INT|I/E|INT|EXT|EST)[\s.]", re.IGNORECASE)
+_HEADING_PARTS_RE = re.compile(
+    r"^(?P<ie>INT\.?/EXT\.?|EXT\.?/INT\.?|I/E\.?|INT\.?|EXT\.?|EST\.?)\s*(?P<where>.*?)"
+    r"(?:\s+-+\s+(?P<time>[^-]+?))?(?:\s+#[^#]*#)?\s*$",
+    re.IGNORECASE,
+)
+_EXTENSION_RE = re.compile(r"\s*\((?:[^)]*)\)\s*$")
+_NOTE_RE = re.compile(r"\[\[.*?\]\]")
+_TRANSITION_RE = re.compile(r"^[A-Z0-9 .'\-]+TO:$")
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s")
+_TITLE_KEY_RE = re.compile(r"^[A-Za-z][A-Za-z ]*:")
+
+MAX_WHERE = 200
+MAX_GOAL = 500
+MAX_SLUG = 100
+
+
+def parse_heading(text: str) -> Dict[str, Any]:
+    """``INT. HARBOR - NIGHT`` → ``{"where": "HARBOR", "when": {"time": "NIGHT", "int_ext": "INT"}}``."""
+    text = text.strip()
+    m = _HEADING_PARTS_RE.match(text)
+    if not m:
+        return {"where": text[:MAX_WHERE] or "UNKNOWN", "when": None}
+    where = (m.group("where") or "").strip(" .-") or "UNKNOWN"
+    when = {"int_ext": m.group("ie").rstrip(".").upper()}
+    if m.group("time"):
+        when["time"] = m.group("time").strip()
+    return {"where": where[:MAX_WHERE], "when": when}
+
+
+def _character_name(cue: str) -> str:
+    name = cue.strip().lstrip("@").rstrip("^").strip()
+    while True:
+        stripped = _EXTENSION_RE.sub("", name)
+        if stripped == name:
+            return name.upper()
+        name = stripped
+
+
+class SceneBuilder:
+    """Accumulates one scene and turns it into a SceneCard-shaped dict."""
+
+    def __init__(self, number: int, heading: str) -> None:
+        self.number = number
+        self.heading = heading
+        self.action: List[str] = []
+        self.dialogue: List[Dict[str, str]] = []
+        self.who: Dict[str, None] = {}
+
+    def add_action(self, text: str) -> None:
+        text = text.strip()
+        if text:
+            self.action.append(text)
+
+    def add_line(self, character: str, text: str) -> None:
+        self.who.setdefault(character, None)
+        self.dialogue.append({"character": character, "text": text})
+
+    def card(self) -> Dict[str, Any]:
+        action = "\n\n".join(self.action)
+        first = _SENTENCE_RE.split(self.action[0], 1)[0] if self.action else self.heading
+        return {
+            "slug": f"scene_{self.number}"[:MAX_SLUG],
+            **parse_heading(self.heading),
+            "who": list(self.who) or ["UNKNOWN"],
+            "goal": (first or "UNKNOWN")[:MAX_GOAL],
+            "dialogue": self.dialogue or None,
+            "action": action or None,
+        }
+
+
+# ---- Fountain ----
+
+class FountainParser:
+    """Incremental Fountain parser: ``feed`` text, iterate the scenes it completes."""
+
+    def __init__(self) -> None:
+        self._decoder = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+        self._tail = ""
+        self._scene: Optional[SceneBuilder] = None
+        self._count = 0
+        self._in_title_page = True
+        self._in_boneyard = False
+        self._prev_blank = True
+        self._pending_cue: Optional[str] = None  # uppercase line that may be a character cue
+        self._speaker: Optional[str] = None       # inside a dialogue block
+        self._speech: List[str] = []
+        self._paragraph: List[str] = []
+
+    def feed(self, data: bytes) -> Iterator[Dict[str, Any]]:
+        text = self._tail + self._decoder.decode(data)
+        lines = text.split("\n")
+        self._tail = lines.pop()
+        for line in lines:
+            yield from self._line(line.rstrip("\r"))
+
+    def close(self) -> Iterator[Dict[str, Any]]:
+        rest = self._tail + self._decoder.decode(b"", final=True)
+        self._tail = ""
+        if rest:
+            yield from self._line(rest.rstrip("\r"))
+        yield from self._line("")
+        yield from self._end_scene()
+
+    # -- state machine --
+
+    def _end_scene(self) -> Iterator[Dict[str, Any]]:
+        self._flush_paragraph()
+        if self._scene is not None:
+            yield self._scene.card()
+            self._scene = None
+
+    def _flush_speech(self) -> None:
+        if self._speaker is not None and self._scene is not None:
+            text = " ".join(self._speech).strip()
+            if text:
+                self._scene.add_line(self._speaker, text)
+        self._speaker = None
+        self._speech = []
+
+    def _flush_paragraph(self) -> None:
+        self._flush_speech()
+        if self._pending_cue is not None:
+            # An uppercase line followed by a blank is action, not a cue
+            self._paragraph.append(self._pending_cue)
+            self._pending_cue = None
+        if self._paragraph and self._scene is not None:
+            self._scene.add_action("\n".join(self._paragraph))
+        self._paragraph = []
+
+    def _line(self, raw: str) -> Iterator[Dict[str, Any]]:
+        line = raw
+        if self._in_boneyard or "/*" in line:
+            line = self._strip_boneyard(line)
+            if line is None:
+                return
+        if "[[" in line:
+            line = _NOTE_RE.sub("", line)
+        stripped = line.strip()
+
+        if self._in_title_page:
+            if stripped and (_TITLE_KEY_RE.match(stripped) or raw[:1] in (" ", "\t")):
+                return
+            self._in_title_page = False
+            if not stripped:
+                return
+
+        if not stripped:
+            self._flush_paragraph()
+            self._prev_blank = True
+            return
+
+        if self._speaker is not None:
+            if not (stripped.startswith("(") and stripped.endswith(")")):
+                self._speech.append(stripped)
+            self._prev_blank = False
+            return
+
+        if self._pending_cue is not None:
+            # The line after a cue starts its dialogue
+            self._speaker = _character_name(self._pending_cue)
+            self._pending_cue = None
+            self._ensure_scene()
+            if not (stripped.startswith("(") and stripped.endswith(")")):
+                self._speech.append(stripped)
+            self._prev_blank = False
+            return
+
+        if self._prev_blank and self._is_heading(stripped):
+            yield from self._end_scene()
+            self._count += 1
+            heading = stripped[1:] if stripped.startswith(".") else stripped
+            self._scene = SceneBuilder(self._count, heading.strip())
+            self._prev_blank = False
+            return
+
+        if stripped.startswith(("#", "=")) or (stripped.startswith(">") and not stripped.endswith("<")):
+            # Sections, synopses, page breaks and transitions carry no scene content
+            self._prev_blank = False
+            return
+        if self._prev_blank and _TRANSITION_RE.match(stripped):
+            self._prev_blank = False
+            return
+
+        if self._prev_blank and self._is_cue(stripped):
+            self._pending_cue = stripped
+            self._prev_blank = False
+            return
+
+        if stripped.startswith("!"):
+            stripped = stripped[1:]
+        elif stripped.startswith(">") and stripped.endswith("<"):
+            stripped = stripped[1:-1].strip()
+        self._paragraph.append(stripped)
+        self._prev_blank = False
+
+    def _ensure_scene(self) -> None:
+        if self._scene is None:
+            # Dialogue before any heading still needs a scene to live in
+            self._count += 1
+            self._scene = SceneBuilder(self._count, "UNKNOWN")
+
+    def _strip_boneyard(self, line: str) -> Optional[str]:
+        out = []
+        i = 0
+        while i < len(line):
+            if self._in_boneyard:
+                end = line.find("*/", i)
+                if end < 0:
+                    break
+                self._in_boneyard = False
+                i = end + 2
+            else:
+                start = line.find("/*", i)
+                if start < 0:
+                    out.append(line[i:])
+                    break
+                out.append(line[i:start])
+                self._in_boneyard = True
+                i = start + 2
+        text = "".join(out)
+        return text if text.strip() or not self._in_boneyard else None
+
+    @staticmethod
+    def _is_heading(line: str) -> bool:
+        if line.startswith("."):
+            return len(line) > 1 and line[1] != "."
+        return bool(_HEADING_RE.match(line))
+
+    @staticmethod
+    def _is_cue(line: str) -> bool:
+        if line.startswith("@"):
+            return True
+        name = _EXTENSION_RE.sub("", line).rstrip("^").strip()
+        return any(c.isalpha() for c in name) and name == name.upper() and not line.endswith(":")
+
+
+# ---- FDX ----
+
+class FdxParser:
+    """Incremental Final Draft XML parser built on ``XMLPullParser``."""
+
+    def __init__(self) -> None:
+        self._parser = XMLPullParser(events=("start", "end"))
+        self._scene: Optional[SceneBuilder] = None
+        self._count = 0
+        self._speaker: Optional[str] = None
+        self._title_depth = 0
+        self._containers: List[Any] = []
+
+    def feed(self, data: bytes) -> Iterator[Dict[str, Any]]:
+        self._parser.feed(data)
+        yield from self._drain()
+
+    def close(self) -> Iterator[Dict[str, Any]]:
+        self._parser.close()
+        yield from self._drain()
+        if self._scene is not None:
+            yield self._scene.card()
+            self._scene = None
+
+    def _drain(self) -> Iterator[Dict[str, Any]]:
+        for event, elem in self._parser.read_events():
+            tag = elem.tag
+            if event == "start":
+                if tag == "TitlePage":
+                    self._title_depth += 1
+                elif tag == "Content":
+                    self._containers.append(elem)
+                continue
+            if tag == "TitlePage":
+                self._title_depth -= 1
+            elif tag == "Content":
+                self._containers.pop()
+            elif tag == "Paragraph":
+                if not self._title_depth:
+                    yield from self._paragraph(elem.get("Type", ""), "".join(elem.itertext()).strip())
+                # Drop finished paragraphs so memory stays flat
+                if self._containers:
+                    self._containers[-1].clear()
+
+    def _paragraph(self, kind: str, text: str) -> Iterator[Dict[str, Any]]:
+        if kind == "Scene Heading":
+            if self._scene is not None:
+                yield self._scene.card()
+            self._count += 1
+            self._scene = SceneBuilder(self._count, text)
+            self._speaker = None
+            return
+        if self._scene is None:
+            if not text or kind in ("Transition", "General"):
+                return
+            self._count += 1
+            self._scene = SceneBuilder(self._count, "UNKNOWN")
+        if kind == "Character":
+            self._speaker = _character_name(text)
+        elif kind == "Dialogue" and self._speaker:
+            self._scene.add_line(self._speaker, text)
+        elif kind == "Parenthetical":
+            pass
+        elif kind in ("Action", "General", "Shot"):
+            self._speaker = None
+            self._scene.add_action(text)
+        else:
+            self._speaker = None
+
+
+def make_parser(fmt: str):
+    if fmt == "fountain":
+        return FountainParser()
+    if fmt == "fdx":
+        return FdxParser()
+    raise ValueError(f"Unsupported import format: {fmt}. Must be one of: {', '.join(IMPORT_FORMATS)}")
+
+
+def iter_cards(chunks: Iterable[bytes], fmt: str) -> Iterator[Dict[str, Any]]:
+    parser = make_parser(fmt)
+    for chunk in chunks:
+        yield from parser.feed(chunk)
+    yield from parser.close()
+
+
+def ndjson_line(obj: Dict[str, Any]) -> bytes:
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8") + b"\n"
@@ -1,17 +1,36 @@
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from pydantic import BaseModel, Field, field_validator
 from typing import List, Optional, Dict, Any
 from services.common.envelope import envelope_ok, envelope_error
+from services.common.artifacts import artifact_response, etag_for, fingerprint, get_artifact_store
+from services.screenplay import analytics, diff, importer, pdf, render
 import os
+import re
 import json
+import asyncio
 import logging
+import tempfile
+import time
+import zipfile
+import threading
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
+from contextlib import asynccontextmanager
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="StoryMaker Screenplay", version="1.6.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    try:
+        yield
+    finally:
+        _shutdown_pool()
+
+app = FastAPI(title="StoryMaker Screenplay", version="1.6.0", lifespan=lifespan)
 
 # Add CORS middleware
 app.add_middleware(
@@ -57,6 +76,30 @@ class ExportReq(BaseModel):
             raise ValueError(f"Invalid format. Must be one of: {', '.join(SUPPORTED_FORMATS)}")
         return v
 
+class BundleReq(BaseModel):
+    cards: List[SceneCard] = Field(..., min_length=1, description="Scene cards to export")
+    formats: List[str] = Field(default_factory=lambda: list(SUPPORTED_FORMATS), min_length=1,
+                               description="Export formats to render")
+    title: Optional[str] = Field(None, max_length=200, description="Screenplay title")
+    author: Optional[str] = Field(None, max_length=200, description="Author name")
+    version: Optional[str] = Field("1.0", description="Version number")
+    zip: bool = Field(False, description="Also store the bundle as a single zip artifact")
+    
+    @field_validator('formats')
+    @classmethod
+    def validate_formats(cls, v):
+        unknown = [f for f in v if f not in SUPPORTED_FORMATS]
+        if unknown:
+            raise ValueError(f"Invalid format(s) {unknown}. Must be one of: {', '.join(SUPPORTED_FORMATS)}")
+        return list(dict.fromkeys(v))
+
+class AnalyticsReq(BaseModel):
+    cards: List[SceneCard] = Field(..., min_length=1, description="Scene cards to analyse")
+
+class DiffReq(BaseModel):
+    old: List[SceneCard] = Field(..., description="Scene cards of the earlier draft")
+    new: List[SceneCard] = Field(..., description="Scene cards of the later draft")
+
 class Scene(BaseModel):
     number: int
     heading: str
@@ -69,35 +112,220 @@ def health():
     """Health check endpoint"""
     return envelope_ok({"ok": True}, {"actor": "api"})
 
+EXPORT_REF_NAMESPACE = "screenplay-export"
+
+# Formats whose rendering is CPU-bound run in worker processes, off the event loop
+POOL_FORMATS = {"pdf"}
+
+RENDER_WORKERS = int(os.environ.get("SCREENPLAY_RENDER_WORKERS", "2"))
+# Jobs admitted to the pool (running + waiting); beyond this, exports are shed
+RENDER_QUEUE_SIZE = int(os.environ.get("SCREENPLAY_RENDER_QUEUE", str(RENDER_WORKERS * 4)))
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_slots = threading.BoundedSemaphore(RENDER_QUEUE_SIZE)
+
+class RenderQueueFull(RuntimeError):
+    pass
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # spawn: forking a process that already runs threads is unsafe
+        _pool = ProcessPoolExecutor(max_workers=RENDER_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+def _submit_render(req: ExportReq) -> Future:
+    """Render ``req`` in a worker process; raises RenderQueueFull instead of queueing without bound"""
+    if not _pool_slots.acquire(blocking=False):
+        raise RenderQueueFull(f"render queue is full ({RENDER_QUEUE_SIZE} jobs)")
+    try:
+        future = _get_pool().submit(render.render_bytes, req)
+    except BaseException:
+        _pool_slots.release()
+        raise
+    future.add_done_callback(lambda _: _pool_slots.release())
+    return future
+
+def _shutdown_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(cancel_futures=True)
+        _pool = None
+
+def _export_ref(req: ExportReq) -> str:
+    return fingerprint({"renderer_version": render.RENDERER_VERSION, "request": req.model_dump()})
+
+def _remember(store, ref: str, info: Dict[str, Any]) -> Dict[str, Any]:
+    stored = {"id": info["id"], "size_bytes": info["size_bytes"], "deduplicated": info["deduplicated"],
+              "created_at": datetime.now().isoformat()}
+    store.set_ref(EXPORT_REF_NAMESPACE, ref, stored)
+    return stored
+
+def _store_export(req: ExportReq, cache_stats: Dict[str, int]):
+    """Stored artifact for ``req``, rendering it only when no identical export exists"""
+    store = get_artifact_store()
+    ref = _export_ref(req)
+    stored = store.get_ref(EXPORT_REF_NAMESPACE, ref)
+    if stored is not None:
+        return stored, True
+    if req.format in POOL_FORMATS:
+        data = _submit_render(req).result()
+        return _remember(store, ref, store.put_bytes(data, render.media_type(req.format))), False
+    # Render straight into the content-addressed store (no full copy in memory)
+    info = store.put_chunks(render.encode_chunks(render.render(req, cache_stats)),
+                            media_type=render.media_type(req.format))
+    return _remember(store, ref, info), False
+
+async def _store_export_async(req: ExportReq, cache_stats: Dict[str, int]):
+    if req.format not in POOL_FORMATS:
+        return await asyncio.to_thread(_store_export, req, cache_stats)
+    store = get_artifact_store()
+    ref = _export_ref(req)
+    stored = store.get_ref(EXPORT_REF_NAMESPACE, ref)
+    if stored is not None:
+        return stored, True
+    data = await asyncio.wrap_future(_submit_render(req))
+    info = await asyncio.to_thread(store.put_bytes, data, render.media_type(req.format))
+    return _remember(store, ref, info), False
+
+def _artifact(req: ExportReq, stored: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "type": req.format,
+        "id": stored["id"],
+        "uri": f"asset://screenplays/{stored['id']}",
+        "download_url": f"/screenplay/artifacts/{stored['id']}",
+        "etag": etag_for(stored["id"]),
+        "size_bytes": stored["size_bytes"],
+        "created_at": stored["created_at"],
+        "title": req.title or "Untitled Screenplay",
+        "author": req.author or "Unknown",
+        "version": req.version,
+        "scene_count": len(req.cards)
+    }
+
 @app.post("/screenplay/export")
 def export(req: ExportReq):
     """Export screenplay in specified format"""
     try:
-        # Generate screenplay content
-        screenplay_content = generate_screenplay_content(req)
+        # Unchanged scenes come from the fragment cache; only edited ones are rendered
+        cache_stats = {"hits": 0, "misses": 0}
+        stored, reused = _store_export(req, cache_stats)
         
-        # Create artifact metadata
-        artifact = {
-            "type": req.format,
-            "uri": f"asset://screenplays/{req.title or 'untitled'}/script.{req.format}",
-            "size_bytes": len(screenplay_content.encode('utf-8')),
-            "created_at": datetime.now().isoformat(),
+        return envelope_ok({"artifact": _artifact(req, stored)}, {
+            "actor": "ai",
+            "artifact_store": {"reused": reused, "deduplicated": bool(stored.get("deduplicated")) and not reused},
+            "render_cache": {**cache_stats, "entries": render.SCENE_CACHE.stats()["entries"],
+                             "renderer_version": render.RENDERER_VERSION},
+        })
+        
+    except RenderQueueFull as e:
+        return JSONResponse(status_code=503, content=envelope_error(
+            "RENDER_QUEUE_FULL", "Too many exports in progress, retry shortly", {"detail": str(e)}, {"actor": "ai"}))
+    except Exception as e:
+        logger.error(f"Failed to export screenplay: {e}")
+        return envelope_error("EXPORT_FAILED", "Failed to export screenplay", 
+                            {"detail": str(e)}, {"actor": "ai"})
+
+def _zip_bundle(manifest: Dict[str, Any]) -> Dict[str, Any]:
+    """Store every artifact in the manifest (plus the manifest itself) as one zip"""
+    store = get_artifact_store()
+    stem = re.sub(r"[^A-Za-z0-9_.-]+", "_", manifest["title"]).strip("_") or "screenplay"
+    with tempfile.TemporaryFile() as tmp:
+        with zipfile.ZipFile(tmp, "w", zipfile.ZIP_DEFLATED) as zf:
+            for artifact in manifest["artifacts"]:
+                zf.write(store.path(artifact["id"]), arcname=f"{stem}.{artifact['type']}")
+            zf.writestr("manifest.json", json.dumps(manifest, indent=2))
+        tmp.seek(0)
+        info = store.put_chunks(iter(lambda: tmp.read(64 * 1024), b""), media_type="application/zip")
+    return {"type": "zip", "id": info["id"], "download_url": f"/screenplay/artifacts/{info['id']}",
+            "etag": etag_for(info["id"]), "size_bytes": info["size_bytes"]}
+
+@app.post("/screenplay/export/bundle")
+async def export_bundle(req: BundleReq):
+    """Render several formats from one validated request, concurrently"""
+    try:
+        # The request was validated once; per-format requests skip re-validation
+        reqs = [ExportReq.model_construct(cards=req.cards, format=fmt, title=req.title,
+                                          author=req.author, version=req.version)
+                for fmt in req.formats]
+        stats = [{"hits": 0, "misses": 0} for _ in reqs]
+        results = await asyncio.gather(*(_store_export_async(r, st) for r, st in zip(reqs, stats)))
+        
+        manifest = {
             "title": req.title or "Untitled Screenplay",
             "author": req.author or "Unknown",
             "version": req.version,
-            "scene_count": len(req.cards)
+            "scene_count": len(req.cards),
+            "artifacts": [_artifact(r, stored) for r, (stored, _) in zip(reqs, results)],
         }
+        if req.zip:
+            manifest["zip"] = await asyncio.to_thread(_zip_bundle, manifest)
         
-        # Store content (in real implementation, this would save to MinIO)
-        # For now, we'll just return the metadata
-        
-        return envelope_ok({"artifact": artifact}, {"actor": "ai"})
+        return envelope_ok({"bundle": manifest}, {
+            "actor": "ai",
+            "formats": {r.format: {"reused": reused, **st} for r, (_, reused), st in zip(reqs, results, stats)},
+        })
         
+    except RenderQueueFull as e:
+        return JSONResponse(status_code=503, content=envelope_error(
+            "RENDER_QUEUE_FULL", "Too many exports in progress, retry shortly", {"detail": str(e)}, {"actor": "ai"}))
     except Exception as e:
-        logger.error(f"Failed to export screenplay: {e}")
-        return envelope_error("EXPORT_FAILED", "Failed to export screenplay", 
+        logger.error(f"Failed to export screenplay bundle: {e}")
+        return envelope_error("EXPORT_FAILED", "Failed to export screenplay bundle",
                             {"detail": str(e)}, {"actor": "ai"})
 
+@app.post("/screenplay/import")
+async def import_script(request: Request, format: str = "fountain"):
+    """Parse a Fountain/FDX request body into SceneCards, streamed back as NDJSON (one per scene)"""
+    if format not in importer.IMPORT_FORMATS:
+        return JSONResponse(status_code=422, content=envelope_error(
+            "INVALID_FORMAT", f"Invalid format. Must be one of: {', '.join(importer.IMPORT_FORMATS)}",
+            {"format": format}, {"actor": "api"}))
+
+    # Spool the upload (memory up to 1 MiB, then disk): the response stream may not
+    # read the request body concurrently, and the script should never sit in memory whole
+    spool = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+    async for chunk in request.stream():
+        spool.write(chunk)
+    spool.seek(0)
+
+    def cards():
+        try:
+            for card in importer.iter_cards(iter(lambda: spool.read(64 * 1024), b""), format):
+                yield importer.ndjson_line(SceneCard.model_validate(card).model_dump(exclude_defaults=True))
+        except Exception as e:
+            # Headers are already sent; report the failure as the final record
+            logger.error(f"Failed to import screenplay: {e}")
+            yield importer.ndjson_line(envelope_error("IMPORT_FAILED", "Failed to import screenplay",
+                                                      {"detail": str(e)}, {"actor": "api"}))
+        finally:
+            spool.close()
+
+    return StreamingResponse(cards(), media_type="application/x-ndjson")
+
+@app.get("/screenplay/artifacts/{artifact_id}")
+def get_artifact(artifact_id: str, request: Request):
+    """Serve a stored export; supports Range requests and conditional GETs"""
+    return artifact_response(get_artifact_store(), artifact_id, request)
+
+@app.post("/screenplay/export/stream")
+def export_stream(req: ExportReq):
+    """Stream the rendered screenplay with chunked transfer encoding"""
+    filename = f"{req.title or 'untitled'}.{req.format}".replace('"', "")
+    if req.format in POOL_FORMATS:
+        try:
+            data = _submit_render(req).result()
+        except RenderQueueFull as e:
+            return JSONResponse(status_code=503, content=envelope_error(
+                "RENDER_QUEUE_FULL", "Too many exports in progress, retry shortly", {"detail": str(e)}, {"actor": "ai"}))
+        return Response(content=data, media_type=render.media_type(req.format),
+                        headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+    return StreamingResponse(
+        render.encode_chunks(render.render(req)),
+        media_type=render.media_type(req.format),
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
 @app.post("/screenplay/format")
 def format_scenes(req: ExportReq):
     """Format scene cards into screenplay format"""
@@ -140,7 +368,8 @@ def format_scenes(req: ExportReq):
         return envelope_ok({
             "scenes": [scene.model_dump() for scene in formatted_scenes],
             "total_scenes": len(formatted_scenes),
-            "total_pages": estimate_page_count(formatted_scenes)
+            # Same paginator as the PDF export, so this matches the rendered page count
+            "total_pages": pdf.page_count(req)
         }, {"actor": "ai"})
         
     except Exception as e:
@@ -148,6 +377,35 @@ def format_scenes(req: ExportReq):
         return envelope_error("FORMAT_FAILED", "Failed to format scenes", 
                             {"detail": str(e)}, {"actor": "ai"})
 
+@app.post("/screenplay/analytics")
+def script_analytics(req: AnalyticsReq):
+    """Per-character dialogue counts, scene co-occurrence and estimated screen time"""
+    try:
+        started = time.perf_counter()
+        result, script_hash, hit = analytics.analyze_cached(req.cards)
+        return envelope_ok(result, {
+            "actor": "ai",
+            "script_hash": script_hash,
+            "cache": {"hit": hit},
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 3),
+        })
+    except Exception as e:
+        logger.error(f"Failed to analyse screenplay: {e}")
+        return envelope_error("ANALYTICS_FAILED", "Failed to analyse screenplay",
+                            {"detail": str(e)}, {"actor": "ai"})
+
+@app.post("/screenplay/diff")
+def diff_drafts(req: DiffReq):
+    """Scene-level diff of two drafts: added, removed, moved and edited scenes"""
+    try:
+        started = time.perf_counter()
+        result = diff.diff_scripts(req.old, req.new)
+        return envelope_ok(result, {"actor": "ai", "elapsed_ms": round((time.perf_counter() - started) * 1000, 3)})
+    except Exception as e:
+        logger.error(f"Failed to diff screenplay drafts: {e}")
+        return envelope_error("DIFF_FAILED", "Failed to diff screenplay drafts",
+                            {"detail": str(e)}, {"actor": "ai"})
+
 @app.get("/screenplay/formats")
 def get_formats():
     """Get supported export formats"""
@@ -182,156 +440,28 @@ def get_formats():
 
 def generate_screenplay_content(req: ExportReq) -> str:
     """Generate screenplay content in the requested format"""
-    if req.format == "fountain":
-        return generate_fountain_content(req)
-    elif req.format == "fdx":
-        return generate_fdx_content(req)
-    elif req.format == "html":
-        return generate_html_content(req)
-    else:
-        return generate_plain_text_content(req)
+    return "".join(render.render(req))
 
 def generate_fountain_content(req: ExportReq) -> str:
     """Generate Fountain format content"""
-    content = []
-    
-    # Title page
-    if req.title:
-        content.append(f"Title: {req.title}")
-    if req.author:
-        content.append(f"Author: {req.author}")
-    content.append("")
-    
-    # Scenes
-    for i, card in enumerate(req.cards, 1):
-        # Scene heading
-        heading = f"INT. {card.where.upper()} - {card.when.get('time', 'DAY') if card.when else 'DAY'}"
-        content.append(heading)
-        content.append("")
-        
-        # Action
-        if card.action:
-            content.append(card.action)
-        else:
-            content.append(f"{', '.join(card.who)} {card.goal.lower()}.")
-        
-        if card.conflict_or_twist:
-            content.append(card.conflict_or_twist)
-        
-        content.append("")
-        
-        # Dialogue
-        if card.dialogue:
-            for line in card.dialogue:
-                character = line.get('character', 'UNKNOWN')
-                text = line.get('text', '')
-                content.append(f"{character.upper()}")
-                content.append(text)
-                content.append("")
-    
-    return "\n".join(content)
+    return "".join(render.render_fountain(req))
 
 def generate_fdx_content(req: ExportReq) -> str:
     """Generate Final Draft XML content"""
-    # Simplified FDX structure
-    content = f"""<?xml version="1.0" encoding="UTF-8"?>
-<FinalDraft DocumentType="Script" Template="No" Version="1">
-    <Content>
-        <TitlePage>
-            <Title>{req.title or 'Untitled'}</Title>
-            <Author>{req.author or 'Unknown'}</Author>
-        </TitlePage>
-"""
-    
-    for i, card in enumerate(req.cards, 1):
-        content += f"""        <Paragraph Type="Scene Heading">
-            <Text>INT. {card.where.upper()} - {card.when.get('time', 'DAY') if card.when else 'DAY'}</Text>
-        </Paragraph>
-        <Paragraph Type="Action">
-            <Text>{card.action or f"{', '.join(card.who)} {card.goal.lower()}."}</Text>
-        </Paragraph>
-"""
-        
-        if card.dialogue:
-            for line in card.dialogue:
-                character = line.get('character', 'UNKNOWN')
-                text = line.get('text', '')
-                content += f"""        <Paragraph Type="Character">
-            <Text>{character.upper()}</Text>
-        </Paragraph>
-        <Paragraph Type="Dialogue">
-            <Text>{text}</Text>
-        </Paragraph>
-"""
-    
-    content += """    </Content>
-</FinalDraft>"""
-    return content
+    return "".join(render.render_fdx(req))
 
 def generate_html_content(req: ExportReq) -> str:
     """Generate HTML format content"""
-    content = f"""<!DOCTYPE html>
-<html>
-<head>
-    <title>{req.title or 'Untitled Screenplay'}</title>
-    <style>
-        body {{ font-family: 'Courier New', monospace; margin: 40px; }}
-        .scene-heading {{ text-transform: uppercase; font-weight: bold; margin-top: 20px; }}
-        .action {{ margin: 10px 0; }}
-        .character {{ text-transform: uppercase; font-weight: bold; margin-left: 40px; }}
-        .dialogue {{ margin-left: 60px; margin-bottom: 10px; }}
-    </style>
-</head>
-<body>
-    <h1>{req.title or 'Untitled Screenplay'}</h1>
-    <p>By {req.author or 'Unknown'}</p>
-    <hr>
-"""
-    
-    for i, card in enumerate(req.cards, 1):
-        content += f"""    <div class="scene-heading">INT. {card.where.upper()} - {card.when.get('time', 'DAY') if card.when else 'DAY'}</div>
-    <div class="action">{card.action or f"{', '.join(card.who)} {card.goal.lower()}."}</div>
-"""
-        
-        if card.dialogue:
-            for line in card.dialogue:
-                character = line.get('character', 'UNKNOWN')
-                text = line.get('text', '')
-                content += f"""    <div class="character">{character.upper()}</div>
-    <div class="dialogue">{text}</div>
-"""
-    
-    content += """</body>
-</html>"""
-    return content
+    return "".join(render.render_html(req))
 
 def generate_plain_text_content(req: ExportReq) -> str:
     """Generate plain text content"""
-    content = []
-    
-    if req.title:
-        content.append(f"TITLE: {req.title}")
-    if req.author:
-        content.append(f"AUTHOR: {req.author}")
-    content.append("")
-    
-    for i, card in enumerate(req.cards, 1):
-        content.append(f"SCENE {i}")
-        content.append(f"INT. {card.where.upper()} - {card.when.get('time', 'DAY') if card.when else 'DAY'}")
-        content.append("")
-        content.append(card.action or f"{', '.join(card.who)} {card.goal.lower()}.")
-        content.append("")
-        
-        if card.dialogue:
-            for line in card.dialogue:
-                character = line.get('character', 'UNKNOWN')
-                text = line.get('text', '')
-                content.append(f"{character.upper()}: {text}")
-            content.append("")
-    
-    return "\n".join(content)
+    return "".join(render.render_plain(req))
 
 def estimate_page_count(scenes: List[Scene]) -> int:
-    """Estimate page count (roughly 1 page per minute of screen time)"""
+    """Estimate page count (roughly 1 page per minute of screen time)
+
+    Rough heuristic only; /screenplay/format reports exact counts via pdf.page_count.
+    """
     # Simple estimation: 1 scene ≈ 2-3 minutes ≈ 2-3 pages
     return max(1, len(scenes) * 2)
@@ -0,0 +1,249 @@
+"""Screenplay PDF layout and writer.
+
+Pages are US Letter set in Courier 12pt: 10 characters per inch and 6 lines
+per inch, so with 1" top and bottom margins a page holds 54 lines. Element
+margins follow the usual screenplay conventions (scene headings and action
+at 1.5", dialogue at 2.5", character cues at 3.7"). The paginator keeps
+scene headings with what follows, avoids one-line orphans and widows, and
+splits long speeches with (MORE) / (CONT'D). ``page_count`` uses the same
+paginator, so reported page counts match the rendered PDF exactly.
+
+The writer emits PDF 1.4 directly using the built-in Courier font; no
+third-party dependency is needed.
+"""
+from __future__ import annotations
+
+import textwrap
+import zlib
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, List, Optional, Tuple
+
+from services.screenplay.render import action_text, scene_heading
+
+if TYPE_CHECKING:  # pragma: no cover
+    from services.screenplay.main import ExportReq, SceneCard
+
+PAGE_WIDTH_PT = 612   # 8.5in
+PAGE_HEIGHT_PT = 792  # 11in
+FONT_SIZE = 12
+LINE_HEIGHT_PT = 12   # 6 lines per inch
+TOP_MARGIN_IN = 1.0
+LINES_PER_PAGE = 54   # 9in of text at 6 lines per inch
+PAGE_NUMBER_RIGHT_IN = 7.5
+PAGE_NUMBER_TOP_IN = 0.5
+
+# Left edge (inches) and width (characters at 10 cpi) per element
+MARGINS = {
+    "heading": (1.5, 60),
+    "action": (1.5, 60),
+    "character": (3.7, 38),
+    "dialogue": (2.5, 35),
+    "more": (3.7, 38),
+}
+
+Row = Optional[Tuple[str, str]]  # (element kind, text); None is a blank line
+
+
+@dataclass
+class Block:
+    kind: str              # heading | action | speech
+    lines: List[Row]
+    space_before: int = 1
+    character: str = ""    # speaker, for (CONT'D) when a speech is split
+
+
+def _wrap(text: str, kind: str) -> List[str]:
+    width = MARGINS[kind][1]
+    out: List[str] = []
+    for para in text.split("\n"):
+        out.extend(textwrap.wrap(para, width=width, break_long_words=True, break_on_hyphens=False) or [""])
+    return out
+
+
+def layout_card(card: "SceneCard") -> List[Block]:
+    """One scene card as screenplay elements, wrapped to their column widths."""
+    blocks = [
+        Block("heading", [("heading", line) for line in _wrap(scene_heading(card), "heading")]),
+        Block("action", [("action", line) for line in _wrap(action_text(card), "action")]),
+    ]
+    if card.conflict_or_twist:
+        blocks.append(Block("action", [("action", line) for line in _wrap(card.conflict_or_twist, "action")]))
+    for line in card.dialogue or []:
+        character = line.get("character", "UNKNOWN").upper()
+        rows: List[Row] = [("character", character)]
+        rows.extend(("dialogue", text) for text in _wrap(line.get("text", ""), "dialogue"))
+        blocks.append(Block("speech", rows, character=character))
+    return blocks
+
+
+def layout(req: "ExportReq") -> List[Block]:
+    blocks: List[Block] = []
+    for card in req.cards:
+        blocks.extend(layout_card(card))
+    return blocks
+
+
+def scene_eighths(card: "SceneCard") -> int:
+    """Scene length in eighths of a page (the scheduling unit), at least 1/8."""
+    lines = sum(len(b.lines) + b.space_before for b in layout_card(card))
+    return max(1, round(lines * 8 / LINES_PER_PAGE))
+
+
+def _min_lead(block: Block) -> int:
+    """Lines of ``block`` that must share a page with a preceding scene heading."""
+    return min(len(block.lines), 3 if block.kind == "speech" else 2)
+
+
+def paginate(blocks: List[Block], lines_per_page: int = LINES_PER_PAGE) -> List[List[Row]]:
+    pages: List[List[Row]] = []
+    page: List[Row] = []
+
+    def new_page() -> None:
+        nonlocal page
+        pages.append(page)
+        page = []
+
+    for i, block in enumerate(blocks):
+        rows = list(block.lines)
+        first = True
+        while rows:
+            gap = block.space_before if (page and first) else 0
+            room = lines_per_page - len(page) - gap
+
+            if block.kind == "heading":
+                # Keep the heading with the start of what follows it
+                nxt = blocks[i + 1] if i + 1 < len(blocks) else None
+                need = len(rows) + ((nxt.space_before + _min_lead(nxt)) if nxt else 0)
+                if page and need > room:
+                    new_page()
+                    continue
+                page.extend([None] * gap + rows)
+                break
+
+            if len(rows) <= room:
+                page.extend([None] * gap + rows)
+                break
+
+            if block.kind == "speech":
+                # Room for the cue (or CONT'D cue), two lines and (MORE); leave two lines over
+                take = min(room - 1, len(rows) - 2)
+                if take < 3:
+                    if page:
+                        new_page()
+                        continue
+                    take = room - 1
+                page.extend([None] * gap + rows[:take] + [("more", "(MORE)")])
+                rows = [("character", f"{block.character} (CONT'D)")] + rows[take:]
+            else:
+                take = min(room, len(rows) - 2)
+                if take < 2:
+                    if page:
+                        new_page()
+                        continue
+                    take = room
+                page.extend([None] * gap + rows[:take])
+                rows = rows[take:]
+            first = False
+            new_page()
+
+    if page or not pages:
+        pages.append(page)
+    return pages
+
+
+def page_count(req: "ExportReq") -> int:
+    """Exact number of script pages (title page excluded)."""
+    return len(paginate(layout(req)))
+
+
+# ---- PDF writer ----
+
+def _pdf_text(text: str) -> bytes:
+    raw = text.encode("cp1252", errors="replace")
+    return raw.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)")
+
+
+def _text_op(x_pt: float, y_pt: float, text: str) -> bytes:
+    return b"1 0 0 1 %.2f %.2f Tm (%s) Tj\n" % (x_pt, y_pt, _pdf_text(text))
+
+
+def _baseline(row: int) -> float:
+    return PAGE_HEIGHT_PT - TOP_MARGIN_IN * 72 - LINE_HEIGHT_PT * row - 9
+
+
+def _page_stream(rows: List[Row], number: Optional[int]) -> bytes:
+    ops = [b"BT\n/F1 %d Tf\n" % FONT_SIZE]
+    if number is not None and number > 1:
+        label = f"{number}."
+        x = PAGE_NUMBER_RIGHT_IN * 72 - len(label) * FONT_SIZE * 0.6
+        ops.append(_text_op(x, PAGE_HEIGHT_PT - PAGE_NUMBER_TOP_IN * 72 - 9, label))
+    for i, row in enumerate(rows):
+        if row is None or not row[1]:
+            continue
+        kind, text = row
+        ops.append(_text_op(MARGINS[kind][0] * 72, _baseline(i), text))
+    ops.append(b"ET\n")
+    return b"".join(ops)
+
+
+def _title_page(title: Optional[str], author: Optional[str]) -> List[Row]:
+    # Title about a third of the way down, byline below it
+    rows: List[Row] = [None] * 20 + [("title", (title or "Untitled").upper())]
+    if author:
+        rows += [None, None, ("title", "written by"), None, ("title", author)]
+    return rows
+
+
+def _centered_stream(rows: List[Row]) -> bytes:
+    ops = [b"BT\n/F1 %d Tf\n" % FONT_SIZE]
+    for i, row in enumerate(rows):
+        if row is None or not row[1]:
+            continue
+        x = (PAGE_WIDTH_PT - len(row[1]) * FONT_SIZE * 0.6) / 2
+        ops.append(_text_op(x, _baseline(i), row[1]))
+    ops.append(b"ET\n")
+    return b"".join(ops)
+
+
+def write_pdf(pages: List[List[Row]], title: Optional[str] = None, author: Optional[str] = None,
+              title_page: bool = False) -> bytes:
+    """Serialise laid-out pages (plus an optional title page) as a PDF document."""
+    streams: List[bytes] = []
+    if title_page:
+        streams.append(_centered_stream(_title_page(title, author)))
+    streams.extend(_page_stream(rows, n) for n, rows in enumerate(pages, 1))
+
+    # Object numbers: 1 catalog, 2 pages, 3 font, 4 info, then (page, content) pairs
+    objects: List[bytes] = []
+    kids = " ".join(f"{5 + 2 * i} 0 R" for i in range(len(streams)))
+    objects.append(b"<< /Type /Catalog /Pages 2 0 R >>")
+    objects.append(f"<< /Type /Pages /Kids [{kids}] /Count {len(streams)} >>".encode())
+    objects.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /Courier /Encoding /WinAnsiEncoding >>")
+    objects.append(b"<< /Title (" + _pdf_text(title or "Untitled Screenplay") + b") /Author ("
+                   + _pdf_text(author or "Unknown") + b") /Producer (StoryMaker Screenplay) >>")
+    for i, stream in enumerate(streams):
+        content_ref = 6 + 2 * i
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {PAGE_WIDTH_PT} {PAGE_HEIGHT_PT}] "
+                       f"/Resources << /Font << /F1 3 0 R >> >> /Contents {content_ref} 0 R >>".encode())
+        packed = zlib.compress(stream)
+        objects.append(b"<< /Length %d /Filter /FlateDecode >>\nstream\n" % len(packed) + packed + b"\nendstream")
+
+    out = [b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n"]
+    offsets: List[int] = []
+    pos = len(out[0])
+    for num, body in enumerate(objects, 1):
+        chunk = b"%d 0 obj\n" % num + body + b"\nendobj\n"
+        offsets.append(pos)
+        out.append(chunk)
+        pos += len(chunk)
+    xref = [b"xref\n0 %d\n" % (len(objects) + 1), b"0000000000 65535 f \n"]
+    xref.extend(b"%010d 00000 n \n" % off for off in offsets)
+    out.extend(xref)
+    out.append(b"trailer\n<< /Size %d /Root 1 0 R /Info 4 0 R >>\nstartxref\n%d\n%%%%EOF\n"
+               % (len(objects) + 1, pos))
+    return b"".join(out)
+
+
+def render_pdf(req: "ExportReq") -> bytes:
+    pages = paginate(layout(req))
+    return write_pdf(pages, req.title, req.author, title_page=bool(req.title or req.author))
@@ -0,0 +1,278 @@
+"""Chunked screenplay renderers.
+
+Each renderer is a generator that yields the document piece by piece (title
+page, then one chunk per scene, then the trailer), so exports are built in
+linear time and can be streamed without holding the whole script in memory.
+Text that lands inside markup is escaped for its format. Scene fragments are
+cached by content hash, so re-exports only render the scenes that changed.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from html import escape as html_escape
+from typing import TYPE_CHECKING, Callable, Dict, Iterable, Iterator, List, Optional
+from xml.sax.saxutils import escape as xml_escape
+
+if TYPE_CHECKING:  # pragma: no cover
+    from services.screenplay.main import ExportReq, SceneCard
+
+STREAM_CHUNK_BYTES = 64 * 1024
+
+# Bump whenever fragment output changes so cached scenes are not reused
+RENDERER_VERSION = 1
+
+MEDIA_TYPES: Dict[str, str] = {
+    "fountain": "text/plain; charset=utf-8",
+    "fdx": "application/xml",
+    "html": "text/html; charset=utf-8",
+    "plain": "text/plain; charset=utf-8",
+    "pdf": "application/pdf",
+}
+
+
+def scene_heading(card: "SceneCard") -> str:
+    return f"INT. {card.where.upper()} - {card.when.get('time', 'DAY') if card.when else 'DAY'}"
+
+
+def action_text(card: "SceneCard") -> str:
+    return card.action or f"{', '.join(card.who)} {card.goal.lower()}."
+
+
+def _dialogue(card: "SceneCard") -> Iterator[tuple]:
+    for line in card.dialogue or []:
+        yield line.get('character', 'UNKNOWN').upper(), line.get('text', '')
+
+
+# ---- Scene fragments ----
+#
+# Scenes are rendered independently and cached by content, so re-exporting
+# after a small edit only renders the cards that changed. Anything that
+# depends on a scene's position (e.g. "SCENE n" in plain text) is added
+# when the document is assembled, never baked into a fragment.
+
+class SceneFragmentCache:
+    """Thread-safe LRU of rendered scene fragments keyed by ``scene_key``."""
+
+    def __init__(self, max_entries: int = 4096) -> None:
+        self.max_entries = max_entries
+        self._items: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_render(self, key: str, fn: Callable[[], str], stats: Optional[Dict[str, int]] = None) -> str:
+        with self._lock:
+            fragment = self._items.get(key)
+            if fragment is not None:
+                self._items.move_to_end(key)
+                self.hits += 1
+                if stats is not None:
+                    stats["hits"] = stats.get("hits", 0) + 1
+                return fragment
+            self.misses += 1
+            if stats is not None:
+                stats["misses"] = stats.get("misses", 0) + 1
+        fragment = fn()
+        with self._lock:
+            self._items[key] = fragment
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+        return fragment
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+            self.hits = self.misses = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"entries": len(self._items), "max_entries": self.max_entries,
+                    "hits": self.hits, "misses": self.misses}
+
+
+SCENE_CACHE = SceneFragmentCache(int(os.environ.get("SCREENPLAY_SCENE_CACHE_SIZE", "4096")))
+
+
+def scene_key(card: "SceneCard", fmt: str) -> str:
+    """Content hash of ``card`` plus the format and renderer version."""
+    payload = json.dumps(card.model_dump(), sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(f"{RENDERER_VERSION}|{fmt}|{payload}".encode("utf-8")).hexdigest()
+
+
+def fountain_scene(card: "SceneCard") -> str:
+    """One scene as Fountain text; also the line basis for scene diffs."""
+    block = [scene_heading(card), "", action_text(card)]
+    if card.conflict_or_twist:
+        block.append(card.conflict_or_twist)
+    block.append("")
+    for character, text in _dialogue(card):
+        block.extend([character, text, ""])
+    return "\n".join(block)
+
+
+def _plain_scene(card: "SceneCard") -> str:
+    block = [scene_heading(card), "", action_text(card), ""]
+    if card.dialogue:
+        block.extend(f"{character}: {text}" for character, text in _dialogue(card))
+        block.append("")
+    return "\n".join(block)
+
+
+def _fdx_scene(card: "SceneCard") -> str:
+    parts = [f"""        <Paragraph Type="Scene Heading">
+            <Text>{xml_escape(scene_heading(card))}</Text>
+        </Paragraph>
+        <Paragraph Type="Action">
+            <Text>{xml_escape(action_text(card))}</Text>
+        </Paragraph>
+"""]
+    for character, text in _dialogue(card):
+        parts.append(f"""        <Paragraph Type="Character">
+            <Text>{xml_escape(character)}</Text>
+        </Paragraph>
+        <Paragraph Type="Dialogue">
+            <Text>{xml_escape(text)}</Text>
+        </Paragraph>
+""")
+    return "".join(parts)
+
+
+def _html_scene(card: "SceneCard") -> str:
+    parts = [f"""    <div class="scene-heading">{html_escape(scene_heading(card))}</div>
+    <div class="action">{html_escape(action_text(card))}</div>
+"""]
+    for character, text in _dialogue(card):
+        parts.append(f"""    <div class="character">{html_escape(character)}</div>
+    <div class="dialogue">{html_escape(text)}</div>
+""")
+    return "".join(parts)
+
+
+_SCENE_RENDERERS: Dict[str, Callable[["SceneCard"], str]] = {
+    "fountain": fountain_scene,
+    "plain": _plain_scene,
+    "fdx": _fdx_scene,
+    "html": _html_scene,
+}
+
+
+def render_scene(card: "SceneCard", fmt: str, stats: Optional[Dict[str, int]] = None,
+                 cache: Optional[SceneFragmentCache] = None) -> str:
+    """One scene's fragment in ``fmt``, served from the cache when the card is unchanged."""
+    fn = _SCENE_RENDERERS[fmt]
+    return (cache or SCENE_CACHE).get_or_render(scene_key(card, fmt), lambda: fn(card), stats)
+
+
+# ---- Documents ----
+
+def render_fountain(req: "ExportReq", stats: Optional[Dict[str, int]] = None) -> Iterator[str]:
+    title: List[str] = []
+    if req.title:
+        title.append(f"Title: {req.title}")
+    if req.author:
+        title.append(f"Author: {req.author}")
+    title.append("")
+    yield "\n".join(title)
+    for card in req.cards:
+        yield "\n" + render_scene(card, "fountain", stats)
+
+
+def render_plain(req: "ExportReq", stats: Optional[Dict[str, int]] = None) -> Iterator[str]:
+    title: List[str] = []
+    if req.title:
+        title.append(f"TITLE: {req.title}")
+    if req.author:
+        title.append(f"AUTHOR: {req.author}")
+    title.append("")
+    yield "\n".join(title)
+    for i, card in enumerate(req.cards, 1):
+        yield f"\nSCENE {i}\n" + render_scene(card, "plain", stats)
+
+
+def render_fdx(req: "ExportReq", stats: Optional[Dict[str, int]] = None) -> Iterator[str]:
+    """Simplified Final Draft XML."""
+    yield f"""<?xml version="1.0" encoding="UTF-8"?>
+<FinalDraft DocumentType="Script" Template="No" Version="1">
+    <Content>
+        <TitlePage>
+            <Title>{xml_escape(req.title or 'Untitled')}</Title>
+            <Author>{xml_escape(req.author or 'Unknown')}</Author>
+        </TitlePage>
+"""
+    for card in req.cards:
+        yield render_scene(card, "fdx", stats)
+    yield """    </Content>
+</FinalDraft>"""
+
+
+def render_html(req: "ExportReq", stats: Optional[Dict[str, int]] = None) -> Iterator[str]:
+    title = html_escape(req.title or 'Untitled Screenplay')
+    yield f"""<!DOCTYPE html>
+<html>
+<head>
+    <title>{title}</title>
+    <style>
+        body {{ font-family: 'Courier New', monospace; margin: 40px; }}
+        .scene-heading {{ text-transform: uppercase; font-weight: bold; margin-top: 20px; }}
+        .action {{ margin: 10px 0; }}
+        .character {{ text-transform: uppercase; font-weight: bold; margin-left: 40px; }}
+        .dialogue {{ margin-left: 60px; margin-bottom: 10px; }}
+    </style>
+</head>
+<body>
+    <h1>{title}</h1>
+    <p>By {html_escape(req.author or 'Unknown')}</p>
+    <hr>
+"""
+    for card in req.cards:
+        yield render_scene(card, "html", stats)
+    yield """</body>
+</html>"""
+
+
+RENDERERS: Dict[str, Callable[..., Iterator[str]]] = {
+    "fountain": render_fountain,
+    "fdx": render_fdx,
+    "html": render_html,
+    "plain": render_plain,
+}
+
+
+def render(req: "ExportReq", stats: Optional[Dict[str, int]] = None) -> Iterator[str]:
+    """Text chunks for ``req.format``; binary formats (pdf) go through ``render_bytes``.
+
+    ``stats`` (if given) collects this render's scene-cache ``hits``/``misses``.
+    """
+    return RENDERERS.get(req.format, render_plain)(req, stats)
+
+
+def media_type(fmt: str) -> str:
+    return MEDIA_TYPES.get(fmt, MEDIA_TYPES["plain"])
+
+
+def encode_chunks(chunks: Iterable[str], chunk_bytes: int = STREAM_CHUNK_BYTES) -> Iterator[bytes]:
+    """UTF-8 encode ``chunks``, coalescing small ones into writes of about ``chunk_bytes``."""
+    buf: List[bytes] = []
+    size = 0
+    for chunk in chunks:
+        data = chunk.encode("utf-8")
+        buf.append(data)
+        size += len(data)
+        if size >= chunk_bytes:
+            yield b"".join(buf)
+            buf, size = [], 0
+    if buf:
+        yield b"".join(buf)
+
+
+def render_bytes(req: "ExportReq") -> bytes:
+    """Whole document as bytes; picklable entry point for worker processes."""
+    if req.format == "pdf":
+        from services.screenplay.pdf import render_pdf
+        return render_pdf(req)
+    return b"".join(encode_chunks(render(req)))
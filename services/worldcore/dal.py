@@ -5,6 +5,27 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+# Postgres channel notified (with the entity ID) whenever canon changes
+CANON_CHANNEL = "canon_changed"
+
+_CANON_COLUMNS = "id, cid, type, name, status, traits, world_id, canon_version, created_at, updated_at"
+
+def _canon(row) -> Dict[str, Any]:
+    return {
+        "entity": {
+            "id": row[0],
+            "cid": row[1],
+            "type": row[2],
+            "name": row[3],
+            "status": row[4],
+            "traits": row[5],
+            "world_id": row[6]
+        },
+        "canon_version": row[7],
+        "created_at": row[8].isoformat() if row[8] else None,
+        "updated_at": row[9].isoformat() if row[9] else None
+    }
+
 class WorldCoreDAL:
     def __init__(self, dsn: Optional[str] = None):
         self.dsn = dsn or os.environ.get("POSTGRES_DSN")
@@ -85,6 +106,9 @@ class WorldCoreDAL:
                     
                     # Remove proposal after approval
                     cur.execute("DELETE FROM proposals WHERE cid=%s", (cid,))
+
+                    # Delivered on commit, so caches of this entity (e.g. NPC personas) drop it
+                    cur.execute("SELECT pg_notify(%s, %s)", (CANON_CHANNEL, eid))
                 
                 conn.commit()
                 logger.info(f"Proposal {cid} approved for entity {eid}")
@@ -126,6 +150,71 @@ class WorldCoreDAL:
             logger.error(f"Failed to retrieve entity {id}: {e}")
             raise RuntimeError(f"Failed to retrieve entity: {e}")
     
+    def get_canon_many(self, ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Get many canonical entities in one query, keyed by ID (unknown IDs are absent)"""
+        if not ids:
+            return {}
+        try:
+            with self._get_connection() as conn:
+                with conn.cursor() as cur:
+                    cur.execute(f"SELECT {_CANON_COLUMNS} FROM entities WHERE id = ANY(%s)", (list(ids),))
+                    return {row[0]: _canon(row) for row in cur.fetchall()}
+        except Exception as e:
+            logger.error(f"Failed to retrieve entities {ids}: {e}")
+            raise RuntimeError(f"Failed to retrieve entities: {e}")
+
+    def get_canon_batch(self, ids: List[str], known: Optional[Dict[str, int]] = None) -> Dict[str, Any]:
+        """Multi-get split by what the caller already holds.
+
+        ``known`` maps IDs to the canon_version the caller has cached; those
+        still at that version are listed under ``unchanged`` instead of
+        being resent. Entities are flattened with their canon_version.
+        """
+        known = known or {}
+        found = self.get_canon_many(ids)
+        entities, unchanged = {}, {}
+        for eid, c in found.items():
+            if known.get(eid) == c["canon_version"]:
+                unchanged[eid] = c["canon_version"]
+            else:
+                entities[eid] = {**c["entity"], "canon_version": c["canon_version"]}
+        return {"entities": entities, "unchanged": unchanged, "missing": [i for i in ids if i not in found]}
+
+    def get_persona_bundle(self, id: str) -> Optional[Dict[str, Any]]:
+        """Get a character plus its world, place and relationship targets in one query.
+
+        Related IDs come from the character's traits: ``place_id`` (or a
+        ``location`` naming an entity) and ``relationships``, either
+        ``{id: relation}`` or a list of IDs / ``{"id": ..., "relation": ...}``.
+        """
+        try:
+            with self._get_connection() as conn:
+                with conn.cursor() as cur:
+                    cur.execute(f"""
+                        WITH c AS (SELECT id, traits, world_id FROM entities WHERE id = %s),
+                        refs AS (
+                            SELECT id AS ref FROM c
+                            UNION SELECT world_id FROM c
+                            UNION SELECT traits->>'place_id' FROM c
+                            UNION SELECT traits->>'location' FROM c
+                            UNION SELECT jsonb_object_keys(traits->'relationships') FROM c
+                                WHERE jsonb_typeof(traits->'relationships') = 'object'
+                            UNION SELECT COALESCE(r->>'id', r #>> '{{}}')
+                                FROM c, jsonb_array_elements(traits->'relationships') r
+                                WHERE jsonb_typeof(traits->'relationships') = 'array'
+                        )
+                        SELECT {_CANON_COLUMNS} FROM entities WHERE id IN (SELECT ref FROM refs)
+                    """, (id,))
+                    found = {row[0]: _canon(row) for row in cur.fetchall()}
+
+                    character = found.pop(id, None)
+                    if character is None:
+                        return None
+                    return {"character": character, "related": found}
+        except Exception as e:
+            logger.error(f"Failed to retrieve persona bundle {id}: {e}")
+            raise RuntimeError(f"Failed to retrieve persona bundle: {e}")
+
     def graph(self, world_id: Optional[str] = None, q: Optional[str] = None) -> Dict[str, Any]:
         """Get entity graph with optional filtering"""
         try:
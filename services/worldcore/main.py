@@ -6,6 +6,7 @@ from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, Field, field_validator
 from typing import Optional, Dict, Any, List
 from services.common.envelope import envelope_ok, envelope_error
+from services.common.deadline import DeadlineMiddleware
 from services.guards.temporal import check_interval
 from services.guards.allen_lite import validate_entity_consistency
 import os
@@ -17,6 +18,9 @@ from pathlib import Path
 # Import routers lazily inside create_app to avoid side-effects at import time
 def create_app() -> FastAPI:
     app = FastAPI(title="StoryMaker WorldCore", version="1.6.0")
+
+    # Honour X-Deadline-Ms from orchestration (added first so CORS stays outermost)
+    app.add_middleware(DeadlineMiddleware)
     
     # Add CORS middleware
     app.add_middleware(
@@ -242,6 +246,58 @@ def create_app() -> FastAPI:
             return envelope_error("RETRIEVAL_FAILED", "Failed to retrieve entity", 
                                 {"detail": str(e)}, {"actor": "api"})
 
+    @app.get("/canon/entity/{id}/persona")
+    def get_persona_bundle(id: str):
+        """Get a character with its world, place and relationship targets (one query)"""
+        try:
+            if not re.match(r'^[a-zA-Z][a-zA-Z0-9_]*$', id):
+                raise HTTPException(400, "Invalid entity ID format")
+
+            dal = get_dal()
+            bundle = dal.get_persona_bundle(id)
+            if not bundle:
+                raise HTTPException(404, "Entity not found")
+
+            def flat(c):
+                return {**c["entity"], "canon_version": c["canon_version"]}
+
+            return envelope_ok({
+                "character": flat(bundle["character"]),
+                "related": {eid: flat(c) for eid, c in bundle["related"].items()}
+            }, {"actor": "api"})
+
+        except HTTPException:
+            raise
+        except Exception as e:
+            return envelope_error("RETRIEVAL_FAILED", "Failed to retrieve persona",
+                                {"detail": str(e)}, {"actor": "api"})
+
+    MAX_CANON_BATCH = 200
+
+    class CanonBatchReq(BaseModel):
+        ids: List[str] = Field(..., min_length=1, max_length=MAX_CANON_BATCH, description="Entity IDs to fetch")
+        known: Dict[str, int] = Field(default_factory=dict,
+                                      description="canon_version the caller already holds per ID; unchanged entities are not resent")
+
+    @app.post("/canon/entities")
+    def get_canon_batch(req: CanonBatchReq):
+        """Get many canonical entities in one query (multi-get for anchor resolution)"""
+        try:
+            ids = list(dict.fromkeys(req.ids))
+            invalid = [i for i in ids if not re.match(r'^[a-zA-Z][a-zA-Z0-9_]*$', i)]
+            if invalid:
+                raise HTTPException(400, f"Invalid entity ID format: {', '.join(invalid)}")
+
+            dal = get_dal()
+            batch = dal.get_canon_batch(ids, req.known)
+            return envelope_ok(batch, {"actor": "api", "count": len(batch["entities"]) + len(batch["unchanged"])})
+
+        except HTTPException:
+            raise
+        except Exception as e:
+            return envelope_error("RETRIEVAL_FAILED", "Failed to retrieve entities",
+                                {"detail": str(e)}, {"actor": "api"})
+
     @app.get("/graph")
     def graph(world_id: Optional[str] = None, q: Optional[str] = None):
         """Get entity graph with optional filtering"""
@@ -0,0 +1,29 @@
+
+-- Media asset catalog (services/media/catalog.py).
+-- Every filter index ends in (created_at, id) so keyset pages are range scans.
+CREATE TABLE IF NOT EXISTS media_assets (
+  id TEXT PRIMARY KEY,
+  type TEXT NOT NULL,
+  provider TEXT,
+  uri TEXT NOT NULL,
+  size_bytes BIGINT NOT NULL DEFAULT 0,
+  prompt_hash TEXT,
+  anchors JSONB NOT NULL DEFAULT '[]'::jsonb,
+  metadata JSONB NOT NULL DEFAULT '{}'::jsonb,
+  created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+CREATE INDEX IF NOT EXISTS media_assets_created_idx ON media_assets(created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS media_assets_type_created_idx ON media_assets(type, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS media_assets_type_provider_created_idx ON media_assets(type, provider, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS media_assets_provider_created_idx ON media_assets(provider, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS media_assets_prompt_hash_idx ON media_assets(prompt_hash, created_at DESC, id DESC);
+
+-- One row per (anchor, asset); created_at is copied so anchor galleries page off this index alone
+CREATE TABLE IF NOT EXISTS media_asset_anchors (
+  anchor TEXT NOT NULL,
+  asset_id TEXT NOT NULL REFERENCES media_assets(id) ON DELETE CASCADE,
+  created_at TIMESTAMPTZ NOT NULL,
+  PRIMARY KEY (anchor, asset_id)
+);
+CREATE INDEX IF NOT EXISTS media_asset_anchors_created_idx
+  ON media_asset_anchors(anchor, created_at DESC, asset_id DESC);
@@ -0,0 +1,388 @@
+"""
+Interact Service Tests
+Tests for canon-backed NPC persona loading and the shared persona cache
+"""
+
+import asyncio
+import time
+
+import httpx
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+from services.common.envelope import envelope_ok, envelope_error
+from services.interact import main as interact_main
+from services.interact import personas, streaming
+
+client = TestClient(interact_main.app)
+
+
+def _canon():
+    return {
+        "char_elyra": {"id": "char_elyra", "type": "Character", "name": "Elyra", "world_id": "world_lumen",
+                       "canon_version": 3,
+                       "traits": {"invariants": ["will not take a bribe"], "place_id": "loc_harbor",
+                                  "relationships": {"char_rios": "ally"}, "role": "harbor warden"}},
+        "loc_harbor": {"id": "loc_harbor", "type": "Location", "name": "Harbor of Lumen", "canon_version": 1,
+                       "traits": {}},
+        "world_lumen": {"id": "world_lumen", "type": "World", "name": "Lumen", "canon_version": 1, "traits": {}},
+        "char_rios": {"id": "char_rios", "type": "Character", "name": "Captain Rios", "canon_version": 2,
+                      "traits": {}},
+    }
+
+
+@pytest.fixture
+def worldcore():
+    """In-process WorldCore stand-in serving persona bundles, installed as the interact loader"""
+    stats = {"calls": 0, "delay": 0.0, "canon": _canon()}
+    app = FastAPI()
+
+    @app.get("/canon/entity/{entity_id}/persona")
+    async def persona(entity_id: str):
+        stats["calls"] += 1
+        if stats["delay"]:
+            await asyncio.sleep(stats["delay"])
+        canon = stats["canon"]
+        if entity_id not in canon:
+            return JSONResponse(envelope_error("NOT_FOUND", f"Entity {entity_id} not found", {}, {}), status_code=404)
+        character = canon[entity_id]
+        refs = [character.get("world_id"), character["traits"].get("place_id"),
+                *character["traits"].get("relationships", {})]
+        return envelope_ok({"character": character, "related": {r: canon[r] for r in refs if r in canon}}, {})
+
+    stats["loader"] = personas.PersonaLoader(
+        personas.HTTPPersonaSource("http://worldcore.test", transport=httpx.ASGITransport(app=app)))
+    old = interact_main.LOADER
+    interact_main.LOADER = stats["loader"]
+    yield stats
+    interact_main.LOADER = old
+
+
+@pytest.fixture
+def static_personas(monkeypatch):
+    """The built-in demo personas, whatever the environment configures"""
+    monkeypatch.setattr(interact_main, "LOADER",
+                        personas.PersonaLoader(personas.StaticPersonaSource(interact_main.PERSONAS)))
+
+
+def _open(npc):
+    """Session start message for ``npc``"""
+    with client.websocket_connect(f"/npc/session?npc={npc}") as ws:
+        return ws.receive_json()
+
+
+class TestPersonaBuild:
+    """Test persona assembly from a canon bundle"""
+
+    def test_build_persona_from_bundle(self):
+        """Place, world and relationships are resolved by name and every source entity is cited"""
+        canon = _canon()
+        persona = personas.build_persona({"character": canon["char_elyra"],
+                                          "related": {k: v for k, v in canon.items() if k != "char_elyra"}})
+        assert persona["pov"] == "Elyra"
+        assert persona["invariants"] == ["will not take a bribe"]
+        assert persona["location"] == "Harbor of Lumen"
+        assert persona["world"]["name"] == "Lumen"
+        assert persona["relationships"] == [{"id": "char_rios", "name": "Captain Rios", "type": "Character",
+                                             "relation": "ally"}]
+        assert persona["traits"] == {"role": "harbor warden"}
+        assert persona["versions"] == {"char_elyra": 3, "loc_harbor": 1, "world_lumen": 1, "char_rios": 2}
+        assert sorted(persona["citations"]) == ["char_elyra", "char_rios", "loc_harbor", "world_lumen"]
+
+    def test_missing_related_entities_are_skipped(self):
+        """A relationship to an entity that is not in canon does not break the persona"""
+        character = _canon()["char_elyra"]
+        persona = personas.build_persona({"character": character, "related": {}})
+        assert persona["relationships"] == []
+        assert persona["location"] is None and persona["place"] is None
+        assert persona["citations"] == ["char_elyra"]
+
+
+class TestPersonaSessions:
+    """Test per-session persona snapshots and the shared cache"""
+
+    def test_first_session_loads_then_turns_do_no_lookups(self, worldcore):
+        """A cold session start loads once; chat turns reuse the session's persona"""
+        with client.websocket_connect("/npc/session?npc=char_elyra") as ws:
+            first = ws.receive_json()
+            assert first["status"] == "ok"
+            assert first["data"]["persona"]["location"] == "Harbor of Lumen"
+            assert first["meta"]["persona_cache"]["hit"] is False
+            for _ in range(3):
+                ws.send_json({"msg": "Who commands the patrols?"})
+                reply = ws.receive_json()
+                assert "char_elyra" in reply["citations"]
+        assert worldcore["calls"] == 1
+
+    def test_second_session_hits_shared_cache(self, worldcore):
+        """A popular NPC is served to new sessions without another lookup"""
+        _open("char_elyra")
+        second = _open("char_elyra")
+        assert second["meta"]["persona_cache"]["hit"] is True
+        assert worldcore["calls"] == 1
+        stats = client.get("/npc/personas/stats").json()["data"]
+        assert stats["hits"] == 1 and stats["entries"] == 1 and stats["source"] == "http"
+
+    def test_invalidation_by_related_entity(self, worldcore):
+        """Changing any entity a persona was built from drops it; the next session sees the change"""
+        _open("char_elyra")
+        worldcore["canon"]["loc_harbor"]["name"] = "Old Harbor"
+
+        unrelated = client.post("/npc/personas/invalidate", json={"ids": ["char_nobody"]}).json()
+        assert unrelated["data"]["invalidated"] == []
+        assert _open("char_elyra")["data"]["persona"]["location"] == "Harbor of Lumen"
+
+        dropped = client.post("/npc/personas/invalidate", json={"ids": ["loc_harbor"]}).json()
+        assert dropped["data"]["invalidated"] == ["char_elyra"]
+        reloaded = _open("char_elyra")
+        assert reloaded["meta"]["persona_cache"]["hit"] is False
+        assert reloaded["data"]["persona"]["location"] == "Old Harbor"
+        assert worldcore["calls"] == 2
+
+    def test_ttl_expiry(self, worldcore):
+        """Entries older than the TTL are reloaded"""
+        worldcore["loader"].cache.ttl = 0.01
+        _open("char_elyra")
+        time.sleep(0.02)
+        assert _open("char_elyra")["meta"]["persona_cache"]["hit"] is False
+        assert worldcore["calls"] == 2
+
+    def test_lru_eviction(self, worldcore):
+        """The shared cache holds at most max_entries personas"""
+        worldcore["loader"].cache.max_entries = 1
+        _open("char_elyra")
+        _open("char_rios")
+        assert _open("char_elyra")["meta"]["persona_cache"]["hit"] is False
+        assert worldcore["calls"] == 3
+
+    def test_concurrent_session_starts_share_one_load(self, worldcore):
+        """Simultaneous loads of one NPC make a single WorldCore call"""
+        worldcore["delay"] = 0.05
+        loader = worldcore["loader"]
+
+        async def burst():
+            return await asyncio.gather(*(loader.load("char_elyra") for _ in range(10)))
+
+        results = asyncio.run(burst())
+        assert worldcore["calls"] == 1 and loader.loads == 1
+        assert all(persona["pov"] == "Elyra" for persona, _ in results)
+
+    def test_cancelled_first_load_does_not_fail_the_others(self, worldcore):
+        """A session that goes away during a cold start leaves the shared load running for the rest"""
+        worldcore["delay"] = 0.05
+        loader = worldcore["loader"]
+
+        async def cold_starts():
+            first = asyncio.ensure_future(loader.load("char_elyra"))
+            second = asyncio.ensure_future(loader.load("char_elyra"))
+            await asyncio.sleep(0.01)
+            first.cancel()
+            return first, await second
+
+        first, (persona, hit) = asyncio.run(cold_starts())
+        assert first.cancelled()
+        assert persona["pov"] == "Elyra" and hit is False
+        assert worldcore["calls"] == 1
+        assert loader.cache.stats()["entries"] == 1
+
+    def test_invalidation_during_load_is_not_cached(self, worldcore):
+        """A load that raced an invalidation is returned but not kept"""
+        worldcore["delay"] = 0.05
+        loader = worldcore["loader"]
+
+        async def race():
+            load = asyncio.ensure_future(loader.load("char_elyra"))
+            await asyncio.sleep(0.01)
+            loader.cache.invalidate(["loc_harbor"])
+            return await load
+
+        asyncio.run(race())
+        assert loader.cache.stats()["entries"] == 0
+
+    def test_unknown_npc(self, worldcore):
+        """An NPC with no canon entity is reported and the session is closed"""
+        with client.websocket_connect("/npc/session?npc=char_nobody") as ws:
+            first = ws.receive_json()
+            assert first["status"] == "error"
+            assert first["error"]["code"] == "PERSONA_NOT_FOUND"
+            with pytest.raises(WebSocketDisconnect) as closed:
+                ws.receive_json()
+            assert closed.value.code == 4404
+
+
+class TestStaticPersonas:
+    """Test the built-in personas used without WorldCore"""
+
+    def test_static_session_contract(self, static_personas):
+        """ws /npc/session -> unknown -> PROPOSE_FACT, with the demo persona"""
+        with client.websocket_connect("/npc/session") as ws:
+            assert ws.receive_json()["data"]["persona"]["pov"] == "Elyra"
+            ws.send_json({"msg": "Tell me something unknown"})
+            assert ws.receive_json()["propose"]["type"] == "PROPOSE_FACT"
+            ws.send_json({"msg": "Who commands the patrols?"})
+            assert ws.receive_json()["citations"] == ["f_council", "p_harbor"]
+
+    def test_source_selection(self, monkeypatch):
+        """The source defaults to the first configured backend"""
+        for name in ("INTERACT_PERSONA_SOURCE", "POSTGRES_DSN", "WORLDCORE_BASE"):
+            monkeypatch.delenv(name, raising=False)
+        assert personas.source_name() == "static"
+        monkeypatch.setenv("WORLDCORE_BASE", "http://worldcore.test")
+        assert personas.source_name() == "http"
+        monkeypatch.setenv("INTERACT_PERSONA_SOURCE", "bogus")
+        with pytest.raises(ValueError):
+            personas.create_loader({})
+
+
+def _turn_frames(ws, turn_id):
+    """Frames up to and including the final (or cancelled) frame of ``turn_id``"""
+    frames = []
+    while True:
+        frame = ws.receive_json()
+        frames.append(frame)
+        if frame["turn_id"] == turn_id and frame["type"] in ("final", "cancelled", "error"):
+            return frames
+
+
+@pytest.mark.usefixtures("static_personas")
+class TestStreamingProtocol:
+    """Test the opt-in streaming reply protocol on /npc/session"""
+
+    def test_deltas_then_final_with_citations(self):
+        """Deltas concatenate to the final reply, which carries the citations"""
+        with client.websocket_connect("/npc/session?stream=1") as ws:
+            assert ws.receive_json()["meta"]["protocol"] == "stream"
+            ws.send_json({"msg": "Who commands the patrols?"})
+            frames = _turn_frames(ws, "t1")
+        deltas, final = frames[:-1], frames[-1]
+        assert len(deltas) > 1 and all(f["type"] == "delta" and f["turn_id"] == "t1" for f in deltas)
+        assert [f["offset"] for f in deltas] == [sum(len(d["text"]) for d in deltas[:i]) for i in range(len(deltas))]
+        assert final["type"] == "final"
+        assert final["msg"] == "".join(f["text"] for f in deltas)
+        assert final["msg"].startswith("Captain Rios")
+        assert final["citations"] == ["f_council", "p_harbor"]
+
+    def test_unknown_proposes_fact_and_turn_ids(self):
+        """Turn ids count up unless the client supplies one; unknowns end in a PROPOSE_FACT final frame"""
+        with client.websocket_connect("/npc/session?stream=1") as ws:
+            ws.receive_json()
+            ws.send_json({"msg": "hello"})
+            assert _turn_frames(ws, "t1")[-1]["type"] == "final"
+            ws.send_json({"msg": "Tell me something unknown", "turn_id": "mine"})
+            final = _turn_frames(ws, "mine")[-1]
+        assert final["propose"]["type"] == "PROPOSE_FACT"
+        assert final["propose"]["payload"]["text"] == "Tell me something unknown"
+
+    def test_new_message_cancels_reply_in_progress(self, monkeypatch):
+        """A message sent mid-reply cancels the current turn; nothing of it follows the cancelled frame"""
+        monkeypatch.setenv("INTERACT_STREAM_TOKEN_DELAY_MS", "30")
+        with client.websocket_connect("/npc/session?stream=1") as ws:
+            ws.receive_json()
+            ws.send_json({"msg": "Who commands the patrols?"})
+            assert ws.receive_json()["turn_id"] == "t1"
+            ws.send_json({"msg": "Never mind, something unknown"})
+            frames = _turn_frames(ws, "t2")
+        cancelled = [i for i, f in enumerate(frames) if f["type"] == "cancelled"]
+        assert len(cancelled) == 1
+        assert frames[cancelled[0]] == {"type": "cancelled", "turn_id": "t1", "reason": "superseded"}
+        assert all(f["turn_id"] == "t2" for f in frames[cancelled[0] + 1:])
+        assert not any(f["type"] == "final" and f["turn_id"] == "t1" for f in frames)
+        assert frames[-1]["propose"]["type"] == "PROPOSE_FACT"
+
+    def test_explicit_cancel(self, monkeypatch):
+        """{"type": "cancel"} stops the current reply without starting a new turn"""
+        monkeypatch.setenv("INTERACT_STREAM_TOKEN_DELAY_MS", "30")
+        with client.websocket_connect("/npc/session?stream=1") as ws:
+            ws.receive_json()
+            ws.send_json({"msg": "Who commands the patrols?"})
+            ws.receive_json()
+            ws.send_json({"type": "cancel"})
+            frames = _turn_frames(ws, "t1")
+        assert frames[-1] == {"type": "cancelled", "turn_id": "t1", "reason": "cancelled"}
+
+    def test_default_protocol_unchanged(self):
+        """Without stream=1 each turn is still a single message"""
+        with client.websocket_connect("/npc/session") as ws:
+            assert ws.receive_json()["meta"]["protocol"] == "message"
+            ws.send_json({"msg": "Who commands the patrols?"})
+            reply = ws.receive_json()
+        assert "type" not in reply and reply["msg"].startswith("Captain Rios")
+
+    def test_slow_client_is_closed(self):
+        """A client that stops reading is disconnected after the send timeout"""
+        class StalledSocket:
+            def __init__(self):
+                self.inbox = asyncio.Queue()
+                self.closed_with = None
+
+            async def receive_json(self):
+                return await self.inbox.get()
+
+            async def send_json(self, frame):
+                await asyncio.Event().wait()
+
+            async def close(self, code=1000):
+                self.closed_with = code
+
+        async def run():
+            sock = StalledSocket()
+            sock.inbox.put_nowait({"msg": "hello"})
+            session = streaming.StreamSession(sock, lambda msg: (streaming.paced("one two three"), {}),
+                                              streaming.SendQueue(max_frames=2), timeout=0.05)
+            await asyncio.wait_for(session.run(), 2)
+            return sock
+
+        assert asyncio.run(run()).closed_with == streaming.SLOW_CLIENT_CLOSE_CODE
+
+
+class TestSendQueue:
+    """Test the bounded, coalescing per-connection send queue"""
+
+    def test_deltas_coalesce_per_turn(self):
+        """Queued deltas of one turn merge; other turns and other frame types do not"""
+        async def run():
+            q = streaming.SendQueue()
+            await q.put({"type": "delta", "turn_id": "t1", "offset": 0, "text": "Captain"})
+            await q.put({"type": "delta", "turn_id": "t1", "offset": 7, "text": " Rios"})
+            await q.put({"type": "final", "turn_id": "t1", "msg": "Captain Rios"})
+            await q.put({"type": "delta", "turn_id": "t2", "offset": 0, "text": "Hi"})
+            return q, [await q.get() for _ in range(3)]
+
+        q, frames = asyncio.run(run())
+        assert frames[0] == {"type": "delta", "turn_id": "t1", "offset": 0, "text": "Captain Rios"}
+        assert frames[1]["type"] == "final" and frames[2]["turn_id"] == "t2"
+        assert q.coalesced == 1
+
+    def test_full_queue_applies_backpressure(self):
+        """Producers wait for room when the frame or delta text bound is reached"""
+        async def run():
+            q = streaming.SendQueue(max_frames=2, max_chars=4)
+            await q.put({"type": "final", "turn_id": "t1", "msg": ""})
+            await q.put({"type": "delta", "turn_id": "t2", "offset": 0, "text": "abcd"})
+            blocked = asyncio.ensure_future(q.put({"type": "delta", "turn_id": "t2", "offset": 4, "text": "ef"}))
+            await asyncio.sleep(0.01)
+            assert not blocked.done() and q.stalls == 1
+            await q.get()
+            await q.get()
+            await asyncio.wait_for(blocked, 1)
+            return await q.get()
+
+        assert asyncio.run(run())["text"] == "ef"
+
+    def test_drop_turn_and_close(self):
+        """Dropping a turn discards its queued deltas; closing releases waiting producers"""
+        async def run():
+            q = streaming.SendQueue(max_frames=1)
+            await q.put({"type": "delta", "turn_id": "t1", "offset": 0, "text": "abc"})
+            assert await q.drop_turn("t1") == 1 and len(q) == 0
+            await q.put({"type": "final", "turn_id": "t1", "msg": ""})
+            waiting = asyncio.ensure_future(q.put({"type": "final", "turn_id": "t2", "msg": ""}))
+            await asyncio.sleep(0.01)
+            await q.close()
+            await asyncio.wait_for(waiting, 1)
+            return await q.get()
+
+        assert asyncio.run(run()) is None
@@ -12,6 +12,67 @@ from services.media.main import (
 
 client = TestClient(app)
 
+
+@pytest.fixture(autouse=True)
+def _fresh_generation_cache(tmp_path, monkeypatch):
+    """Each test starts with empty media caches, catalog, blob store and router statistics"""
+    from services.media import anchors, cache, routing
+    monkeypatch.setenv("MEDIA_CACHE_DIR", str(tmp_path / "media-cache"))
+    monkeypatch.setenv("MEDIA_CATALOG_DSN", str(tmp_path / "catalog.db"))
+    monkeypatch.setenv("ARTIFACT_STORE_DIR", str(tmp_path / "artifacts"))
+    monkeypatch.setattr(routing, "ROUTER", routing.Router())
+    monkeypatch.delenv("WORLDCORE_BASE", raising=False)
+    cache.reset_cache()
+    anchors.reset_resolver()
+    yield
+    cache.reset_cache()
+    anchors.reset_resolver()
+
+
+@pytest.fixture
+def stand_in(monkeypatch):
+    """Local stand-in for the image provider, served in-process through ASGITransport"""
+    import asyncio
+    import httpx
+    from fastapi import FastAPI, Request, Response
+    from services.media import providers
+
+    provider = FastAPI()
+    stats = {"calls": 0, "in_flight": 0, "max_in_flight": 0, "hosts": set(), "delay": 0.05, "completed": 0,
+             "image_bytes": None, "downloads": 0}
+
+    @provider.post("/v1/images/generations")
+    async def generations(request: Request):
+        stats["calls"] += 1
+        number = stats["calls"]
+        stats["hosts"].add(request.headers["host"])
+        stats["in_flight"] += 1
+        stats["max_in_flight"] = max(stats["max_in_flight"], stats["in_flight"])
+        try:
+            await asyncio.sleep(stats["delay"])
+        finally:
+            stats["in_flight"] -= 1
+        stats["completed"] += 1
+        body = await request.json()
+        return {"data": [{"url": f"https://img.test/{number}.png", "revised_prompt": body["prompt"]}]}
+
+    @provider.get("/{name}.png")
+    async def image(name: str):
+        # Generated files are only downloadable when a test provides their bytes
+        if stats["image_bytes"] is None:
+            return Response(status_code=404)
+        stats["downloads"] += 1
+        return Response(stats["image_bytes"], media_type="image/png")
+
+    monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+    monkeypatch.setenv("DALLE_BASE_URL", "http://provider.test")
+    monkeypatch.setenv("MEDIA_DALLE_CONCURRENCY", "2")
+    monkeypatch.setattr(providers, "POOL", providers.ProviderPool(transport=httpx.ASGITransport(app=provider)))
+    # Other stand-ins (e.g. WorldCore) add their routes to the same in-process app
+    stats["app"] = provider
+    return stats
+
+
 class TestAudioRequestValidation:
     """Test AudioReq validation"""
     
@@ -248,7 +309,7 @@ class TestMediaAPI:
         assert data["status"] == "ok"
         assert "assets" in data["data"]
         assert "count" in data["data"]
-        assert "total" in data["data"]
+        assert "next_cursor" in data["data"]
         
         assets = data["data"]["assets"]
         assert len(assets) >= 0  # Should have some test assets
@@ -425,7 +486,8 @@ class TestAssetGeneration:
         """Test that asset IDs are unique"""
         request_data = {
             "ssml": "<speak>Test</speak>",
-            "voice": "neutral"
+            "voice": "neutral",
+            "force_regenerate": True  # identical requests are otherwise served from the cache
         }
         
         response1 = client.post("/audio/synth", json=request_data)
@@ -525,3 +587,806 @@ class TestSupportedValues:
             
             data = response.json()
             assert data["data"]["image"]["provider"] == provider
+
+
+class TestProviderPooling:
+    """Test pooled provider clients and concurrent variant generation against a stand-in provider"""
+
+    def test_variants_generated_concurrently_under_provider_cap(self, stand_in):
+        """Test n variants fan out concurrently without exceeding the per-provider semaphore"""
+        response = client.post("/visual/generate", json={"prompt": "A harbor at dusk", "provider": "dalle", "n": 4})
+        assert response.status_code == 200
+        body = response.json()
+        assert body["status"] == "ok"
+        variants = body["data"]["variants"]
+        assert len(variants) == 4
+        assert len({v["uri"] for v in variants}) == 4
+        assert [v["metadata"]["variant"] for v in variants] == [0, 1, 2, 3]
+        assert body["data"]["image"] == variants[0]
+        assert body["meta"]["variants"] == {"requested": 4, "generated": 4, "errors": []}
+        assert stand_in["calls"] == 4
+        assert stand_in["max_in_flight"] == 2
+        assert stand_in["hosts"] == {"provider.test"}
+
+    def test_lifespan_opens_and_closes_pool(self, stand_in):
+        """Test the app lifespan owns the provider clients"""
+        from services.media import providers
+        with TestClient(app) as c:
+            assert providers.POOL.open_clients == len(providers.DEFAULT_BASE_URLS)
+            response = c.post("/visual/generate", json={"prompt": "A lighthouse", "provider": "dalle"})
+            assert response.json()["data"]["image"]["uri"] == "https://img.test/1.png"
+        assert providers.POOL.open_clients == 0
+
+    def test_variant_count_validated(self):
+        """Test n is bounded"""
+        with pytest.raises(ValueError):
+            VisualReq(prompt="x", n=0)
+        with pytest.raises(ValueError):
+            VisualReq(prompt="x", n=9)
+
+
+class TestGenerationCache:
+    """Test the prompt/SSML generation cache"""
+
+    def test_identical_requests_served_from_cache(self, stand_in):
+        """Test a repeat request (modulo whitespace) skips the provider and reports hit rates"""
+        first = client.post("/visual/generate", json={"prompt": "A harbor  at dusk", "provider": "dalle"}).json()
+        second = client.post("/visual/generate", json={"prompt": " A harbor at\ndusk ", "provider": "dalle"}).json()
+        assert stand_in["calls"] == 1
+        assert first["meta"]["cache"]["hit"] is False
+        assert second["meta"]["cache"]["hit"] is True
+        assert second["meta"]["cache"]["hit_rate"] == 0.5
+        assert second["data"] == first["data"]
+
+    def test_params_and_force_regenerate_bypass_cache(self, stand_in):
+        """Test different generation params miss, and force_regenerate refreshes the entry"""
+        request = {"prompt": "A lighthouse", "provider": "dalle"}
+        first = client.post("/visual/generate", json=request).json()
+        client.post("/visual/generate", json={**request, "size": "512x512"})
+        assert stand_in["calls"] == 2
+
+        forced = client.post("/visual/generate", json={**request, "force_regenerate": True}).json()
+        assert stand_in["calls"] == 3
+        assert forced["meta"]["cache"]["hit"] is False
+        assert forced["data"]["image"]["id"] != first["data"]["image"]["id"]
+        again = client.post("/visual/generate", json=request).json()
+        assert again["data"]["image"]["id"] == forced["data"]["image"]["id"]
+
+    def test_disk_backend_survives_restart(self, stand_in, monkeypatch):
+        """Test disk-cached assets are found by a fresh cache instance"""
+        from services.media import cache
+        monkeypatch.setenv("MEDIA_CACHE_BACKEND", "disk")
+        first = client.post("/visual/generate", json={"prompt": "A cliff", "provider": "dalle"}).json()
+        assert first["meta"]["cache"]["backend"] == "disk"
+        cache.reset_cache()
+        second = client.post("/visual/generate", json={"prompt": "A cliff", "provider": "dalle"}).json()
+        assert second["meta"]["cache"]["hit"] is True
+        assert stand_in["calls"] == 1
+
+    def test_cache_disabled(self, stand_in, monkeypatch):
+        """Test MEDIA_CACHE_BACKEND=off always calls the provider"""
+        monkeypatch.setenv("MEDIA_CACHE_BACKEND", "off")
+        for _ in range(2):
+            body = client.post("/visual/generate", json={"prompt": "A pier", "provider": "dalle"}).json()
+        assert stand_in["calls"] == 2
+        assert body["meta"]["cache"] == {"hit": False, "backend": "off"}
+
+    def test_size_bounded_eviction(self, tmp_path):
+        """Test both backends evict least recently used entries past their bounds"""
+        import os
+        from services.media.cache import DiskCache, MemoryCache
+        memory = MemoryCache(max_entries=2)
+        memory.put("a", {"v": 1})
+        memory.put("b", {"v": 2})
+        memory.get("a")
+        memory.put("c", {"v": 3})
+        assert memory.get("b") is None and memory.get("a") == {"v": 1}
+        assert memory.stats()["evictions"] == 1
+
+        disk = DiskCache(str(tmp_path / "disk"), max_bytes=250)
+        for i, key in enumerate(["aa1", "bb2", "cc3"]):
+            disk.put(key, {"payload": "x" * 100})
+            os.utime(disk._path(key), (i, i))
+        assert disk.get("aa1") is None
+        assert disk.get("cc3") == {"payload": "x" * 100}
+        assert disk.stats()["bytes"] <= 250
+        assert disk.stats()["entries"] == 2
+
+    def test_disk_stats_use_running_totals(self, tmp_path, monkeypatch):
+        """Test disk stats are kept by put/evict instead of walking the cache directory"""
+        import asyncio
+        from services.media.cache import DiskCache
+        disk = DiskCache(str(tmp_path / "disk"))
+        asyncio.run(disk.aput("aa1", {"v": 1}))
+        asyncio.run(disk.aput("aa1", {"v": 2}))
+        disk.put("bb2", {"v": 3})
+        assert asyncio.run(disk.aget("aa1")) == {"v": 2}
+
+        def no_walk(*args, **kwargs):
+            raise AssertionError("stats() walked the cache directory")
+        monkeypatch.setattr("services.media.cache.os.walk", no_walk)
+        assert disk.stats()["entries"] == 2 and disk.stats()["hits"] == 1
+        monkeypatch.undo()
+        assert DiskCache(str(tmp_path / "disk")).stats()["entries"] == 2
+
+    def test_disk_eviction_uses_lru_index(self, tmp_path, monkeypatch):
+        """Test writes to a full disk cache evict from the in-memory index without walking the directory"""
+        import os
+        from services.media.cache import DiskCache
+        disk = DiskCache(str(tmp_path / "disk"), max_bytes=250)
+        for i, key in enumerate(["aa1", "bb2"]):
+            disk.put(key, {"payload": "x" * 100})
+            os.utime(disk._path(key), (i, i))
+
+        def no_walk(*args, **kwargs):
+            raise AssertionError("put() walked the cache directory")
+        monkeypatch.setattr("services.media.cache.os.walk", no_walk)
+        assert disk.get("aa1") is not None
+        disk.put("cc3", {"payload": "x" * 100})
+        assert not os.path.exists(disk._path("bb2")) and os.path.exists(disk._path("aa1"))
+        for key in ["dd4", "ee5"]:
+            disk.put(key, {"payload": "x" * 100})
+        monkeypatch.undo()
+        assert [k for k in ["aa1", "bb2", "cc3", "dd4", "ee5"] if os.path.exists(disk._path(k))] == ["dd4", "ee5"]
+        assert disk.stats()["evictions"] == 3 and disk.stats()["entries"] == 2
+
+        # A restarted cache rebuilds the order from file mtimes
+        os.utime(disk._path("dd4"), (10, 10))
+        os.utime(disk._path("ee5"), (5, 5))
+        restarted = DiskCache(str(tmp_path / "disk"), max_bytes=250)
+        restarted.put("ff6", {"payload": "x" * 100})
+        assert not os.path.exists(disk._path("ee5")) and os.path.exists(disk._path("dd4"))
+
+
+class TestMediaJobs:
+    """Test asynchronous media jobs: submission, polling, SSE progress, cancellation and caps"""
+
+    def _wait(self, c, job_id, states, timeout=5.0):
+        import time
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            job = c.get(f"/media/jobs/{job_id}").json()["data"]["job"]
+            if job["state"] in states:
+                return job
+            time.sleep(0.01)
+        raise AssertionError(f"job {job_id} never reached {states}")
+
+    def test_submit_returns_immediately_and_completes(self, stand_in):
+        """Test POST returns 202 with a job id and polling reaches the generated image"""
+        stand_in["delay"] = 0.3
+        with TestClient(app) as c:
+            response = c.post("/media/jobs/visual", json={"prompt": "A harbor", "provider": "dalle"})
+            assert response.status_code == 202
+            job = response.json()["data"]["job"]
+            assert job["state"] in ("queued", "running")
+            assert response.json()["data"]["links"]["events"] == f"/media/jobs/{job['id']}/events"
+            done = self._wait(c, job["id"], {"succeeded", "failed"})
+        assert done["state"] == "succeeded" and done["progress"] == 1.0
+        assert done["result"]["image"]["uri"].startswith("https://img.test/")
+
+    def test_progress_stream(self, stand_in):
+        """Test the SSE stream replays every state change and ends with the final job"""
+        import json
+        with TestClient(app) as c:
+            job_id = c.post("/media/jobs/visual", json={"prompt": "A pier", "provider": "dalle"}).json()["data"]["job"]["id"]
+            with c.stream("GET", f"/media/jobs/{job_id}/events") as response:
+                assert response.headers["content-type"].startswith("text/event-stream")
+                body = "".join(response.iter_text())
+            resumed = c.get(f"/media/jobs/{job_id}/events", headers={"Last-Event-ID": "2"}).text
+        events = [line[len("event: "):] for line in body.splitlines() if line.startswith("event: ")]
+        assert events == ["queued", "running", "running", "succeeded", "result"]
+        final = json.loads(body.strip().splitlines()[-1][len("data: "):])
+        assert final["state"] == "succeeded"
+        assert [line for line in resumed.splitlines() if line.startswith("event: ")] == ["event: succeeded", "event: result"]
+
+    def test_progress_reported_per_variant_and_chunk(self, stand_in, tts_stand_in):
+        """Test jobs publish progress after each image variant and each synthesized sentence"""
+        import json
+
+        def progress(c, job_id):
+            body = c.get(f"/media/jobs/{job_id}/events").text
+            events = [json.loads(line[len("data: "):]) for line in body.splitlines() if line.startswith("data: ")]
+            return [e["progress"] for e in events if "seq" in e and e["state"] in ("running", "succeeded")]
+
+        with TestClient(app) as c:
+            visual = c.post("/media/jobs/visual", json={"prompt": "A pier", "provider": "dalle", "n": 3})
+            audio = c.post("/media/jobs/audio", json={"ssml": "<speak>One. Two.</speak>"})
+            assert progress(c, visual.json()["data"]["job"]["id"]) == [0.0, 0.25, 0.5, 0.75, 1.0]
+            assert progress(c, audio.json()["data"]["job"]["id"]) == [0.0, 0.3333, 0.6667, 1.0]
+
+    def test_request_deadline_does_not_outlive_the_request(self, stand_in):
+        """Test a deadline on the request that started the workers does not fail later jobs"""
+        import time
+        with TestClient(app) as c:
+            first = c.post("/media/jobs/visual", json={"prompt": "One", "provider": "dalle"},
+                           headers={"X-Deadline-Ms": "30"}).json()["data"]["job"]
+            assert self._wait(c, first["id"], {"succeeded", "failed"})["state"] == "succeeded"
+            time.sleep(0.05)
+            second = c.post("/media/jobs/visual", json={"prompt": "Two", "provider": "dalle"}).json()["data"]["job"]
+            assert self._wait(c, second["id"], {"succeeded", "failed"})["state"] == "succeeded"
+
+    def test_cancel_running_and_queued_jobs(self, stand_in, monkeypatch):
+        """Test cancellation of a running job stops its provider call and a queued job never runs"""
+        monkeypatch.setenv("MEDIA_JOB_DALLE_WORKERS", "1")
+        stand_in["delay"] = 10
+        with TestClient(app) as c:
+            first = c.post("/media/jobs/visual", json={"prompt": "One", "provider": "dalle"}).json()["data"]["job"]
+            second = c.post("/media/jobs/visual", json={"prompt": "Two", "provider": "dalle"}).json()["data"]["job"]
+            self._wait(c, first["id"], {"running"})
+            assert c.get(f"/media/jobs/{second['id']}").json()["data"]["job"]["state"] == "queued"
+
+            queued = c.delete(f"/media/jobs/{second['id']}").json()["data"]["job"]
+            running = c.delete(f"/media/jobs/{first['id']}").json()["data"]["job"]
+            assert queued["state"] == "cancelled" and running["state"] == "cancelled"
+            assert c.get("/media/jobs").json()["data"]["pending"] == 0
+        assert stand_in["calls"] == 1 and stand_in["completed"] == 0
+
+    def test_per_provider_worker_cap(self, stand_in, monkeypatch):
+        """Test jobs for one provider never exceed its worker count"""
+        monkeypatch.setenv("MEDIA_JOB_DALLE_WORKERS", "1")
+        with TestClient(app) as c:
+            ids = [c.post("/media/jobs/visual", json={"prompt": f"Scene {i}", "provider": "dalle"}).json()["data"]["job"]["id"]
+                   for i in range(3)]
+            for job_id in ids:
+                assert self._wait(c, job_id, {"succeeded", "failed"})["state"] == "succeeded"
+        assert stand_in["calls"] == 3 and stand_in["max_in_flight"] == 1
+
+    def test_queue_full_and_unknown_job(self, stand_in, monkeypatch):
+        """Test submissions past the pending bound are shed and unknown ids are 404"""
+        monkeypatch.setenv("MEDIA_JOB_QUEUE_SIZE", "1")
+        stand_in["delay"] = 10
+        with TestClient(app) as c:
+            first = c.post("/media/jobs/visual", json={"prompt": "Busy", "provider": "dalle"})
+            second = c.post("/media/jobs/visual", json={"prompt": "Shed", "provider": "dalle"})
+            assert first.status_code == 202
+            assert second.status_code == 503
+            assert second.json()["error"]["code"] == "JOB_QUEUE_FULL"
+            missing = c.get("/media/jobs/does-not-exist")
+            assert missing.status_code == 404 and missing.json()["error"]["code"] == "JOB_NOT_FOUND"
+
+
+STAND_IN_LM_API = r'''
+import json, os, sys, time
+args = sys.argv[1:]
+prompt = args[args.index("--prompt") + 1]
+text = prompt.split("Text to convert: ", 1)[1].split("\n\nPlease generate", 1)[0]
+start = time.time()
+time.sleep(float(os.environ.get("STAND_IN_DELAY", "0")))
+with open(os.environ["STAND_IN_LOG"], "a") as f:
+    f.write(json.dumps({"text": text, "start": start, "end": time.time()}) + "\n")
+print(json.dumps({"status": "success", "data": {"content": "spoken: " + text}}))
+'''
+
+
+@pytest.fixture
+def tts_stand_in(tmp_path, monkeypatch):
+    """Local stand-in for the LM Studio bridge script; returns a reader for the chunks it synthesized"""
+    import json
+    script = tmp_path / "lm_api_stand_in.py"
+    script.write_text(STAND_IN_LM_API)
+    log = tmp_path / "tts.log"
+    monkeypatch.setenv("MEDIA_LM_API", str(script))
+    monkeypatch.setenv("STAND_IN_LOG", str(log))
+
+    def calls():
+        if not log.exists():
+            return []
+        return [json.loads(line) for line in log.read_text().splitlines()]
+    return calls
+
+
+class TestChunkedAudioSynthesis:
+    """Test SSML tokenization and sentence-level chunked synthesis"""
+
+    def test_ssml_tokenizer(self):
+        """Test paragraphs, explicit sentences, breaks and entities become ordered chunks"""
+        from services.media.ssml import chunks, plain_text
+        doc = ('<speak><voice name="a"><p><s>First one.</s><s>Fish &amp; chips</s></p>'
+               '<p>New para. Another!<break time="1.5s"/>After <emphasis>the</emphasis> break</p></voice></speak>')
+        parsed = chunks(doc)
+        assert [(c.paragraph, c.text, c.break_after_ms) for c in parsed] == [
+            (0, "First one.", 0), (0, "Fish & chips", 0),
+            (1, "New para.", 0), (1, "Another!", 1500), (1, "After the break", 0),
+        ]
+        assert [c.paragraph for c in chunks("One. Two.\n\nThree.")] == [0, 0, 1]
+        assert plain_text("<speak>Hello,   world.</speak>") == "Hello, world."
+        assert chunks('<speak><break strength="strong"/></speak>') == []
+
+    def test_only_edited_sentences_are_resynthesized(self, tts_stand_in):
+        """Test chunk results are cached by sentence and voice settings and stitched in order"""
+        draft = "<speak><p>The tide turns. The harbor floods.</p><p>We run.</p></speak>"
+        first = client.post("/audio/synth", json={"ssml": draft}).json()
+        assert first["status"] == "ok"
+        segments = first["data"]["audio"]["tts_processing"]["segments"]
+        assert [s["text"] for s in segments] == ["The tide turns.", "The harbor floods.", "We run."]
+        assert [s["paragraph"] for s in segments] == [0, 0, 1]
+        assert segments[1]["start_sec"] == segments[0]["end_sec"]
+        assert first["data"]["audio"]["duration_sec"] == segments[-1]["end_sec"]
+        assert first["meta"]["chunk_cache"] == {"hits": 0, "misses": 3}
+
+        edited = draft.replace("The harbor floods.", "The harbor is gone.")
+        second = client.post("/audio/synth", json={"ssml": edited}).json()
+        assert second["meta"]["chunk_cache"] == {"hits": 2, "misses": 1}
+        assert [c["text"] for c in tts_stand_in()][3:] == ["The harbor is gone."]
+        assert [s["cached"] for s in second["data"]["audio"]["tts_processing"]["segments"]] == [True, False, True]
+
+        slower = client.post("/audio/synth", json={"ssml": edited, "speed": 0.5}).json()
+        assert slower["meta"]["chunk_cache"] == {"hits": 0, "misses": 3}
+
+    def test_chunks_synthesized_concurrently(self, tts_stand_in, monkeypatch):
+        """Test chunk synthesis overlaps instead of running one sentence at a time"""
+        monkeypatch.setenv("STAND_IN_DELAY", "0.3")
+        text = " ".join(f"Sentence number {i}." for i in range(4))
+        assert client.post("/audio/synth", json={"ssml": text}).json()["status"] == "ok"
+        calls = sorted(tts_stand_in(), key=lambda c: c["start"])
+        assert len(calls) == 4
+        assert calls[1]["start"] < calls[0]["end"]
+
+    def test_streaming_long_narration(self, tts_stand_in, monkeypatch):
+        """Test audiobook-length input streams ordered NDJSON segments past the single-shot limit"""
+        import json
+        import services.media.main as media_main
+        monkeypatch.setattr(media_main, "TTS_CHUNK_CONCURRENCY", 16)
+        text = " ".join(f"Line {i} of the long narration, read slowly and clearly." for i in range(100))
+        assert len(text) > 5000
+        assert client.post("/audio/synth", json={"ssml": text}).status_code == 422
+        response = client.post("/audio/synth/stream", json={"ssml": text})
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        records = [json.loads(line) for line in response.text.splitlines()]
+        assert [r["segment"]["index"] for r in records[:-1]] == list(range(100))
+        done = records[-1]
+        assert done["type"] == "done" and done["chunks"] == 100
+        assert done["duration_sec"] == records[-2]["segment"]["end_sec"]
+        assert done["word_count"] == 100 * 10
+
+    def test_stream_reports_synthesis_errors(self, tmp_path, monkeypatch):
+        """Test a failing chunk ends the stream with an error envelope"""
+        import json
+        monkeypatch.setenv("MEDIA_LM_API", str(tmp_path / "missing.py"))
+        response = client.post("/audio/synth/stream", json={"ssml": "One. Two."})
+        last = json.loads(response.text.splitlines()[-1])
+        assert last["status"] == "error" and last["error"]["code"] == "AUDIO_SYNTH_FAILED"
+
+
+class TestAssetCatalog:
+    """Test the persistent asset catalog behind /media/assets"""
+
+    def _seed(self, n=250):
+        from services.media import catalog
+        rows = []
+        for i in range(n):
+            rows.append({
+                "id": f"asset_{i:04d}",
+                "type": "image" if i % 2 else "audio",
+                "provider": "dalle" if i % 3 else "lm_studio",
+                "uri": f"asset://x/{i}",
+                "size_bytes": i,
+                "prompt_hash": f"h{i % 5}",
+                "anchors": ["char_elyra"] if i % 4 == 0 else ["loc_harbor"],
+                "metadata": {"n": i},
+                # Several assets share a timestamp, so ties must be broken by id
+                "created_at": f"2026-01-01T00:{i // 60:02d}:{(i // 3) % 60:02d}.000000+00:00",
+            })
+        catalog.get_catalog().add_many(rows)
+        return rows
+
+    def _pages(self, query):
+        seen, cursor = [], None
+        while True:
+            url = f"/media/assets?{query}" + (f"&cursor={cursor}" if cursor else "")
+            data = client.get(url).json()["data"]
+            seen.extend(data["assets"])
+            cursor = data["next_cursor"]
+            if cursor is None:
+                return seen
+
+    def test_re_recorded_asset_replaces_every_column(self):
+        """Test recording an existing id again replaces its anchors, prompt hash and timestamp"""
+        from services.media import catalog
+        cat = catalog.get_catalog()
+        base = {"id": "asset_re", "type": "image", "provider": "dalle", "uri": "asset://old", "size_bytes": 1}
+        cat.add({**base, "prompt_hash": "old", "anchors": ["char_elyra"], "created_at": "2026-01-01T00:00:00.000000+00:00"})
+        cat.add({**base, "uri": "asset://new", "prompt_hash": "new", "anchors": ["loc_harbor"],
+                 "created_at": "2026-02-01T00:00:00.000000+00:00"})
+        assert cat.list(anchor="char_elyra")[0] == [] and cat.list(prompt_hash="old")[0] == []
+        (asset,), _ = cat.list(anchor="loc_harbor")
+        assert asset["uri"] == "asset://new" and asset["prompt_hash"] == "new"
+        assert asset["created_at"].startswith("2026-02-01")
+
+    def test_keyset_pagination_walks_every_asset_once(self):
+        """Test pages are newest first, disjoint, and cover the catalog"""
+        rows = self._seed()
+        seen = self._pages("limit=40")
+        assert len(seen) == len(rows) == len({a["id"] for a in seen})
+        keys = [(a["created_at"], a["id"]) for a in seen]
+        assert keys == sorted(keys, reverse=True)
+
+    def test_filters_compose_with_pagination(self):
+        """Test type, provider, anchor and prompt hash filters"""
+        rows = self._seed()
+        expected = {r["id"] for r in rows if r["type"] == "audio" and "char_elyra" in r["anchors"]
+                    and r["prompt_hash"] == "h0"}
+        got = self._pages("limit=3&asset_type=audio&anchor=char_elyra&prompt_hash=h0")
+        assert {a["id"] for a in got} == expected
+        assert all(a["anchors"] == ["char_elyra"] for a in got)
+        dalle = self._pages("limit=100&provider=dalle")
+        assert len(dalle) == sum(1 for r in rows if r["provider"] == "dalle")
+
+    def test_bulk_fetch_and_bad_cursor(self):
+        """Test bulk metadata fetch keeps request order and reports missing ids"""
+        self._seed(10)
+        response = client.post("/media/assets/bulk", json={"ids": ["asset_0007", "nope", "asset_0002"]})
+        data = response.json()["data"]
+        assert [a["id"] for a in data["assets"]] == ["asset_0007", "asset_0002"]
+        assert data["assets"][0]["metadata"] == {"n": 7}
+        assert data["missing"] == ["nope"]
+        bad = client.get("/media/assets?cursor=not-a-cursor")
+        assert bad.status_code == 400 and bad.json()["error"]["code"] == "INVALID_CURSOR"
+
+    def test_gallery_queries_use_indexes(self):
+        """Test filtered, paged queries are index range scans without a sort step"""
+        from services.media import catalog
+        cat = catalog.get_catalog()
+        cases = [dict(anchor="char_elyra"), dict(asset_type="image"), dict(provider="dalle"),
+                 dict(prompt_hash="h1"), {}]
+        for filters in cases:
+            sql, params = cat._list_sql(filters.get("asset_type"), filters.get("provider"), filters.get("anchor"),
+                                        filters.get("prompt_hash"), ("2026-01-01", "x"), 50)
+            plan = " ".join(row[-1] for row in cat._fetchall("EXPLAIN QUERY PLAN " + sql, params))
+            assert "USING" in plan and "INDEX" in plan, (filters, plan)
+            assert "TEMP B-TREE" not in plan, (filters, plan)
+
+    def test_generated_assets_are_recorded(self, stand_in):
+        """Test new generations appear in the catalog with their anchors and prompt hash"""
+        body = client.post("/visual/generate", json={"prompt": "Elyra at the pier", "provider": "dalle",
+                                                     "anchors": ["char_elyra"], "n": 2}).json()
+        ids = {v["id"] for v in body["data"]["variants"]}
+        prompt_hash = body["data"]["image"]["metadata"]["prompt_hash"]
+        listed = client.get(f"/media/assets?anchor=char_elyra&prompt_hash={prompt_hash}").json()["data"]["assets"]
+        assert {a["id"] for a in listed} == ids
+        assert all(a["type"] == "image" and a["provider"] == "dalle" for a in listed)
+
+
+def _latency_stand_ins(delays, failing=()):
+    """Stand-in provider calls with injected latency (seconds); records starts, finishes and cancellations"""
+    import asyncio
+    log = {"started": [], "finished": [], "cancelled": []}
+
+    async def call(provider):
+        log["started"].append(provider)
+        try:
+            await asyncio.sleep(delays[provider])
+        except asyncio.CancelledError:
+            log["cancelled"].append(provider)
+            raise
+        log["finished"].append(provider)
+        if provider in failing:
+            return {"error": f"{provider} unavailable"}
+        return {"url": f"https://{provider}.test/image.png"}
+
+    return call, log
+
+
+class TestProviderRouting:
+    """Test latency-aware routing and hedging against stand-in providers with injected latency"""
+
+    def _warm(self, router, delays, rounds=6, failing=()):
+        import asyncio
+        call, _ = _latency_stand_ins(delays, failing)
+
+        async def warm():
+            for provider in delays:
+                for _ in range(rounds):
+                    await router.observe(provider, call)
+        asyncio.run(warm())
+
+    def test_auto_picks_fastest_healthy_provider(self):
+        """Test ranking follows EWMA latency and skips a provider with a high error rate"""
+        import asyncio
+        from services.media import routing
+        router = routing.Router(min_samples=5)
+        self._warm(router, {"slow": 0.04, "fast": 0.005, "broken": 0.0}, failing={"broken"})
+        assert router.rank(["slow", "broken", "fast"]) == ["fast", "slow", "broken"]
+        assert not router.healthy("broken")
+
+        call, log = _latency_stand_ins({"slow": 0.04, "fast": 0.005, "broken": 0.0}, failing={"broken"})
+        outcome = asyncio.run(router.run(["broken", "slow", "fast"], call))
+        assert outcome.provider == "fast" and outcome.attempts == ["fast"] and not outcome.hedged
+        assert log["started"] == ["fast"]
+
+    def test_unmeasured_and_recovered_providers_get_probed(self):
+        """Test a new provider is tried first and an unhealthy one is retried after the probe interval"""
+        import time
+        from services.media import routing
+        router = routing.Router(min_samples=3, probe_after=0.05)
+        self._warm(router, {"known": 0.001, "flaky": 0.0}, rounds=3, failing={"flaky"})
+        assert router.rank(["known", "new", "flaky"]) == ["new", "known", "flaky"]
+        time.sleep(0.06)
+        assert router.healthy("flaky")
+
+    def test_p95_sets_hedge_delay(self):
+        """Test the hedge delay is the windowed p95, clamped, with a default before enough samples"""
+        from services.media import routing
+        router = routing.Router(window=100, min_samples=5, hedge_delay=1.5, hedge_min=0.01, hedge_max=0.09)
+        stats = router.stats("dalle")
+        assert router.delay_for("dalle") == 1.5
+        for ms in range(1, 101):
+            stats.record(ms / 1000, True)
+        assert stats.p95() == 0.095
+        assert router.delay_for("dalle") == 0.09
+        for _ in range(100):
+            stats.record(0.002, True)
+        assert stats.p95() == 0.002 and router.delay_for("dalle") == 0.01
+        assert len(stats.samples) == 100
+
+    def test_hedge_fires_after_p95_and_cancels_loser(self):
+        """Test a stalled primary is raced by the backup after its p95 and the loser is cancelled"""
+        import asyncio
+        import time
+        from services.media import routing
+        router = routing.Router(min_samples=5, hedge_min=0.01)
+        self._warm(router, {"primary": 0.01, "backup": 0.03})
+        assert router.rank(["backup", "primary"]) == ["primary", "backup"]
+        primary_calls = router.stats("primary").calls
+
+        # The primary now stalls far past its p95
+        call, log = _latency_stand_ins({"primary": 2.0, "backup": 0.03})
+        started = time.perf_counter()
+        outcome = asyncio.run(router.run(["primary", "backup"], call, hedge=True))
+        elapsed = time.perf_counter() - started
+        assert outcome.provider == "backup" and outcome.hedged
+        assert outcome.attempts == ["primary", "backup"]
+        assert outcome.result == {"url": "https://backup.test/image.png"}
+        assert log["cancelled"] == ["primary"]
+        assert elapsed < 0.5
+        # Losing the race is not a sample against the primary
+        assert router.stats("primary").calls == primary_calls
+
+    def test_no_hedge_when_primary_answers_within_p95(self):
+        """Test the backup is never started when the primary is on time"""
+        import asyncio
+        from services.media import routing
+        router = routing.Router(min_samples=5)
+        self._warm(router, {"primary": 0.02, "backup": 0.05})
+        call, log = _latency_stand_ins({"primary": 0.001, "backup": 0.05})
+        outcome = asyncio.run(router.run(["primary", "backup"], call, hedge=True))
+        assert outcome.provider == "primary" and not outcome.hedged
+        assert log["started"] == ["primary"]
+
+    def test_failover_and_error_when_all_fail(self):
+        """Test a failing primary fails over to the backup; if both fail the primary's error is returned"""
+        import asyncio
+        from services.media import routing
+        router = routing.Router()
+        call, log = _latency_stand_ins({"a": 0.0, "b": 0.0}, failing={"a"})
+        outcome = asyncio.run(router.run(["a", "b"], call))
+        assert outcome.provider == "b" and outcome.attempts == ["a", "b"] and not outcome.hedged
+        call, _ = _latency_stand_ins({"a": 0.0, "b": 0.0}, failing={"a", "b"})
+        outcome = asyncio.run(router.run(["a", "b"], call, primary="a"))
+        assert outcome.result == {"error": "a unavailable"}
+
+    def test_auto_provider_endpoint_routes_away_from_failing_provider(self, stand_in, monkeypatch):
+        """Test provider=auto fails over to the working stand-in and stops trying the broken one"""
+        monkeypatch.setenv("GOOGLE_API_KEY", "test-key")
+        monkeypatch.setenv("GEMINI_BASE_URL", "http://provider.test")
+        monkeypatch.setenv("MEDIA_AUTO_PROVIDERS", "gemini,dalle")
+        for i in range(5):
+            body = client.post("/visual/generate", json={"prompt": f"Harbor {i}", "provider": "auto"}).json()
+            assert body["status"] == "ok"
+            assert body["data"]["image"]["provider"] == "dalle"
+            assert body["meta"]["provider"] == "dalle"
+            assert body["meta"]["routing"]["variants"][0]["attempts"] == ["gemini", "dalle"]
+        body = client.post("/visual/generate", json={"prompt": "Harbor 5", "provider": "auto"}).json()
+        assert body["meta"]["routing"]["variants"][0]["attempts"] == ["dalle"]
+
+        health = client.get("/media/providers/health").json()["data"]
+        assert health["auto_candidates"] == ["gemini", "dalle"]
+        assert health["providers"]["gemini"]["healthy"] is False
+        assert health["providers"]["gemini"]["error_rate"] == 1.0
+        assert health["providers"]["dalle"]["calls"] == 6 and health["providers"]["dalle"]["p95_ms"] is not None
+        assert health["ranking"][-1] == "gemini"
+
+    def test_auto_requires_a_configured_provider(self, monkeypatch):
+        """Test auto without any configured provider fails cleanly and unknown providers are rejected"""
+        monkeypatch.setenv("MEDIA_AUTO_PROVIDERS", "dalle")
+        monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+        monkeypatch.delenv("DALLE_API_KEY", raising=False)
+        body = client.post("/visual/generate", json={"prompt": "x", "provider": "auto"}).json()
+        assert body["status"] == "error" and body["error"]["code"] == "VISUAL_GEN_FAILED"
+        assert VisualReq(prompt="x", provider="auto", hedge=True).hedge
+        with pytest.raises(ValueError):
+            VisualReq(prompt="x", provider="fastest")
+
+
+class TestBlobStore:
+    """Test generated image bytes land in the content-addressed store and are served from it"""
+
+    def test_generated_images_stored_and_served(self, stand_in):
+        """Test provider output is fetched, deduplicated, and downloadable with Range and ETag"""
+        import os
+        payload = b"\x89PNG\r\n\x1a\n" + os.urandom(300_000)
+        stand_in["image_bytes"] = payload
+        body = client.post("/visual/generate", json={"prompt": "A tide pool", "provider": "dalle", "n": 2}).json()
+        assert body["status"] == "ok"
+        assert body["meta"]["blobs"] == {"stored": 2}
+        first, second = body["data"]["variants"]
+        assert stand_in["downloads"] == 2
+        # Same bytes behind both provider URLs: one blob
+        assert first["blob"]["id"] == second["blob"]["id"]
+        blob = first["blob"]
+        assert first["uri"] == blob["uri"] and blob["uri"].startswith("asset://blobs/")
+        assert first["metadata"]["source_url"].startswith("https://img.test/")
+        assert blob["size_bytes"] == len(payload) and blob["media_type"] == "image/png"
+        assert blob["thumbnail_url"].endswith("/thumbnail?size=256")
+
+        full = client.get(blob["download_url"])
+        assert full.status_code == 200 and full.content == payload
+        assert full.headers["etag"] == blob["etag"]
+        assert full.headers["content-type"] == "image/png"
+        part = client.get(blob["download_url"], headers={"Range": "bytes=100-199"})
+        assert part.status_code == 206 and part.content == payload[100:200]
+        assert part.headers["content-range"] == f"bytes 100-199/{len(payload)}"
+        cached = client.get(blob["download_url"], headers={"If-None-Match": blob["etag"]})
+        assert cached.status_code == 304
+
+        listed = client.get("/media/assets?provider=dalle").json()["data"]["assets"]
+        assert {a["uri"] for a in listed} == {blob["uri"]}
+        assert all(a["size_bytes"] == len(payload) for a in listed)
+
+    def test_fetch_failure_keeps_provider_url(self, stand_in):
+        """Test a provider file that cannot be downloaded leaves the asset on its provider URL"""
+        body = client.post("/visual/generate", json={"prompt": "A reef", "provider": "dalle"}).json()
+        assert body["status"] == "ok"
+        assert body["data"]["image"]["uri"] == "https://img.test/1.png"
+        assert "blob" not in body["data"]["image"]
+        assert body["meta"]["blobs"] == {"stored": 0}
+
+    def test_streamed_write_is_bounded(self, tmp_path):
+        """Test async chunked writes hash as they go and abort past the size cap without leftovers"""
+        import asyncio
+        import hashlib
+        from services.common.artifacts import ArtifactTooLarge, LocalArtifactStore
+        store = LocalArtifactStore(tmp_path / "store")
+
+        async def body(n):
+            for _ in range(n):
+                yield b"x" * 65536
+
+        info = asyncio.run(store.put_async_chunks(body(8), "image/png", max_bytes=1 << 20))
+        assert info["id"] == "sha256:" + hashlib.sha256(b"x" * 65536 * 8).hexdigest()
+        assert info["size_bytes"] == 65536 * 8 and store.stat(info["id"])["media_type"] == "image/png"
+        with pytest.raises(ArtifactTooLarge):
+            asyncio.run(store.put_async_chunks(body(32), max_bytes=1 << 20))
+        assert not list((tmp_path / "store" / "objects").glob(".incoming-*"))
+
+    def test_thumbnail_request_validation(self, stand_in):
+        """Test thumbnail sizes are bounded and only images have thumbnails"""
+        from services.common.artifacts import get_artifact_store
+        missing = client.get("/media/blobs/sha256:" + "0" * 64 + "/thumbnail")
+        assert missing.status_code == 404 and missing.json()["error"]["code"] == "BLOB_NOT_FOUND"
+        text = get_artifact_store().put_bytes(b"not an image", "text/plain")
+        wrong_type = client.get(f"/media/blobs/{text['id']}/thumbnail")
+        assert wrong_type.status_code == 415 and wrong_type.json()["error"]["code"] == "NOT_AN_IMAGE"
+        bad_size = client.get(f"/media/blobs/{text['id']}/thumbnail?size=999")
+        assert bad_size.status_code == 400 and bad_size.json()["error"]["code"] == "INVALID_THUMBNAIL_SIZE"
+
+    def test_thumbnail_without_pillow(self, stand_in):
+        """Test thumbnails report unavailable when Pillow is missing"""
+        from services.common.artifacts import get_artifact_store
+        from services.media import blobs
+        if blobs.Image is not None:
+            pytest.skip("Pillow is installed")
+        image = get_artifact_store().put_bytes(b"\x89PNG\r\n\x1a\n", "image/png")
+        response = client.get(f"/media/blobs/{image['id']}/thumbnail")
+        assert response.status_code == 501
+        assert response.json()["error"]["code"] == "THUMBNAILS_UNAVAILABLE"
+
+    def test_thumbnail_rendered_lazily_and_cached(self, stand_in):
+        """Test the first thumbnail request renders and stores it; later ones reuse the stored file"""
+        import io
+        Image = pytest.importorskip("PIL.Image")
+        from services.common.artifacts import get_artifact_store
+        from services.media import blobs
+        buf = io.BytesIO()
+        Image.new("RGB", (1024, 512), (200, 80, 20)).save(buf, "PNG")
+        image = get_artifact_store().put_bytes(buf.getvalue(), "image/png")
+        first = client.get(f"/media/blobs/{image['id']}/thumbnail?size=128")
+        assert first.status_code == 200 and first.headers["content-type"] == "image/png"
+        assert Image.open(io.BytesIO(first.content)).size == (128, 64)
+        assert blobs.thumbnail(image["id"], 128)["generated"] is False
+        again = client.get(f"/media/blobs/{image['id']}/thumbnail?size=128", headers={"If-None-Match": first.headers["etag"]})
+        assert again.status_code == 304
+
+
+@pytest.fixture
+def canon_stand_in(stand_in, monkeypatch):
+    """Stand-in WorldCore multi-get over a dict of canon entities; records every batch request"""
+    from fastapi import Request
+    canon = {
+        "char_elyra": {"id": "char_elyra", "type": "Character", "name": "Elyra", "status": "CANON",
+                       "traits": {"appearance": "silver-streaked braid, sea-green oilskin coat", "age": 34},
+                       "world_id": "world_tides", "canon_version": 3},
+        "loc_harbor": {"id": "loc_harbor", "type": "Place", "name": "Saltmere Harbor", "status": "CANON",
+                       "traits": {"location": "fog-bound northern fjord", "description": "Basalt quays."},
+                       "world_id": "world_tides", "canon_version": 1},
+    }
+    requests = []
+
+    @stand_in["app"].post("/canon/entities")
+    async def canon_entities(request: Request):
+        body = await request.json()
+        requests.append(body)
+        known = body.get("known", {})
+        entities = {i: canon[i] for i in body["ids"] if i in canon and known.get(i) != canon[i]["canon_version"]}
+        unchanged = {i: canon[i]["canon_version"] for i in body["ids"] if i in canon and i not in entities}
+        return {"status": "ok", "data": {"entities": entities, "unchanged": unchanged,
+                                         "missing": [i for i in body["ids"] if i not in canon]}}
+
+    monkeypatch.setenv("WORLDCORE_BASE", "http://worldcore.test")
+    return {"canon": canon, "requests": requests}
+
+
+class TestAnchorResolution:
+    """Test canon anchors are resolved in one batch, cached by canon version, and composed into prompts"""
+
+    def _generate(self, prompt, anchors):
+        return client.post("/visual/generate", json={"prompt": prompt, "provider": "dalle", "anchors": anchors}).json()
+
+    def test_anchors_resolved_in_one_batched_call(self, canon_stand_in):
+        """Test all anchors go to WorldCore in a single multi-get and reach the provider prompt"""
+        body = self._generate("Elyra mends a net at dawn", ["char_elyra", "loc_harbor", "char_ghost", "char_elyra"])
+        assert body["status"] == "ok"
+        assert canon_stand_in["requests"] == [{"ids": ["char_elyra", "loc_harbor", "char_ghost"], "known": {}}]
+        assert body["meta"]["anchors"] == {"source": "http", "resolved": 2, "missing": ["char_ghost"],
+                                           "cache_hits": 0, "fetched": 2}
+        sent = body["data"]["image"]["metadata"]["revised_prompt"]
+        assert sent.startswith("Create a realistic image: Elyra mends a net at dawn\n\nCanon reference")
+        assert "Elyra (Character): silver-streaked braid, sea-green oilskin coat, age 34" in sent
+        assert "Saltmere Harbor (Place): Basalt quays, fog-bound northern fjord" in sent
+        canon = body["data"]["image"]["metadata"]["canon"]
+        assert canon["anchors"] == [{"id": "char_elyra", "name": "Elyra", "canon_version": 3},
+                                    {"id": "loc_harbor", "name": "Saltmere Harbor", "canon_version": 1}]
+
+    def test_descriptions_cached_by_canon_version(self, canon_stand_in):
+        """Test unchanged entities are not resent, and a canon edit is picked up and regenerates"""
+        self._generate("Elyra at the quay", ["char_elyra", "loc_harbor"])
+        warm = self._generate("Elyra at the quay, night", ["char_elyra", "loc_harbor"])
+        assert canon_stand_in["requests"][-1]["known"] == {"char_elyra": 3, "loc_harbor": 1}
+        assert warm["meta"]["anchors"]["cache_hits"] == 2 and warm["meta"]["anchors"]["fetched"] == 0
+        assert "silver-streaked braid" in warm["data"]["image"]["metadata"]["revised_prompt"]
+
+        cached = self._generate("Elyra at the quay", ["char_elyra", "loc_harbor"])
+        assert cached["meta"]["cache"]["hit"] is True
+
+        # A canon edit bumps the version: re-fetched, and the generation cache no longer matches
+        canon_stand_in["canon"]["char_elyra"].update(
+            canon_version=4, traits={"appearance": "cropped grey hair, harbor-master's coat"})
+        edited = self._generate("Elyra at the quay", ["char_elyra", "loc_harbor"])
+        assert edited["meta"]["cache"]["hit"] is False
+        assert edited["meta"]["anchors"]["fetched"] == 1 and edited["meta"]["anchors"]["cache_hits"] == 1
+        assert "cropped grey hair" in edited["data"]["image"]["metadata"]["revised_prompt"]
+        assert len(canon_stand_in["requests"]) == 4
+
+    def test_worldcore_unavailable_uses_bare_prompt(self, stand_in, monkeypatch):
+        """Test a failed canon lookup still generates from the user's prompt"""
+        monkeypatch.setenv("WORLDCORE_BASE", "http://worldcore.test")
+        body = self._generate("A lighthouse", ["char_elyra"])
+        assert body["status"] == "ok"
+        assert "error" in body["meta"]["anchors"]
+        assert body["data"]["image"]["metadata"]["revised_prompt"] == (
+            "Create a realistic image: A lighthouse. High quality, detailed, professional.")
+
+    def test_anchor_resolution_off_without_worldcore(self, stand_in):
+        """Test anchors stay metadata-only when no canon source is configured"""
+        body = self._generate("A lighthouse", ["char_elyra"])
+        assert "anchors" not in body["meta"]
+        assert body["data"]["image"]["metadata"]["anchors"] == ["char_elyra"]
+
+    def test_descriptions_are_compact(self):
+        """Test canon lines lead with name and type and stay within the per-anchor budget"""
+        from services.media import anchors
+        line = anchors.describe({"id": "char_x", "name": "X", "type": "Character",
+                                 "traits": {"description": "tall " * 200, "age": 40}})
+        assert line.startswith("X (Character): tall")
+        assert len(line) <= anchors.MAX_ANCHOR_CHARS
+        assert anchors.compose_prompt("A duel", []) == "A duel"
@@ -116,6 +116,15 @@ class TestNarrativeAPI:
         data = response.json()
         assert data["status"] == "ok"
         assert data["data"]["ok"] is True
+
+    def test_expired_deadline_is_rejected(self):
+        """Requests whose X-Deadline-Ms budget is already spent get a 504"""
+        response = client.get("/health", headers={"X-Deadline-Ms": "0"})
+        assert response.status_code == 504
+        assert response.json()["error"]["code"] == "DEADLINE_EXCEEDED"
+
+        response = client.get("/health", headers={"X-Deadline-Ms": "5000"})
+        assert response.status_code == 200
     
     def test_outline_endpoint_hero_journey(self):
         """Test outline generation with hero journey structure"""
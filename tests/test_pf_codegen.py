@@ -0,0 +1,444 @@
+import asyncio
+import importlib.util
+
+import httpx
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+from tools.pf_langgraph.codegen import generate
+from tools.pf_langgraph import runtime as rt
+
+# ---- Local stand-in service (served in-process through ASGITransport) ----
+calls = {"outline": 0}
+stand_in = FastAPI()
+
+
+@stand_in.post("/narrative/outline")
+def _outline(body: dict):
+    calls["outline"] += 1
+    return {"status": "ok", "data": {"beats": ["Hook", "Climax"], "premise": body.get("premise")},
+            "error": None, "meta": {}}
+
+
+def _load(spec, tmp_path):
+    p = tmp_path / f"{spec['name']}_graph.py"
+    p.write_text(generate(spec))
+    s = importlib.util.spec_from_file_location(spec["name"], p)
+    m = importlib.util.module_from_spec(s)
+    s.loader.exec_module(m)  # type: ignore
+    return m
+
+
+def _run(m, inputs):
+    async def go():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=stand_in), base_url="http://svc") as c:
+            return await m.run_graph(inputs, client=c)
+    return asyncio.run(go())
+
+
+def _outline_spec(**node_extra):
+    node = {
+        "id": "narrative_outline",
+        "kind": "http_call",
+        "config": {"method": "POST", "url": "http://svc/narrative/outline", "body": {"premise": "${inputs.premise}"}},
+        **node_extra,
+    }
+    return {"version": 1, "name": "cache_flow", "description": "", "inputs": {}, "nodes": [node], "edges": [],
+            "outputs": {"beats": "${nodes.narrative_outline.data.beats}"}}
+
+
+def test_cache_hit_skips_http_call(tmp_path):
+    rt.get_cache("memory").clear()
+    calls["outline"] = 0
+    m = _load(_outline_spec(cache={"key": "${inputs.premise}", "ttl_s": 60}), tmp_path)
+    first = _run(m, {"premise": "a heist"})
+    second = _run(m, {"premise": "a heist"})
+    assert calls["outline"] == 1
+    assert first["nodes"]["narrative_outline"]["meta"]["cache"]["hit"] is False
+    assert second["nodes"]["narrative_outline"]["meta"]["cache"]["hit"] is True
+    assert second["outputs"]["beats"] == ["Hook", "Climax"]
+    _run(m, {"premise": "a romance"})
+    assert calls["outline"] == 2
+
+
+def test_disk_cache_and_no_cache(tmp_path, monkeypatch):
+    monkeypatch.setenv("PF_CACHE_DIR", str(tmp_path / "cache"))
+    rt._CACHES.pop("disk", None)
+    calls["outline"] = 0
+    m = _load(_outline_spec(cache={"backend": "disk"}), tmp_path)
+    _run(m, {"premise": "x"})
+    st = _run(m, {"premise": "x"})
+    assert calls["outline"] == 1 and st["nodes"]["narrative_outline"]["meta"]["cache"]["backend"] == "disk"
+    rt._CACHES.pop("disk", None)
+
+    plain = _load(_outline_spec(), tmp_path)
+    st = _run(plain, {"premise": "x"})
+    assert calls["outline"] == 2 and "cache" not in st["nodes"]["narrative_outline"]["meta"]
+
+
+def test_memory_cache_is_bounded(monkeypatch):
+    monkeypatch.setenv("PF_CACHE_MAX_ENTRIES", "2")
+    monkeypatch.delitem(rt._CACHES, "memory", raising=False)
+    cache = rt.get_cache("memory")
+    cache.put("a", {"v": 1}, None)
+    cache.put("b", {"v": 2}, None)
+    assert cache.get("a") == {"v": 1}
+    cache.put("c", {"v": 3}, None)
+    assert len(cache) == 2
+    assert cache.get("b") is None and cache.get("a") == {"v": 1} and cache.get("c") == {"v": 3}
+
+
+# ---- Timeouts, retries and circuit breakers ----
+flaky = {"fails_left": 0, "hits": 0}
+
+
+@stand_in.post("/flaky")
+def _flaky(body: dict):
+    flaky["hits"] += 1
+    if flaky["fails_left"] > 0:
+        flaky["fails_left"] -= 1
+        return JSONResponse(status_code=503, content={"status": "error"})
+    return {"status": "ok", "data": {"hits": flaky["hits"]}, "error": None, "meta": {}}
+
+
+@stand_in.post("/slow")
+async def _slow(body: dict):
+    await asyncio.sleep(0.5)
+    return {"status": "ok", "data": {}, "error": None, "meta": {}}
+
+
+def _single(node_id, url, **policy):
+    node = {"id": node_id, "kind": "http_call", "config": {"method": "POST", "url": url}, **policy}
+    return {"version": 1, "name": node_id, "description": "", "inputs": {}, "nodes": [node], "edges": [],
+            "outputs": {}}
+
+
+def test_retry_recovers_from_transient_503(tmp_path):
+    flaky.update(fails_left=2, hits=0)
+    m = _load(_single("flaky_retry", "http://svc/flaky", retry={"count": 2, "backoff_ms": 1}), tmp_path)
+    st = _run(m, {})
+    assert st["nodes"]["flaky_retry"]["data"]["hits"] == 3
+
+
+def test_timeout_ms_bounds_slow_dependency(tmp_path):
+    import time
+    m = _load(_single("slow_node", "http://svc/slow", timeout_ms=50), tmp_path)
+    t0 = time.perf_counter()
+    with pytest.raises(TimeoutError):
+        _run(m, {})
+    assert time.perf_counter() - t0 < 0.4
+
+
+def test_circuit_breaker_sheds_after_threshold(tmp_path):
+    rt._BREAKERS.pop("flaky_dep", None)
+    flaky.update(fails_left=100, hits=0)
+    spec = _single("flaky_breaker", "http://svc/flaky",
+                   circuit_breaker={"name": "flaky_dep", "failure_threshold": 2, "cooldown_ms": 60000})
+    m = _load(spec, tmp_path)
+    for _ in range(2):
+        with pytest.raises(httpx.HTTPStatusError):
+            _run(m, {})
+    with pytest.raises(rt.CircuitOpenError):
+        _run(m, {})
+    assert flaky["hits"] == 2
+    assert rt.get_breaker("flaky_dep").state == "open"
+
+
+def test_half_open_probe_always_reports_back():
+    import time
+    rt._BREAKERS.pop("probe_dep", None)
+    policy = {"name": "probe_dep", "failure_threshold": 1, "cooldown_ms": 10}
+    br = rt.get_breaker("probe_dep", 1, 10)
+    br.record_failure()
+    flaky.update(fails_left=0, hits=0)
+
+    async def go(cancel=False, spent=False):
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=stand_in), base_url="http://svc") as c:
+            time.sleep(0.02)  # past the cooldown: the next call is the probe
+            if cancel:
+                probe = asyncio.ensure_future(rt.http_request(c, "POST", "http://svc/slow", {}, breaker=policy))
+                await asyncio.sleep(0.05)
+                probe.cancel()
+                await asyncio.gather(probe, return_exceptions=True)
+            elif spent:
+                with rt.deadline(0):
+                    await rt.http_request(c, "POST", "http://svc/flaky", {}, breaker=policy)
+            else:
+                return await rt.http_request(c, "POST", "http://svc/flaky", {}, breaker=policy)
+
+    asyncio.run(go(cancel=True))  # e.g. the losing call of a race
+    assert br.state == "open"
+    with pytest.raises(rt.DeadlineExceeded):
+        asyncio.run(go(spent=True))
+    assert br.state == "open"
+    assert asyncio.run(go())["status"] == "ok"
+    assert br.state == "closed" and flaky["hits"] == 1
+
+
+# ---- map fan-out ----
+scene_load = {"active": 0, "peak": 0}
+
+
+@stand_in.post("/narrative/scene")
+async def _scene(body: dict):
+    scene_load["active"] += 1
+    scene_load["peak"] = max(scene_load["peak"], scene_load["active"])
+    await asyncio.sleep(0.01 * (5 - body["index"] % 5))  # later items finish first
+    scene_load["active"] -= 1
+    return {"status": "ok", "data": {"slug": f"s{body['index']}", "beat": body["beat"]}, "error": None, "meta": {}}
+
+
+def test_map_fans_out_with_bounded_concurrency_and_order(tmp_path):
+    scene_load.update(active=0, peak=0)
+    spec = _outline_spec()
+    spec["name"] = "map_flow"
+    spec["inputs"] = {}
+    spec["nodes"].append({
+        "id": "scenes",
+        "kind": "map",
+        "config": {
+            "items": "${nodes.narrative_outline.data.beats}",
+            "max_concurrency": 2,
+            "call": {"method": "POST", "url": "http://svc/narrative/scene",
+                     "body": {"beat": "${item}", "index": "${index}"}},
+        },
+    })
+    spec["edges"] = [{"from": "narrative_outline", "to": "scenes"}]
+    spec["outputs"] = {"scenes": "${nodes.scenes.data.items}"}
+    m = _load(spec, tmp_path)
+
+    async def go():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=stand_in)) as c:
+            return await m.run_graph({"premise": "map"}, client=c)
+
+    calls_before = calls["outline"]
+    st = asyncio.run(go())
+    env = st["nodes"]["scenes"]
+    assert env["status"] == "ok" and env["data"]["count"] == 2
+    assert [e["data"]["beat"] for e in st["outputs"]["scenes"]] == ["Hook", "Climax"]
+    assert calls["outline"] == calls_before + 1
+    assert scene_load["peak"] <= 2
+
+
+def test_map_calls_preserves_order_and_bounds_concurrency():
+    state = {"active": 0, "peak": 0}
+
+    async def fn(index, item):
+        state["active"] += 1
+        state["peak"] = max(state["peak"], state["active"])
+        await asyncio.sleep(0.001 * (20 - index))
+        state["active"] -= 1
+        return {"status": "ok", "data": item * 2, "meta": {}}
+
+    results = asyncio.run(rt.map_calls(list(range(20)), fn, max_concurrency=3))
+    assert [r["data"] for r in results] == [i * 2 for i in range(20)]
+    assert state["peak"] == 3
+    env = rt.collect_envelopes(results, max_concurrency=3)
+    assert env["status"] == "ok" and env["meta"]["map"]["count"] == 20
+
+
+# ---- join / race / hedge ----
+provider_hits = {"fast": 0, "slow_done": 0, "validator": 0}
+
+
+@stand_in.post("/provider/{name}")
+async def _provider(name: str, body: dict):
+    delay = {"fast": 0.01, "slow": 0.5, "broken": 0.0}.get(name, 0.05)
+    await asyncio.sleep(delay)
+    if name == "broken":
+        return {"status": "error", "data": None, "error": {"code": "down"}, "meta": {}}
+    if name == "slow":
+        provider_hits["slow_done"] += 1
+    return {"status": "ok", "data": {"provider": name, "agree": body.get("agree", True)}, "error": None, "meta": {}}
+
+
+def _fan_in(node_id, kind, config):
+    return {"version": 1, "name": node_id, "description": "", "inputs": {},
+            "nodes": [{"id": node_id, "kind": kind, "config": config}], "edges": [], "outputs": {}}
+
+
+def _call(name, **body):
+    return {"method": "POST", "url": f"http://svc/provider/{name}", "body": body}
+
+
+def test_race_first_success_wins_and_cancels_losers(tmp_path):
+    provider_hits["slow_done"] = 0
+    m = _load(_fan_in("race_node", "race", {"calls": [_call("slow"), _call("broken"), _call("fast")]}), tmp_path)
+    env = _run(m, {})["nodes"]["race_node"]
+    assert env["status"] == "ok" and env["data"]["provider"] == "fast"
+    assert env["meta"]["race"]["winner"] == 2 and env["meta"]["race"]["cancelled"] == 1
+    assert provider_hits["slow_done"] == 0
+
+
+def test_join_quorum_with_accept_expression(tmp_path):
+    calls = [_call("fast", agree=True), _call("mid", agree=False), _call("mid", agree=True), _call("slow")]
+    cfg = {"calls": calls, "mode": "quorum", "quorum": 2, "accept": "${result.data.agree}"}
+    env = _run(_load(_fan_in("quorum_node", "join", cfg), tmp_path), {})["nodes"]["quorum_node"]
+    assert env["status"] == "ok"
+    assert env["data"]["accepted"] == [0, 2]
+    assert env["meta"]["join"]["cancelled"] == 1
+
+    env = _run(_load(_fan_in("all_node", "join", {"calls": [_call("fast"), _call("broken")]}), tmp_path), {})
+    assert env["nodes"]["all_node"]["status"] == "error"
+
+
+def test_hedge_starts_backup_after_delay(tmp_path):
+    cfg = {"call": _call("slow"), "backup": _call("fast"), "delay_ms": 20}
+    env = _run(_load(_fan_in("hedge_node", "hedge", cfg), tmp_path), {})["nodes"]["hedge_node"]
+    assert env["data"]["provider"] == "fast" and env["meta"]["hedge"]["winner"] == 1
+
+    cfg = {"call": _call("fast"), "backup": _call("slow"), "delay_ms": 200}
+    env = _run(_load(_fan_in("hedge_fast", "hedge", cfg), tmp_path), {})["nodes"]["hedge_fast"]
+    assert env["meta"]["hedge"]["winner"] == 0
+
+
+def test_fan_in_calls_have_their_own_breakers_and_cache(tmp_path):
+    for i in range(2):
+        rt._BREAKERS.pop(f"race_cb:{i}", None)
+    flaky.update(fails_left=100, hits=0)
+    flaky_call = {"method": "POST", "url": "http://svc/flaky", "body": {}}
+    spec = _fan_in("race_cb", "race", {"calls": [flaky_call, _call("fast")]})
+    spec["nodes"][0]["circuit_breaker"] = {"failure_threshold": 1, "cooldown_ms": 60000}
+    spec["nodes"][0]["cache"] = {"key": "${inputs.topic}"}
+    assert "cached_call('race_cb#0'" in generate(spec) and "cached_call('race_cb#1'" in generate(spec)
+    m = _load(spec, tmp_path)
+    for _ in range(2):
+        env = _run(m, {"topic": None})["nodes"]["race_cb"]
+        assert env["status"] == "ok" and env["data"]["provider"] == "fast"
+    assert rt.get_breaker("race_cb:0").state == "open"
+    assert rt.get_breaker("race_cb:1").state == "closed"
+
+
+# ---- local_call ----
+@stand_in.post("/api/qa/trope-budget")
+def _remote_tropes(body: dict):
+    return {"status": "ok", "data": {"used": -1, "remote": True}, "error": None, "meta": {}}
+
+
+def _local_spec():
+    node = {
+        "id": "qa_local",
+        "kind": "local_call",
+        "config": {
+            "target": "services.worldcore.api.qa._analyze_tropes",
+            "kwargs": {"text": "${inputs.draft}"},
+            "remote": {"method": "POST", "url": "http://svc/api/qa/trope-budget", "body": {"draft": "${inputs.draft}"}},
+        },
+    }
+    return {"version": 1, "name": "local_flow", "description": "", "inputs": {}, "nodes": [node], "edges": [],
+            "outputs": {"used": "${nodes.qa_local.data.used}"}}
+
+
+def test_local_call_runs_in_process_and_switches_to_remote(tmp_path, monkeypatch):
+    m = _load(_local_spec(), tmp_path)
+    monkeypatch.delenv("PF_CALL_MODE", raising=False)
+    st = _run(m, {"draft": "The chosen one meets a mysterious stranger."})
+    assert st["outputs"]["used"] == 2
+    assert st["nodes"]["qa_local"]["meta"]["local_call"]["target"].endswith("_analyze_tropes")
+
+    monkeypatch.setenv("PF_CALL_MODE", "remote")
+    st = _run(m, {"draft": "The chosen one"})
+    assert st["nodes"]["qa_local"]["data"] == {"used": -1, "remote": True}
+
+
+def test_local_call_registry_and_prefix_guard():
+    @rt.register_local("tests.async_echo")
+    async def _echo(x):
+        return {"status": "ok", "data": {"x": x}}
+
+    env = asyncio.run(rt.local_call("tests.async_echo", [3]))
+    assert env["data"] == {"x": 3} and env["error"] is None and "meta" in env
+    with pytest.raises(LookupError):
+        asyncio.run(rt.local_call("os.system", ["true"]))
+
+
+# ---- Delta validation, in-place merging and blob references ----
+def test_large_payloads_are_stored_by_reference(tmp_path, monkeypatch):
+    monkeypatch.setenv("PF_INLINE_MAX_BYTES", "16")
+    spec = _outline_spec()
+    spec["name"] = "blob_flow"
+    spec["nodes"].append({
+        "id": "scenes",
+        "kind": "map",
+        "config": {"items": "${nodes.narrative_outline.data.beats}",
+                   "call": {"method": "POST", "url": "http://svc/narrative/scene",
+                            "body": {"beat": "${item}", "index": "${index}"}}},
+    })
+    spec["edges"] = [{"from": "narrative_outline", "to": "scenes"}]
+    spec["outputs"] = {"beats": "${nodes.narrative_outline.data.beats}", "outline": "${nodes.narrative_outline}"}
+    st = _run(_load(spec, tmp_path), {"premise": "big"})
+    ref = st["nodes"]["narrative_outline"]["data"]
+    assert rt.is_ref(ref) and ref["$blob"].startswith("sha256:")
+    assert rt.load_ref(ref)["beats"] == ["Hook", "Climax"]
+    assert st["outputs"]["beats"] == ["Hook", "Climax"]
+    assert st["outputs"]["outline"]["data"]["premise"] == "big"
+    assert st["nodes"]["scenes"]["status"] == "ok"
+
+
+def test_merge_into_updates_in_place_and_wrapper_rejects_non_envelopes(tmp_path):
+    left = {"a": 1}
+    assert rt.merge_into(left, {"b": 2}) is left and left == {"a": 1, "b": 2}
+    assert rt.merge_into(None, {"c": 3}) == {"c": 3}
+
+    spec = _single("bare", "http://svc/narrative/outline")
+    m = _load(spec, tmp_path)
+
+    async def bad(state, client, env):
+        return {"nodes": {"bare": {"no": "envelope"}}}
+
+    with pytest.raises(ValueError, match="node:bare"):
+        asyncio.run(m._wrap_node(bad, None, {})({"nodes": {}}))
+
+
+# ---- Run deadlines ----
+seen_deadlines = []
+
+
+@stand_in.post("/deadline/echo")
+def _deadline_echo(body: dict, request: Request):
+    seen_deadlines.append(request.headers.get(rt.DEADLINE_HEADER))
+    return {"status": "ok", "data": {}, "error": None, "meta": {}}
+
+
+def _run_with_deadline(m, deadline_ms):
+    async def go():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=stand_in), base_url="http://svc") as c:
+            return await m.run_graph({}, client=c, deadline_ms=deadline_ms)
+    return asyncio.run(go())
+
+
+def test_deadline_is_forwarded_and_clamps_node_timeouts(tmp_path):
+    import time
+    seen_deadlines.clear()
+    _run_with_deadline(_load(_single("echo_node", "http://svc/deadline/echo"), tmp_path), 2000)
+    assert seen_deadlines and 0 < int(seen_deadlines[0]) <= 2000
+    _run(_load(_single("echo_plain", "http://svc/deadline/echo"), tmp_path), {})
+    assert seen_deadlines[-1] is None
+
+    # The node allows 60s, but the run only has 50ms left
+    m = _load(_single("slow_deadline", "http://svc/slow"), tmp_path)
+    t0 = time.perf_counter()
+    with pytest.raises(TimeoutError):
+        _run_with_deadline(m, 50)
+    assert time.perf_counter() - t0 < 0.4
+
+
+def test_spent_deadline_fails_fast_and_skips_retries():
+    async def go():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=stand_in), base_url="http://svc") as c:
+            with rt.deadline(0):
+                await rt.http_request(c, "POST", "http://svc/flaky", {}, retry={"count": 3})
+    flaky.update(fails_left=0, hits=0)
+    with pytest.raises(rt.DeadlineExceeded):
+        asyncio.run(go())
+    assert flaky["hits"] == 0
+
+    async def go_retry():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=stand_in), base_url="http://svc") as c:
+            with rt.deadline(100):
+                await rt.http_request(c, "POST", "http://svc/flaky", {}, retry={"count": 3, "backoff_ms": 500})
+    flaky.update(fails_left=5, hits=0)
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(go_retry())
+    assert flaky["hits"] == 1
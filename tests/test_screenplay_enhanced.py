@@ -9,11 +9,18 @@ from services.screenplay.main import (
     app, SceneCard, ExportReq, Scene, 
     generate_fountain_content, generate_fdx_content, 
     generate_html_content, generate_plain_text_content,
-    estimate_page_count
+    estimate_page_count, generate_screenplay_content, SUPPORTED_FORMATS
 )
+from services.screenplay import pdf, render
 
 client = TestClient(app)
 
+
+@pytest.fixture(autouse=True)
+def _artifact_dir(tmp_path, monkeypatch):
+    """Keep exported artifacts out of the working tree"""
+    monkeypatch.setenv("ARTIFACT_STORE_DIR", str(tmp_path / "artifacts"))
+
 class TestSceneCardValidation:
     """Test SceneCard validation"""
     
@@ -577,3 +584,403 @@ class TestSceneFormatting:
         assert formatted_dialogue[0]["text"] == "What is this fog?"
         assert formatted_dialogue[1]["character"] == "CAPTAIN RIOS"
         assert formatted_dialogue[1]["text"] == "I've never seen anything like it."
+
+class TestStreamingExport:
+    """Test chunked renderers and the streaming export endpoint"""
+
+    def _request_data(self, fmt, scenes=3):
+        return {
+            "cards": [
+                {
+                    "slug": f"scene_{i}",
+                    "where": "Harbor <of> Lumen",
+                    "who": ["Elyra"],
+                    "goal": "Establish the setting",
+                    "dialogue": [{"character": "Elyra", "text": "Fish & <chips>?"}],
+                    "action": "Elyra stands at the harbor."
+                }
+                for i in range(scenes)
+            ],
+            "format": fmt,
+            "title": "Rock & Roll"
+        }
+
+    def test_stream_matches_rendered_content(self):
+        """Test streamed bytes equal the rendered document for each format"""
+        for fmt in ["fountain", "fdx", "html"]:
+            data = self._request_data(fmt)
+            response = client.post("/screenplay/export/stream", json=data)
+            assert response.status_code == 200
+            expected = generate_screenplay_content(ExportReq(**data))
+            assert response.text == expected
+
+            size = client.post("/screenplay/export", json=data).json()["data"]["artifact"]["size_bytes"]
+            assert size == len(expected.encode("utf-8"))
+
+    def test_markup_is_escaped(self):
+        """Test XML/HTML special characters are escaped"""
+        req = ExportReq(**self._request_data("fdx", scenes=1))
+        fdx = generate_fdx_content(req)
+        assert "<Title>Rock &amp; Roll</Title>" in fdx
+        assert "Fish &amp; &lt;chips&gt;?" in fdx
+        html = generate_html_content(req)
+        assert "HARBOR &lt;OF&gt; LUMEN" in html and "<chips>" not in html
+
+    def test_renderer_yields_one_chunk_per_scene(self):
+        """Test renderers are incremental rather than building one string"""
+        req = ExportReq(**self._request_data("fdx", scenes=5))
+        chunks = list(render.render(req))
+        assert len(chunks) == 5 + 2  # title page, scenes, trailer
+        assert b"".join(render.encode_chunks(iter(chunks), chunk_bytes=1)) == "".join(chunks).encode()
+
+    def test_reexport_renders_only_changed_scenes(self):
+        """Test the scene cache serves unchanged cards on re-export"""
+        render.SCENE_CACHE.clear()
+        data = self._request_data("fountain", scenes=4)
+        first = client.post("/screenplay/export", json=data).json()["meta"]["render_cache"]
+        assert first["misses"] == 4 and first["hits"] == 0
+
+        data["cards"][2]["action"] = "Elyra turns away."
+        second = client.post("/screenplay/export", json=data).json()["meta"]["render_cache"]
+        assert second["misses"] == 1 and second["hits"] == 3
+
+    def test_plain_scene_numbers_stay_out_of_fragments(self):
+        """Test reordered scenes reuse fragments but keep correct numbering"""
+        render.SCENE_CACHE.clear()
+        req = ExportReq(**self._request_data("fountain", scenes=1))
+        card_a = req.cards[0]
+        card_b = card_a.model_copy(update={"slug": "other", "where": "Lighthouse"})
+        stats = {}
+        first = "".join(render.render_plain(req.model_copy(update={"cards": [card_a, card_b]}), stats))
+        second = "".join(render.render_plain(req.model_copy(update={"cards": [card_b, card_a]}), stats))
+        assert stats == {"misses": 2, "hits": 2}
+        assert second.index("SCENE 1\nINT. LIGHTHOUSE") < second.index("SCENE 2\nINT. HARBOR")
+        assert first.index("SCENE 1\nINT. HARBOR") < first.index("SCENE 2\nINT. LIGHTHOUSE")
+
+class TestArtifactStore:
+    """Test content-addressed storage and serving of exports"""
+
+    def _request_data(self, title="Harbor"):
+        return {
+            "cards": [{"slug": "scene_1", "where": "Harbor of Lumen", "who": ["Elyra"],
+                       "goal": "Establish the setting", "action": "Elyra stands at the harbor."}],
+            "format": "fountain",
+            "title": title
+        }
+
+    def test_repeat_export_reuses_stored_artifact(self):
+        """Test an unchanged script is not re-rendered"""
+        render.SCENE_CACHE.clear()
+        first = client.post("/screenplay/export", json=self._request_data()).json()
+        second = client.post("/screenplay/export", json=self._request_data()).json()
+        assert first["meta"]["artifact_store"]["reused"] is False
+        assert second["meta"]["artifact_store"]["reused"] is True
+        assert second["meta"]["render_cache"]["misses"] == 0 and second["meta"]["render_cache"]["hits"] == 0
+        assert first["data"]["artifact"]["id"] == second["data"]["artifact"]["id"]
+        assert first["data"]["artifact"]["id"].startswith("sha256:")
+
+    def test_identical_content_is_deduplicated(self):
+        """Test different requests producing the same bytes share one artifact"""
+        a = client.post("/screenplay/export", json=self._request_data()).json()
+        data = self._request_data()
+        data["version"] = "2.0"  # not rendered, so the bytes are identical
+        b = client.post("/screenplay/export", json=data).json()
+        assert b["meta"]["artifact_store"] == {"reused": False, "deduplicated": True}
+        assert a["data"]["artifact"]["id"] == b["data"]["artifact"]["id"]
+
+    def test_get_artifact_supports_range_and_etag(self):
+        """Test artifact download with Range and If-None-Match"""
+        artifact = client.post("/screenplay/export", json=self._request_data()).json()["data"]["artifact"]
+        full = client.get(artifact["download_url"])
+        assert full.status_code == 200
+        assert full.headers["etag"] == artifact["etag"]
+        assert full.content == generate_fountain_content(ExportReq(**self._request_data())).encode()
+        assert len(full.content) == artifact["size_bytes"]
+
+        part = client.get(artifact["download_url"], headers={"Range": "bytes=0-9"})
+        assert part.status_code == 206 and part.content == full.content[:10]
+
+        cached = client.get(artifact["download_url"], headers={"If-None-Match": artifact["etag"]})
+        assert cached.status_code == 304
+
+        missing = client.get("/screenplay/artifacts/sha256:" + "0" * 64)
+        assert missing.status_code == 404 and missing.json()["error"]["code"] == "ARTIFACT_NOT_FOUND"
+        assert client.get("/screenplay/artifacts/..%2Fetc").status_code == 404
+
+class TestBundleExport:
+    """Test multi-format bundle export"""
+
+    def _request_data(self, **extra):
+        return {
+            "cards": [{"slug": "scene_1", "where": "Harbor of Lumen", "who": ["Elyra"],
+                       "goal": "Establish the setting", "action": "Elyra stands at the harbor."}],
+            "title": "The Harbor Mystery",
+            **extra
+        }
+
+    def test_bundle_renders_every_requested_format(self):
+        """Test one request yields one artifact per format"""
+        with TestClient(app) as c:
+            response = c.post("/screenplay/export/bundle", json=self._request_data())
+        data = response.json()
+        assert data["status"] == "ok"
+        artifacts = data["data"]["bundle"]["artifacts"]
+        assert [a["type"] for a in artifacts] == SUPPORTED_FORMATS
+        by_type = {a["type"]: a for a in artifacts}
+        fdx = client.get(by_type["fdx"]["download_url"]).text
+        req = ExportReq(**self._request_data(format="fdx"))
+        assert fdx == generate_fdx_content(req)
+        # Same content-addressed artifact as a single-format export
+        single = client.post("/screenplay/export", json=self._request_data(format="fdx")).json()
+        assert single["data"]["artifact"]["id"] == by_type["fdx"]["id"]
+        assert single["meta"]["artifact_store"]["reused"] is True
+
+    def test_bundle_zip_and_validation(self):
+        """Test zipped bundles and rejection of unknown formats"""
+        import io
+        import zipfile
+        response = client.post("/screenplay/export/bundle",
+                               json=self._request_data(formats=["fountain", "html", "fountain"], zip=True))
+        bundle = response.json()["data"]["bundle"]
+        assert [a["type"] for a in bundle["artifacts"]] == ["fountain", "html"]
+        archive = zipfile.ZipFile(io.BytesIO(client.get(bundle["zip"]["download_url"]).content))
+        assert sorted(archive.namelist()) == ["The_Harbor_Mystery.fountain", "The_Harbor_Mystery.html",
+                                              "manifest.json"]
+
+        response = client.post("/screenplay/export/bundle", json=self._request_data(formats=["docx"]))
+        assert response.status_code == 422
+
+class TestPdfExport:
+    """Test PDF layout, pagination and the worker-pool export path"""
+
+    def _req(self, scenes=1, speech_words=8, title="Harbor"):
+        cards = [SceneCard(slug=f"s{i}", where="Harbor of Lumen", who=["Elyra"], goal="Cross the bay",
+                           action="Elyra stands at the harbor (again).",
+                           dialogue=[{"character": "Elyra", "text": " ".join(["fog"] * speech_words)}])
+                 for i in range(scenes)]
+        return ExportReq(cards=cards, format="pdf", title=title, author="Test Author")
+
+    def test_pdf_is_well_formed(self):
+        """Test xref offsets and page tree of the generated PDF"""
+        import re
+        req = self._req(scenes=40)
+        data = render.render_bytes(req)
+        assert data.startswith(b"%PDF-1.4") and data.rstrip().endswith(b"%%EOF")
+        startxref = int(data.rsplit(b"startxref", 1)[1].split()[0])
+        entries = data[startxref:].split(b"\n")[3:]
+        for num, entry in enumerate(entries[:10], 1):
+            offset = int(entry.split()[0])
+            assert data[offset:].startswith(b"%d 0 obj" % num)
+        count = int(re.search(rb"/Count (\d+)", data).group(1))
+        assert count == pdf.page_count(req) + 1  # plus title page
+        import zlib
+        text = b"".join(zlib.decompress(m) for m in re.findall(rb"stream\n(.*?)\nendstream", data, re.S))
+        assert b"(Elyra stands at the harbor \\(again\\).) Tj" in text
+        assert b"(2.) Tj" in text  # page numbers from page 2
+
+    def test_paginator_respects_page_rules(self):
+        """Test line budget, heading keep-with-next and (MORE)/(CONT'D) splits"""
+        pages = pdf.paginate(pdf.layout(self._req(scenes=3, speech_words=900)))
+        assert len(pages) > 3
+        for page in pages:
+            assert len(page) <= pdf.LINES_PER_PAGE
+            rows = [r for r in page if r is not None]
+            assert rows[-1][0] != "heading"
+        flat = [r for page in pages for r in page if r is not None]
+        assert ("more", "(MORE)") in flat
+        assert ("character", "ELYRA (CONT'D)") in flat
+        for prev, page in zip(pages, pages[1:]):
+            if prev[-1] == ("more", "(MORE)"):
+                assert page[0] == ("character", "ELYRA (CONT'D)")
+
+    def test_format_reports_exact_page_count(self):
+        """Test /screenplay/format uses the PDF paginator"""
+        req = self._req(scenes=30, speech_words=60)
+        data = client.post("/screenplay/format", json=req.model_dump()).json()
+        assert data["data"]["total_pages"] == pdf.page_count(req) > 1
+
+    def test_pdf_export_runs_in_pool_and_sheds_when_full(self, monkeypatch):
+        """Test PDF export through the worker pool and the bounded queue"""
+        import threading
+        from services.screenplay import main as screenplay_main
+        with TestClient(app) as c:
+            body = self._req(scenes=2).model_dump()
+            artifact = c.post("/screenplay/export", json=body).json()["data"]["artifact"]
+            download = c.get(artifact["download_url"])
+            assert download.headers["content-type"] == "application/pdf"
+            assert download.content.startswith(b"%PDF")
+
+            full = threading.BoundedSemaphore(1)
+            full.acquire()
+            monkeypatch.setattr(screenplay_main, "_pool_slots", full)
+            body["title"] = "Another"
+            response = c.post("/screenplay/export", json=body)
+            assert response.status_code == 503
+            assert response.json()["error"]["code"] == "RENDER_QUEUE_FULL"
+        # The app's lifespan shuts the worker pool down
+        assert screenplay_main._pool is None
+
+class TestScriptImport:
+    """Test streaming Fountain/FDX import into SceneCards"""
+
+    def _req(self, fmt):
+        cards = [
+            SceneCard(slug="s1", where="Harbor of Lumen", who=["Elyra", "Rios"], goal="Establish the setting",
+                      when={"time": "NIGHT"}, action="Elyra stands at the harbor.",
+                      dialogue=[{"character": "Elyra", "text": "What is this fog?"},
+                                {"character": "Rios", "text": "Fish & chips?"}]),
+            SceneCard(slug="s2", where="Lighthouse", who=["Rios"], goal="Climb", action="Rios climbs."),
+        ]
+        return ExportReq(cards=cards, format=fmt, title="Round Trip", author="Test Author")
+
+    def _import(self, body, fmt):
+        import json
+        response = client.post(f"/screenplay/import?format={fmt}", content=body)
+        assert response.status_code == 200
+        return [json.loads(line) for line in response.text.splitlines()]
+
+    def test_round_trip_through_exporters(self):
+        """Test exported Fountain and FDX import back into equivalent cards"""
+        for fmt in ["fountain", "fdx"]:
+            cards = self._import(render.render_bytes(self._req(fmt)), fmt)
+            assert [c["slug"] for c in cards] == ["scene_1", "scene_2"]
+            assert cards[0]["where"] == "HARBOR OF LUMEN"
+            assert cards[0]["when"] == {"int_ext": "INT", "time": "NIGHT"}
+            assert cards[0]["who"] == ["ELYRA", "RIOS"]
+            assert cards[0]["dialogue"][1] == {"character": "RIOS", "text": "Fish & chips?"}
+            assert cards[0]["action"] == "Elyra stands at the harbor."
+            assert cards[1]["who"] == ["UNKNOWN"] and cards[1]["action"] == "Rios climbs."
+
+    def test_fountain_state_machine_in_small_chunks(self):
+        """Test cues, extensions, parentheticals, boneyard and transitions across chunk boundaries"""
+        from services.screenplay import importer
+        doc = ("Title: Test\nAuthor: Me\n\n"
+               "EXT. PIER - DAWN\n\nThe water is still.\nGULLS circle. [[note]]\n\n"
+               "ELYRA (V.O.)\n(quietly)\nWhat is this\nfog?\n\n"
+               "/* cut\nBOB\nHello */\n"
+               "CUT TO:\n\n"
+               ".FLASHBACK\n\nBANG!\n\n@McCoy\nAye.\n").encode()
+        chunks = [doc[i:i + 5] for i in range(0, len(doc), 5)]
+        cards = list(importer.iter_cards(chunks, "fountain"))
+        assert len(cards) == 2
+        assert cards[0]["where"] == "PIER" and cards[0]["when"]["time"] == "DAWN"
+        assert cards[0]["action"] == "The water is still.\nGULLS circle."
+        assert cards[0]["dialogue"] == [{"character": "ELYRA", "text": "What is this fog?"}]
+        assert cards[1]["where"] == "FLASHBACK" and cards[1]["action"] == "BANG!"
+        assert cards[1]["dialogue"] == [{"character": "MCCOY", "text": "Aye."}]
+
+    def test_import_errors(self):
+        """Test unknown formats and malformed documents"""
+        assert client.post("/screenplay/import?format=docx", content=b"x").status_code == 422
+        records = self._import(b"<FinalDraft><Content><Paragraph Type='Scene Heading'>", "fdx")
+        assert records[-1]["status"] == "error"
+        assert records[-1]["error"]["code"] == "IMPORT_FAILED"
+
+
+class TestScriptAnalytics:
+    """Test script-wide dialogue and character statistics"""
+
+    def _cards(self):
+        return [
+            {"slug": "s1", "where": "Harbor", "who": ["Elyra", "Rios"], "goal": "Meet",
+             "dialogue": [{"character": "Elyra", "text": "What is this fog?"},
+                          {"character": "Rios", "text": "Trouble."},
+                          {"character": "Elyra", "text": "Then we go."}]},
+            {"slug": "s2", "where": "Lighthouse", "who": ["Rios"], "goal": "Climb",
+             "dialogue": [{"character": "Keeper", "text": "Who goes there?"}]},
+            {"slug": "s3", "where": "Cliffs", "who": ["Elyra"], "goal": "Wait"},
+        ]
+
+    def test_counts_co_occurrence_and_screen_time(self):
+        """Test per-character counts, the co-occurrence matrix and page-eighth screen time"""
+        response = client.post("/screenplay/analytics", json={"cards": self._cards()})
+        assert response.status_code == 200
+        data = response.json()["data"]
+        by_name = {c["name"]: c for c in data["characters"]}
+        assert by_name["ELYRA"] == {"name": "ELYRA", "lines": 2, "words": 7, "scenes": 2,
+                                    "screen_time_s": by_name["ELYRA"]["screen_time_s"]}
+        assert by_name["RIOS"]["lines"] == 1 and by_name["RIOS"]["scenes"] == 2
+        assert by_name["KEEPER"]["scenes"] == 1
+        assert data["characters"][0]["name"] == "ELYRA"
+        assert data["dialogue_lines"] == 4 and data["dialogue_words"] == 11
+
+        names = data["character_index"]
+        e, r, k = names.index("ELYRA"), names.index("RIOS"), names.index("KEEPER")
+        matrix = data["co_occurrence"]
+        assert matrix[e][r] == matrix[r][e] == 1
+        assert matrix[r][k] == 1 and matrix[e][k] == 0
+        assert matrix[e][e] == 2
+
+        eighths = [s["page_eighths"] for s in data["scenes"]]
+        assert all(n >= 1 for n in eighths)
+        assert data["estimated_runtime_s"] == sum(eighths) * 7.5
+        assert by_name["ELYRA"]["screen_time_s"] == (eighths[0] + eighths[2]) * 7.5
+
+    def test_results_cached_by_script_hash(self):
+        """Test unchanged scripts hit the cache and edits change the hash"""
+        from services.screenplay import analytics
+        analytics.CACHE.clear()
+        cards = self._cards()
+        first = client.post("/screenplay/analytics", json={"cards": cards}).json()
+        second = client.post("/screenplay/analytics", json={"cards": cards}).json()
+        assert first["meta"]["cache"]["hit"] is False
+        assert second["meta"]["cache"]["hit"] is True
+        assert second["meta"]["script_hash"] == first["meta"]["script_hash"]
+        assert second["data"] == first["data"]
+
+        cards[2]["who"] = ["Elyra", "Rios"]
+        third = client.post("/screenplay/analytics", json={"cards": cards}).json()
+        assert third["meta"]["cache"]["hit"] is False
+        assert third["meta"]["script_hash"] != first["meta"]["script_hash"]
+
+    def test_empty_script_rejected(self):
+        """Test requests without cards fail validation"""
+        assert client.post("/screenplay/analytics", json={"cards": []}).status_code == 422
+
+
+class TestDraftDiff:
+    """Test scene-level diffing of two drafts"""
+
+    def _card(self, slug, action, **extra):
+        return {"slug": slug, "where": "Harbor", "who": ["Elyra"], "goal": "Go", "action": action, **extra}
+
+    def test_myers_edit_script_is_minimal(self):
+        """Test the O(ND) alignment reproduces both sequences with the fewest edits"""
+        from services.screenplay.diff import myers
+        a, b = list("ABCABBA"), list("CBABAC")
+        ops = myers(a, b)
+        assert [a[i] for op, i, _ in ops if op != "insert"] == a
+        assert [b[j] for op, _, j in ops if op != "delete"] == b
+        assert sum(1 for op, _, _ in ops if op != "equal") == 5
+        assert myers([], []) == [] and myers(["x"], []) == [("delete", 0, 0)]
+
+    def test_classifies_added_removed_moved_edited(self):
+        """Test each kind of scene change and that only edited scenes get line diffs"""
+        old = [self._card(f"s{i}", f"Scene {i} happens.") for i in range(6)]
+        new = [dict(c) for c in old]
+        new[1] = self._card("s1", "Scene 1 happens differently.")   # edited
+        moved = new.pop(4)
+        new.insert(0, moved)                                          # moved
+        new = [c for c in new if c["slug"] != "s3"]                   # removed
+        new.append(self._card("s9", "A new ending."))                 # added
+
+        response = client.post("/screenplay/diff", json={"old": old, "new": new})
+        assert response.status_code == 200
+        data = response.json()["data"]
+        assert data["summary"] == {"unchanged": 3, "moved": 1, "edited": 1, "removed": 1, "added": 1}
+        by_type = {c["type"]: c for c in data["changes"]}
+        assert by_type["moved"]["slug"] == "s4" and by_type["moved"]["new_index"] == 0
+        assert by_type["removed"]["slug"] == "s3" and "lines" not in by_type["removed"]
+        assert by_type["added"]["slug"] == "s9"
+        assert by_type["edited"]["lines"] == [
+            {"op": "delete", "old_line": 3, "text": "Scene 1 happens."},
+            {"op": "insert", "new_line": 3, "text": "Scene 1 happens differently."},
+        ]
+
+    def test_identical_and_empty_drafts(self):
+        """Test identical drafts have no changes and an empty draft is all additions"""
+        cards = [self._card(f"s{i}", "x") for i in range(3)]
+        same = client.post("/screenplay/diff", json={"old": cards, "new": cards}).json()["data"]
+        assert same["changes"] == [] and same["summary"]["unchanged"] == 3
+        fresh = client.post("/screenplay/diff", json={"old": [], "new": cards}).json()["data"]
+        assert [c["type"] for c in fresh["changes"]] == ["added"] * 3
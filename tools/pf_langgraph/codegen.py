@@ -2,7 +2,7 @@ import json
 import os
 import re
 import textwrap
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional
 
 from .hashing import spec_fingerprint
 
@@ -12,33 +12,48 @@ EXPR_RE = re.compile(r"\$\{([^}]+)\}")
 # inputs.foo.bar, nodes.some_node.data.value, outputs.final
 _STATE_PATH_RE = re.compile(r"\b(inputs|nodes|outputs)((?:\.[A-Za-z_][\w]*)+)")
 
+# Inside map templates item.foo.bar addresses the current list element; in
+# join/race/hedge accept expressions result.foo.bar addresses a call's envelope
+_LOCAL_PATH_RE = re.compile(r"\b(item|result)((?:\.[A-Za-z_][\w]*)+)")
+
 
 def _convert_state_paths(expr: str) -> str:
-    """Convert dotted state paths into dictionary indexing expressions.
+    """Convert dotted state paths into state lookups that follow blob references.
 
-    Example: nodes.foo.bar -> state['nodes']['foo']['bar']
+    Example: nodes.foo.bar -> rt.lookup(state, ("nodes", "foo", "bar"))
     """
 
     def _repl(match: re.Match[str]) -> str:
         root = match.group(1)
         tail = match.group(2)  # like .foo.bar
-        parts = [p for p in tail.split(".") if p]
-        chain = "".join("[" + json.dumps(p) + "]" for p in parts)
-        return f"state[{json.dumps(root)}]{chain}"
+        parts = [root] + [p for p in tail.split(".") if p]
+        return f"rt.lookup(state, ({', '.join(json.dumps(p) for p in parts)}))"
 
     return _STATE_PATH_RE.sub(_repl, expr)
 
 
-def _emit_symbol(inner: str) -> str:
+def _convert_local_paths(expr: str) -> str:
+    """Example: item.scene.slug -> item['scene']['slug'] (bare item/index pass through)."""
+
+    def _repl(match: re.Match[str]) -> str:
+        parts = [p for p in match.group(2).split(".") if p]
+        return match.group(1) + "".join("[" + json.dumps(p) + "]" for p in parts)
+
+    return _LOCAL_PATH_RE.sub(_repl, expr)
+
+
+def _emit_symbol(inner: str, local_scope: bool = False) -> str:
     inner = inner.strip()
     if inner.startswith("env:"):
         name = inner.split(":", 1)[1]
         return f'os.environ.get("{name}", "")'
+    if local_scope:
+        inner = _convert_local_paths(inner)
     # Convert any inputs./nodes./outputs. dotted paths into state[...] indexing
     return _convert_state_paths(inner)
 
 
-def _emit_template_expr(text: str) -> str:
+def _emit_template_expr(text: str, local_scope: bool = False) -> str:
     # Build a Python expression by concatenating literal chunks and evaluated symbols
     parts: List[str] = []
     last = 0
@@ -46,7 +61,7 @@ def _emit_template_expr(text: str) -> str:
         if m.start() > last:
             lit = text[last : m.start()]
             parts.append(json.dumps(lit))
-        parts.append(_emit_symbol(m.group(1)))
+        parts.append(_emit_symbol(m.group(1), local_scope))
         last = m.end()
     if last < len(text):
         parts.append(json.dumps(text[last:]))
@@ -55,25 +70,31 @@ def _emit_template_expr(text: str) -> str:
     return " + ".join(parts)
 
 
-def _emit_value(val: Any) -> str:
+def _emit_value(val: Any, local_scope: bool = False) -> str:
     if isinstance(val, str):
-        return _emit_template_expr(val)
+        return _emit_template_expr(val, local_scope)
     if isinstance(val, list):
-        return "[" + ", ".join(_emit_value(v) for v in val) + "]"
+        return "[" + ", ".join(_emit_value(v, local_scope) for v in val) + "]"
     if isinstance(val, dict):
         items = []
         for k, v in val.items():
-            items.append(json.dumps(k) + ": " + _emit_value(v))
+            items.append(json.dumps(k) + ": " + _emit_value(v, local_scope))
         return "{" + ", ".join(items) + "}"
+    if val is None or isinstance(val, bool):
+        return repr(val)  # json.dumps would emit true/false/null
     return json.dumps(val)
 
 
 WRAP_HELPERS = """
-from functools import partial
-
 def _wrap_node(fn, client, env):
     async def _inner(state):
-        return await fn(state, client, env)
+        delta = await fn(state, client, env)
+        nodes = delta.get('nodes')
+        if nodes:
+            # Validate only the incoming delta (O(1) per node, not O(nodes) per step)
+            for k, v in nodes.items():
+                nodes[k] = rt.offload(require_envelope(v, f"node:{k}"))
+        return delta
     return _inner
 """
 
@@ -113,22 +134,171 @@ def _emit_expr(expr_text: str) -> str:
     return _convert_state_paths(inner)
 
 
+def _emit_cache_material(node: dict, local_scope: bool = False) -> str:
+    """Expression that content-addresses a node call for its result cache."""
+    cache = node.get("cache") or {}
+    if "key" in cache:
+        return _emit_value(cache["key"], local_scope)
+    return "[method, url, body]"
+
+
+def _emit_call_policy(node: dict, call_index: Optional[int] = None) -> str:
+    """Keyword arguments carrying a node's timeout/retry/circuit-breaker policy."""
+    kwargs = [f"timeout_ms={int(node.get('timeout_ms', 60000))}"]
+    if node.get("retry"):
+        kwargs.append(f"retry={node['retry']!r}")
+    if node.get("circuit_breaker"):
+        # Breakers are keyed by name so several nodes can share one dependency's state
+        breaker = {"name": node["id"], **node["circuit_breaker"]}
+        if call_index is not None:
+            # join/race/hedge calls are redundant providers: one failing must not shed the others
+            breaker["name"] = f"{breaker['name']}:{call_index}"
+        kwargs.append(f"breaker={breaker!r}")
+    return ", ".join(kwargs)
+
+
+def _emit_request(node: dict, cfg: dict, local_scope: bool = False, call_index: Optional[int] = None) -> str:
+    """Statements that issue one templated request and bind its envelope to ``out``.
+
+    ``call_index`` marks one call of a join/race/hedge node; it gets its own
+    breaker and cache namespace.
+    """
+    method = cfg.get("method", "GET").upper()
+    url = _emit_value(cfg["url"], local_scope)  # expression
+    headers = _emit_value(cfg.get("headers", {}), local_scope)
+    body = _emit_value(cfg.get("body", {}), local_scope)
+    cache = node.get("cache")
+    material = "None"
+    if cache is not None:
+        material = _emit_cache_material(node, local_scope)
+        # The key template is emitted as an expression; only static policy goes in the literal
+        cache = {k: v for k, v in cache.items() if k != "key"}
+    cache_ns = node["id"] if call_index is None else f"{node['id']}#{call_index}"
+    return f"""method = "{method}"
+url = {url}
+body = {body}
+headers = {headers}
+
+async def _call():
+    return await rt.http_request(client, method, url, body, headers, {_emit_call_policy(node, call_index)})
+
+out = await rt.cached_call('{cache_ns}', {cache!r}, {material}, _call)"""
+
+
 def _emit_http_call(node: dict) -> str:
+    return f"""
+async def node_{node['id']}(state, client, env):
+{textwrap.indent(_emit_request(node, node["config"]), "    ")}
+    # Return delta for parallel-safe updates
+    return {{'nodes': {{'{node['id']}': out}}}}
+"""
+
+
+def _emit_map(node: dict) -> str:
     cfg = node["config"]
-    method = cfg.get("method", "GET").upper()
-    url = _emit_value(cfg["url"])  # expression
-    headers = _emit_value(cfg.get("headers", {}))
-    body = _emit_value(cfg.get("body", {}))
+    items = _emit_value(cfg["items"])
+    max_concurrency = int(cfg.get("max_concurrency", 4))
     return f"""
 async def node_{node['id']}(state, client, env):
-    import httpx, json, os
-    url = {url}
-    body = {body}
-    headers = {headers}
-    async with httpx.AsyncClient(timeout=60) as s:
-        r = await s.request("{method}", url, json=body, headers=headers)
-        r.raise_for_status()
-        out = r.json()
+    items = list({items} or [])
+
+    async def _one(index, item):
+{textwrap.indent(_emit_request(node, cfg["call"], local_scope=True), "        ")}
+        return require_envelope(out, f"node:{node['id']}[{{index}}]")
+
+    results = await rt.map_calls(items, _one, max_concurrency={max_concurrency})
+    # Return delta for parallel-safe updates
+    return {{'nodes': {{'{node['id']}': rt.collect_envelopes(results, max_concurrency={max_concurrency})}}}}
+"""
+
+
+def _emit_local_call(node: dict) -> str:
+    cfg = node["config"]
+    nid = node["id"]
+    args = _emit_value(cfg.get("args", []))
+    kwargs = _emit_value(cfg.get("kwargs", {}))
+    cache = node.get("cache")
+    material = "None"
+    if cache is not None:
+        material = _emit_value(cache["key"]) if "key" in cache else "[target, args, kwargs]"
+        cache = {k: v for k, v in cache.items() if k != "key"}
+    local = f"""target = {cfg['target']!r}
+args = {args}
+kwargs = {kwargs}
+
+async def _call():
+    return await rt.local_call(target, args, kwargs, timeout_ms={int(node.get('timeout_ms', 60000))})
+
+out = await rt.cached_call('{nid}', {cache!r}, {material}, _call)"""
+    if "remote" not in cfg:
+        branch = textwrap.indent(local, "    ")
+    else:
+        mode_env = cfg.get("mode_env", "PF_CALL_MODE")
+        branch = f"""    if rt.call_mode({mode_env!r}) == "remote":
+{textwrap.indent(_emit_request(node, cfg["remote"]), "        ")}
+    else:
+{textwrap.indent(local, "        ")}"""
+    return f"""
+async def node_{nid}(state, client, env):
+{branch}
+    out = require_envelope(out, "node:{nid}")
+    # Return delta for parallel-safe updates
+    return {{'nodes': {{'{nid}': out}}}}
+"""
+
+
+def _emit_call_factories(node: dict, cfgs: List[dict]) -> str:
+    """One ``_call_<i>()`` coroutine factory per call config, each validating its envelope."""
+    out = []
+    for i, cfg in enumerate(cfgs):
+        out.append(f"""
+async def _call_{i}():
+{textwrap.indent(_emit_request(node, cfg, call_index=i), "    ")}
+    return require_envelope(out, "node:{node['id']}#{i}")
+""")
+    return textwrap.indent("".join(out), "    ")
+
+
+def _emit_accept(cfg: dict) -> str:
+    if "accept" not in cfg:
+        return "None"
+    expr = _emit_expr(cfg["accept"])
+    return f"lambda result: bool({_convert_local_paths(expr)})"
+
+
+def _emit_join(node: dict) -> str:
+    cfg = node["config"]
+    calls = cfg["calls"]
+    mode = cfg.get("mode", "all")
+    factories = ", ".join(f"_call_{i}" for i in range(len(calls)))
+    return f"""
+async def node_{node['id']}(state, client, env):
+{_emit_call_factories(node, calls)}
+    out = await rt.join([{factories}], mode={mode!r}, quorum={cfg.get('quorum')!r}, accept={_emit_accept(cfg)})
+    # Return delta for parallel-safe updates
+    return {{'nodes': {{'{node['id']}': out}}}}
+"""
+
+
+def _emit_race(node: dict) -> str:
+    cfg = node["config"]
+    factories = ", ".join(f"_call_{i}" for i in range(len(cfg["calls"])))
+    return f"""
+async def node_{node['id']}(state, client, env):
+{_emit_call_factories(node, cfg["calls"])}
+    out = await rt.race([{factories}], accept={_emit_accept(cfg)})
+    # Return delta for parallel-safe updates
+    return {{'nodes': {{'{node['id']}': out}}}}
+"""
+
+
+def _emit_hedge(node: dict) -> str:
+    cfg = node["config"]
+    calls = [cfg["call"], cfg.get("backup", cfg["call"])]
+    return f"""
+async def node_{node['id']}(state, client, env):
+{_emit_call_factories(node, calls)}
+    out = await rt.hedge(_call_0, _call_1, delay_ms={float(cfg.get('delay_ms', 200))}, accept={_emit_accept(cfg)})
     # Return delta for parallel-safe updates
     return {{'nodes': {{'{node['id']}': out}}}}
 """
@@ -150,77 +320,52 @@ async def node_{node['id']}(state, client, env):
 """
 
 
+def _emit_output_expr(expr: Any) -> str:
+    """Expression for one output value; missing node paths yield None (or {} when nested)."""
+    if isinstance(expr, str) and expr.startswith("${") and expr.endswith("}"):
+        inner = expr[2:-1]
+        if inner.startswith("nodes."):
+            parts = inner.split(".")
+            # Handle nested paths like data.cond
+            default = "{}" if len(parts) > 3 else "None"
+            return f"rt.lookup(state, {tuple(parts)!r}, default={default})"
+        if inner.startswith("inputs."):
+            path = inner.split(".")[1]
+            return f"state['inputs'].get('{path}')"
+        return _emit_expr(inner)
+    return _emit_value(expr)
+
+
 def _emit_outputs_finalization(outputs: dict) -> str:
     """Generate output finalization code from outputs spec."""
     lines = []
     for key, expr in outputs.items():
-        if isinstance(expr, str) and expr.startswith("${") and expr.endswith("}"):
-            inner = expr[2:-1]
-            if inner.startswith("nodes."):
-                node_id = inner.split(".")[1]
-                if "." in inner:
-                    path_parts = inner.split(".")[2:]
-                    if len(path_parts) == 1:
-                        lines.append(f"    outputs['{key}'] = state['nodes'].get('{node_id}', {{}}).get('{path_parts[0]}')")
-                    else:
-                        # Handle nested paths like data.cond
-                        path_chain = "".join(f".get('{part}', {{}})" for part in path_parts)
-                        lines.append(f"    outputs['{key}'] = state['nodes'].get('{node_id}', {{}}){path_chain}")
-                else:
-                    lines.append(f"    outputs['{key}'] = state['nodes'].get('{node_id}')")
-            elif inner.startswith("inputs."):
-                path = inner.split(".")[1]
-                lines.append(f"    outputs['{key}'] = state['inputs'].get('{path}')")
-            else:
-                lines.append(f"    outputs['{key}'] = {_emit_expr(inner)}")
-        elif isinstance(expr, dict):
+        if isinstance(expr, dict):
             # Handle nested objects like qa: {trope: ..., promise: ...}
             lines.append(f"    outputs['{key}'] = {{}}")
             for sub_key, sub_expr in expr.items():
-                if isinstance(sub_expr, str) and sub_expr.startswith("${") and sub_expr.endswith("}"):
-                    inner = sub_expr[2:-1]
-                    if inner.startswith("nodes."):
-                        node_id = inner.split(".")[1]
-                        if "." in inner:
-                            path_parts = inner.split(".")[2:]
-                            if len(path_parts) == 1:
-                                lines.append(f"    outputs['{key}']['{sub_key}'] = state['nodes'].get('{node_id}', {{}}).get('{path_parts[0]}')")
-                            else:
-                                # Handle nested paths like data.cond
-                                path_chain = "".join(f".get('{part}', {{}})" for part in path_parts)
-                                lines.append(f"    outputs['{key}']['{sub_key}'] = state['nodes'].get('{node_id}', {{}}){path_chain}")
-                        else:
-                            lines.append(f"    outputs['{key}']['{sub_key}'] = state['nodes'].get('{node_id}')")
-                    elif inner.startswith("inputs."):
-                        path = inner.split(".")[1]
-                        lines.append(f"    outputs['{key}']['{sub_key}'] = state['inputs'].get('{path}')")
-                    else:
-                        lines.append(f"    outputs['{key}']['{sub_key}'] = {_emit_expr(inner)}")
-                else:
-                    lines.append(f"    outputs['{key}']['{sub_key}'] = {_emit_value(sub_expr)}")
+                lines.append(f"    outputs['{key}']['{sub_key}'] = {_emit_output_expr(sub_expr)}")
         else:
-            lines.append(f"    outputs['{key}'] = {_emit_value(expr)}")
+            lines.append(f"    outputs['{key}'] = {_emit_output_expr(expr)}")
     return "\n".join(lines)
 
 
 def generate(spec: Dict[str, Any]) -> str:
     fp = spec_fingerprint(spec)
     imports = """
+import asyncio
 import os
-from typing import Any, Dict, TypedDict
+from typing import Annotated, Any, Dict, TypedDict
 from langgraph.graph import StateGraph
 from tools.pf_langgraph.envelope import require_envelope
+from tools.pf_langgraph import runtime as rt
 """
 
     preamble = WRAP_HELPERS + """
-from typing import Annotated
-from langgraph.graph.message import add_messages
-import operator
-
 class GraphState(TypedDict):
     inputs: Dict[str, Any]
-    nodes: Annotated[Dict[str, Any], operator.or_]
-    outputs: Annotated[Dict[str, Any], operator.or_]
+    nodes: Annotated[Dict[str, Any], rt.merge_into]
+    outputs: Annotated[Dict[str, Any], rt.merge_into]
 """
 
     body_parts: List[str] = []
@@ -229,6 +374,16 @@ class GraphState(TypedDict):
             body_parts.append(_emit_http_call(n))
         elif n["kind"] == "branch":
             body_parts.append(_emit_branch(n))
+        elif n["kind"] == "map":
+            body_parts.append(_emit_map(n))
+        elif n["kind"] == "local_call":
+            body_parts.append(_emit_local_call(n))
+        elif n["kind"] == "join":
+            body_parts.append(_emit_join(n))
+        elif n["kind"] == "race":
+            body_parts.append(_emit_race(n))
+        elif n["kind"] == "hedge":
+            body_parts.append(_emit_hedge(n))
         else:
             raise ValueError(f"Unsupported kind: {n['kind']}")
 
@@ -240,8 +395,7 @@ class GraphState(TypedDict):
 
     controller = """
 async def controller(state, *_):
-    for k, v in list(state['nodes'].items()):
-        require_envelope(v, f"node:{k}")
+    # Envelopes are validated per delta in _wrap_node
     branch = state.pop('__branch__', None)
     targets = state.pop('__branch_targets__', None)
     if branch and targets:
@@ -284,10 +438,18 @@ def _finalize_outputs(state):
 """
 
     run = f"""
-async def run_graph(inputs: Dict[str, Any], client=None, env=None):
+async def run_graph(inputs: Dict[str, Any], client=None, env=None, deadline_ms=None):
     g = build_graph_with_ctx(client=client, env=env).compile()
     state = {{'inputs': inputs, 'nodes': {{}}, 'outputs': {{}}}}
-    state = await g.ainvoke(state)
+    # Every node call clamps its timeout to what is left of deadline_ms
+    with rt.deadline(deadline_ms):
+        if deadline_ms is None:
+            state = await g.ainvoke(state)
+        else:
+            try:
+                state = await asyncio.wait_for(g.ainvoke(state), deadline_ms / 1000.0)
+            except asyncio.TimeoutError:
+                raise rt.DeadlineExceeded(f"run exceeded its {{deadline_ms}}ms deadline") from None
     delta = _finalize_outputs(state)
     if isinstance(delta, dict) and 'outputs' in delta:
         try:
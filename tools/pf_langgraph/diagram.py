@@ -7,7 +7,11 @@ def mermaid(spec):
     lines = ["flowchart TD"]
     nodes = {n["id"]: n for n in spec["nodes"]}
     for n in nodes.values():
-        shape = "([{}])".format(n["id"]) if n["kind"]=="branch" else "([{}])".format(n["id"])
+        shape = "([{}])".format(n["id"])
+        if n["kind"]=="map":
+            shape = "[[{}]]".format(n["id"])
+        elif n["kind"] in ("join", "race", "hedge"):
+            shape = "{{{{{}}}}}".format(n["id"])
         lines.append(f'    {n["id"]}{shape}')
     for e in spec["edges"]:
         lines.append(f'    {e["from"]} --> {e["to"]}')
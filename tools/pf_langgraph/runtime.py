@@ -0,0 +1,670 @@
+
+"""Runtime helpers imported by generated graphs.
+
+Generated node functions stay small and declarative; anything that needs
+process-wide state (result caches, blob store, circuit breakers, HTTP plumbing) lives here so all
+graphs built in one host process share it.
+"""
+
+import asyncio
+import hashlib
+import importlib
+import inspect
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+import httpx
+
+DEFAULT_TIMEOUT_MS = 60_000
+
+
+def _canonical(value: Any) -> bytes:
+    return json.dumps(value, sort_keys=True, separators=(",", ":"), default=str).encode("utf-8")
+
+
+# ---- Result cache ----
+
+class MemoryResultCache:
+    """Process-local TTL cache of node envelopes, evicting least recently used beyond ``max_entries``."""
+
+    def __init__(self, max_entries: int = 4096) -> None:
+        self.max_entries = max_entries
+        self._items: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            expires, value = item
+            if expires is not None and expires < time.time():
+                del self._items[key]
+                return None
+            self._items.move_to_end(key)
+            return value
+
+    def put(self, key: str, value: Dict[str, Any], ttl_s: Optional[float]) -> None:
+        expires = time.time() + ttl_s if ttl_s else None
+        with self._lock:
+            self._items[key] = (expires, value)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+
+
+class DiskResultCache:
+    """JSON-on-disk cache, one file per key; survives host restarts."""
+
+    def __init__(self, root: Path) -> None:
+        self.root = root
+
+    def _path(self, key: str) -> Path:
+        return self.root / key[:2] / f"{key}.json"
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        p = self._path(key)
+        try:
+            item = json.loads(p.read_text("utf-8"))
+        except (OSError, ValueError):
+            return None
+        if item.get("expires") is not None and item["expires"] < time.time():
+            p.unlink(missing_ok=True)
+            return None
+        return item.get("value")
+
+    def put(self, key: str, value: Dict[str, Any], ttl_s: Optional[float]) -> None:
+        p = self._path(key)
+        p.parent.mkdir(parents=True, exist_ok=True)
+        expires = time.time() + ttl_s if ttl_s else None
+        tmp = p.with_suffix(f".{os.getpid()}.tmp")
+        tmp.write_text(json.dumps({"expires": expires, "value": value}), "utf-8")
+        tmp.replace(p)
+
+    def clear(self) -> None:
+        for p in self.root.glob("*/*.json"):
+            p.unlink(missing_ok=True)
+
+
+_CACHES: Dict[str, Any] = {}
+_CACHES_LOCK = threading.Lock()
+
+
+def get_cache(backend: str = "memory"):
+    """Return the shared cache for ``backend`` (``memory`` or ``disk``)."""
+    with _CACHES_LOCK:
+        cache = _CACHES.get(backend)
+        if cache is None:
+            if backend == "memory":
+                cache = MemoryResultCache(int(os.environ.get("PF_CACHE_MAX_ENTRIES", 4096)))
+            elif backend == "disk":
+                cache = DiskResultCache(Path(os.environ.get("PF_CACHE_DIR", ".cache/pf_langgraph")))
+            else:
+                raise ValueError(f"Unsupported cache backend: {backend}")
+            _CACHES[backend] = cache
+        return cache
+
+
+def cache_key(node_id: str, material: Any) -> str:
+    """Content address for a node call: sha256 over node id + canonical material."""
+    return hashlib.sha256(_canonical({"node": node_id, "material": material})).hexdigest()
+
+
+def with_cache_meta(env: Dict[str, Any], key: str, hit: bool, backend: str) -> Dict[str, Any]:
+    # Shallow-copy so cached envelopes are never mutated by callers
+    out = dict(env)
+    out["meta"] = {**(env.get("meta") or {}), "cache": {"hit": hit, "key": key, "backend": backend}}
+    return out
+
+
+async def cached_call(node_id: str, cache_cfg: Optional[Dict[str, Any]], material: Any, call):
+    """Serve ``call()`` through the node's result cache when one is configured.
+
+    Only ``status == "ok"`` envelopes are stored; errors always go to the wire.
+    """
+    if not cache_cfg:
+        return await call()
+    backend = cache_cfg.get("backend", "memory")
+    cache = get_cache(backend)
+    key = cache_key(node_id, material)
+    hit = cache.get(key)
+    if hit is not None:
+        return with_cache_meta(hit, key, True, backend)
+    out = await call()
+    if isinstance(out, dict) and out.get("status") == "ok":
+        cache.put(key, out, cache_cfg.get("ttl_s"))
+    return with_cache_meta(out, key, False, backend)
+
+
+# ---- State: in-place merging and out-of-state blobs ----
+
+def merge_into(left: Optional[Dict[str, Any]], right: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Reducer for the ``nodes``/``outputs`` channels: update in place instead of copying.
+
+    ``operator.or_`` allocates a new dict per merge, which is O(n) per node and
+    O(n^2) per run; the channel owns ``left`` so mutating it is safe.
+    """
+    if left is None:
+        return dict(right or {})
+    if right:
+        left.update(right)
+    return left
+
+
+class MemoryBlobStore:
+    """Content-addressed bytes in process memory, evicting oldest beyond ``max_bytes``."""
+
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        self._blobs: "OrderedDict[str, bytes]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def put(self, raw: bytes) -> str:
+        cid = "sha256:" + hashlib.sha256(raw).hexdigest()
+        with self._lock:
+            if cid in self._blobs:
+                self._blobs.move_to_end(cid)
+                return cid
+            self._blobs[cid] = raw
+            self._size += len(raw)
+            while self._size > self.max_bytes and len(self._blobs) > 1:
+                _, old = self._blobs.popitem(last=False)
+                self._size -= len(old)
+        return cid
+
+    def get(self, cid: str) -> bytes:
+        with self._lock:
+            return self._blobs[cid]
+
+
+class DiskBlobStore:
+    """Content-addressed bytes under ``root``; identical payloads are written once."""
+
+    def __init__(self, root: Path) -> None:
+        self.root = root
+
+    def _path(self, cid: str) -> Path:
+        digest = cid.split(":", 1)[1]
+        return self.root / digest[:2] / digest
+
+    def put(self, raw: bytes) -> str:
+        cid = "sha256:" + hashlib.sha256(raw).hexdigest()
+        p = self._path(cid)
+        if not p.exists():
+            p.parent.mkdir(parents=True, exist_ok=True)
+            tmp = p.with_suffix(f".{os.getpid()}.tmp")
+            tmp.write_bytes(raw)
+            tmp.replace(p)
+        return cid
+
+    def get(self, cid: str) -> bytes:
+        return self._path(cid).read_bytes()
+
+
+_BLOBS: Dict[str, Any] = {}
+
+
+def get_blob_store():
+    """Shared store selected by ``PF_BLOB_BACKEND`` (memory | disk)."""
+    backend = os.environ.get("PF_BLOB_BACKEND", "memory")
+    with _CACHES_LOCK:
+        store = _BLOBS.get(backend)
+        if store is None:
+            if backend == "memory":
+                store = MemoryBlobStore(int(os.environ.get("PF_BLOB_MEMORY_MAX_BYTES", 256 * 1024 * 1024)))
+            elif backend == "disk":
+                store = DiskBlobStore(Path(os.environ.get("PF_BLOB_DIR", ".cache/pf_langgraph/blobs")))
+            else:
+                raise ValueError(f"Unsupported blob backend: {backend}")
+            _BLOBS[backend] = store
+        return store
+
+
+BLOB_KEY = "$blob"
+
+
+def is_ref(value: Any) -> bool:
+    return isinstance(value, dict) and BLOB_KEY in value
+
+
+def load_ref(value: Any) -> Any:
+    return json.loads(get_blob_store().get(value[BLOB_KEY])) if is_ref(value) else value
+
+
+def offload(env: Dict[str, Any]) -> Dict[str, Any]:
+    """Move an envelope's ``data`` out of graph state when it exceeds ``PF_INLINE_MAX_BYTES``.
+
+    The envelope keeps status/error/meta inline and carries ``{"$blob": cid,
+    "bytes": n}`` instead, so checkpoints and stream events stay small.
+    """
+    limit = int(os.environ.get("PF_INLINE_MAX_BYTES", 64 * 1024))
+    data = env.get("data")
+    if limit <= 0 or not isinstance(data, (dict, list)) or is_ref(data):
+        return env
+    raw = json.dumps(data, separators=(",", ":"), default=str).encode("utf-8")
+    if len(raw) <= limit:
+        return env
+    return {**env, "data": {BLOB_KEY: get_blob_store().put(raw), "bytes": len(raw)}}
+
+
+_MISSING = object()
+
+
+def lookup(state: Dict[str, Any], path, default: Any = _MISSING) -> Any:
+    """Walk ``path`` through graph state, loading blob references on the way.
+
+    Without ``default`` a missing key raises like plain indexing would.
+    """
+    cur: Any = state
+    for part in path:
+        cur = load_ref(cur)
+        try:
+            cur = cur[part]
+        except (KeyError, IndexError, TypeError):
+            if default is _MISSING:
+                raise
+            return default
+    if is_ref(cur):
+        return load_ref(cur)
+    if isinstance(cur, dict) and is_ref(cur.get("data")):
+        return {**cur, "data": load_ref(cur["data"])}
+    return cur
+
+
+# ---- Circuit breakers ----
+
+class CircuitOpenError(RuntimeError):
+    pass
+
+
+class CircuitBreaker:
+    """Closed -> open after ``failure_threshold`` consecutive failures; one probe after ``cooldown_ms``.
+
+    A probe that never reports back (its caller died without recording an
+    outcome) is given up after another ``cooldown_ms`` and a new one is let through.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, cooldown_ms: int = 30_000) -> None:
+        self.name = name
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.cooldown_ms = int(cooldown_ms)
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probe_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "closed":
+                return True
+            since = self.probe_at if self.state == "half_open" else self.opened_at
+            if (time.monotonic() - since) * 1000 >= self.cooldown_ms:
+                # Let exactly one caller probe the dependency
+                self.state = "half_open"
+                self.probe_at = time.monotonic()
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+    def record_cancelled(self) -> None:
+        """The call was abandoned (e.g. lost a race): a probe counts as failed, a normal call not at all."""
+        with self._lock:
+            if self.state == "half_open":
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+
+_BREAKERS: Dict[str, CircuitBreaker] = {}
+_BREAKERS_LOCK = threading.Lock()
+
+
+def get_breaker(name: str, failure_threshold: int = 5, cooldown_ms: int = 30_000) -> CircuitBreaker:
+    """Process-wide breaker registry; state is shared by every run in the host."""
+    with _BREAKERS_LOCK:
+        br = _BREAKERS.get(name)
+        if br is None:
+            br = _BREAKERS[name] = CircuitBreaker(name, failure_threshold, cooldown_ms)
+        return br
+
+
+# ---- Run deadlines ----
+
+# Must match services.common.deadline.DEADLINE_HEADER
+DEADLINE_HEADER = "X-Deadline-Ms"
+
+_DEADLINE: ContextVar[Optional[float]] = ContextVar("pf_deadline", default=None)
+
+
+class DeadlineExceeded(TimeoutError):
+    pass
+
+
+@contextmanager
+def deadline(budget_ms: Optional[float]):
+    """Bound everything run inside (including LangGraph node tasks) by ``budget_ms``."""
+    token = _DEADLINE.set(None if budget_ms is None else time.monotonic() + budget_ms / 1000.0)
+    try:
+        yield
+    finally:
+        _DEADLINE.reset(token)
+
+
+def remaining_ms() -> Optional[float]:
+    d = _DEADLINE.get()
+    return None if d is None else (d - time.monotonic()) * 1000.0
+
+
+def budget_ms(timeout_ms: float, where: str) -> float:
+    """Node timeout clamped to the run's remaining budget; raises once it is spent."""
+    left = remaining_ms()
+    if left is None:
+        return timeout_ms
+    if left <= 0:
+        raise DeadlineExceeded(f"run deadline exceeded before {where}")
+    return min(timeout_ms, left)
+
+
+# ---- HTTP ----
+
+DEFAULT_RETRY_ON = (429, 502, 503, 504)
+
+
+async def _send(client, method: str, url: str, body: Any, headers: Optional[Dict[str, str]], timeout: float):
+    if client is not None:
+        return await client.request(method, url, json=body, headers=headers, timeout=timeout)
+    async with httpx.AsyncClient(timeout=timeout) as s:
+        r = await s.request(method, url, json=body, headers=headers)
+        await r.aread()
+        return r
+
+
+async def http_request(client, method: str, url: str, body: Any = None, headers: Optional[Dict[str, str]] = None,
+                       timeout_ms: int = DEFAULT_TIMEOUT_MS, retry: Optional[Dict[str, Any]] = None,
+                       breaker: Optional[Dict[str, Any]] = None) -> Any:
+    """Issue one JSON request under the node's timeout/retry/circuit-breaker policy.
+
+    ``client`` (an ``httpx.AsyncClient``) is reused when given. Transport errors,
+    timeouts and ``retry_on`` statuses are retried with exponential backoff;
+    other 4xx responses raise immediately and do not count against the breaker.
+    """
+    retry = retry or {}
+    attempts = 1 + max(0, int(retry.get("count", 0)))
+    backoff_ms = float(retry.get("backoff_ms", 200))
+    factor = float(retry.get("backoff_factor", 2.0))
+    retry_on = set(retry.get("retry_on", DEFAULT_RETRY_ON))
+
+    br = None
+    if breaker is not None:
+        br = get_breaker(breaker["name"], breaker.get("failure_threshold", 5), breaker.get("cooldown_ms", 30_000))
+        if not br.allow():
+            raise CircuitOpenError(f"circuit open for {br.name}; shedding {method} {url}")
+
+    # Every exit reports to the breaker, or a half-open probe would never resolve
+    answered = False
+    try:
+        last_err: Optional[BaseException] = None
+        for attempt in range(attempts):
+            attempt_ms = budget_ms(timeout_ms, f"{method} {url}")
+            timeout = attempt_ms / 1000.0
+            send_headers = headers
+            if remaining_ms() is not None:
+                # Tell the callee how long we will wait so it can clamp its own work
+                send_headers = {**(headers or {}), DEADLINE_HEADER: str(int(attempt_ms))}
+            try:
+                r = await asyncio.wait_for(_send(client, method, url, body, send_headers, timeout), timeout)
+            except asyncio.TimeoutError:
+                last_err = TimeoutError(f"{method} {url} timed out after {int(attempt_ms)}ms")
+            except httpx.TransportError as e:
+                last_err = e
+            else:
+                if r.status_code < 500 and r.status_code not in retry_on:
+                    if not r.is_success:
+                        answered = True  # a 4xx is the caller's fault, not the dependency's
+                        r.raise_for_status()
+                    data = r.json()
+                    answered = True
+                    return data
+                last_err = httpx.HTTPStatusError(f"{r.status_code} from {method} {url}", request=r.request, response=r)
+                if r.status_code not in retry_on:
+                    break
+            if attempt + 1 < attempts:
+                delay_ms = backoff_ms * (factor ** attempt)
+                left = remaining_ms()
+                if left is not None and left <= delay_ms:
+                    break  # no budget left for another attempt
+                await asyncio.sleep(delay_ms / 1000.0)
+
+        assert last_err is not None
+        raise last_err
+    except asyncio.CancelledError:
+        if br is not None:
+            br.record_cancelled()
+            br = None
+        raise
+    finally:
+        if br is not None:
+            if answered:
+                br.record_success()
+            else:
+                br.record_failure()
+
+
+# ---- In-process calls ----
+
+_LOCAL_CALLABLES: Dict[str, Callable[..., Any]] = {}
+_LOCAL_LOCK = threading.Lock()
+
+
+def register_local(path: str, fn: Optional[Callable[..., Any]] = None):
+    """Register ``fn`` under ``path`` for local_call nodes; usable as a decorator."""
+    def _register(f):
+        with _LOCAL_LOCK:
+            _LOCAL_CALLABLES[path] = f
+        return f
+    return _register(fn) if fn is not None else _register
+
+
+def resolve_local(path: str) -> Callable[..., Any]:
+    """Look up a registered callable, importing it by dotted path on first use.
+
+    Imports are limited to the module prefixes in ``PF_LOCAL_CALL_PREFIXES``
+    (comma separated, default ``services.``) so a flow spec cannot reach
+    arbitrary code.
+    """
+    with _LOCAL_LOCK:
+        fn = _LOCAL_CALLABLES.get(path)
+    if fn is not None:
+        return fn
+    prefixes = [p.strip() for p in os.environ.get("PF_LOCAL_CALL_PREFIXES", "services.").split(",") if p.strip()]
+    if not any(path.startswith(p) for p in prefixes):
+        raise LookupError(f"local_call target {path!r} is not registered and outside {prefixes}")
+    module_name, _, attr = path.replace(":", ".").rpartition(".")
+    fn = getattr(importlib.import_module(module_name), attr)
+    if not callable(fn):
+        raise TypeError(f"local_call target {path!r} is not callable")
+    return register_local(path, fn)
+
+
+def call_mode(env_var: str = "PF_CALL_MODE") -> str:
+    """``local`` (default) or ``remote``; lets one flow switch execution by environment."""
+    return (os.environ.get(env_var) or "local").strip().lower()
+
+
+def as_envelope(result: Any, target: str) -> Dict[str, Any]:
+    """Envelopes pass through (missing error/meta filled in); anything else becomes ``data``."""
+    if isinstance(result, dict) and "status" in result:
+        env = {"error": None, **result}
+        env["meta"] = {**(result.get("meta") or {}), "local_call": {"target": target}}
+        return env
+    return {"status": "ok", "data": result, "error": None, "meta": {"local_call": {"target": target}}}
+
+
+async def local_call(path: str, args=None, kwargs=None, timeout_ms: int = DEFAULT_TIMEOUT_MS) -> Dict[str, Any]:
+    """Invoke an in-process callable; sync callables run in the default thread pool."""
+    fn = resolve_local(path)
+    limit_ms = budget_ms(timeout_ms, f"local_call {path}")
+    if inspect.iscoroutinefunction(fn):
+        pending = fn(*(args or []), **(kwargs or {}))
+    else:
+        pending = asyncio.to_thread(fn, *(args or []), **(kwargs or {}))
+    try:
+        result = await asyncio.wait_for(pending, limit_ms / 1000.0)
+    except asyncio.TimeoutError:
+        raise TimeoutError(f"local_call {path} timed out after {int(limit_ms)}ms") from None
+    return as_envelope(result, path)
+
+
+# ---- Fan-out ----
+
+async def map_calls(items, fn, max_concurrency: int = 4):
+    """Run ``fn(index, item)`` for every item, at most ``max_concurrency`` at a time.
+
+    Results keep input order. The first failure cancels the remaining calls.
+    """
+    sem = asyncio.Semaphore(max(1, int(max_concurrency)))
+
+    async def _one(index, item):
+        async with sem:
+            return await fn(index, item)
+
+    tasks = [asyncio.ensure_future(_one(i, item)) for i, item in enumerate(items)]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+
+def collect_envelopes(results, **meta) -> Dict[str, Any]:
+    """Fold per-item envelopes into one node envelope (ok only if every item is ok)."""
+    failed = [i for i, env in enumerate(results) if env.get("status") != "ok"]
+    return {
+        "status": "error" if failed else "ok",
+        "data": {"items": list(results), "count": len(results)},
+        "error": {"code": "map_item_failed", "message": f"{len(failed)} item(s) failed", "details": {"failed": failed}}
+        if failed else None,
+        "meta": {"map": {"count": len(results), "failed": len(failed), **meta}},
+    }
+
+
+# ---- Fan-in: join / race / hedge ----
+
+def _is_ok(env: Any) -> bool:
+    return isinstance(env, dict) and env.get("status") == "ok"
+
+
+async def _start_after(delay_ms: float, wake: asyncio.Event, fn):
+    if delay_ms > 0:
+        try:
+            # Start early if an earlier call already failed
+            await asyncio.wait_for(wake.wait(), delay_ms / 1000.0)
+        except asyncio.TimeoutError:
+            pass
+    return await fn()
+
+
+async def first_accepted(factories, need: int, accept=None, delays_ms=None):
+    """Run call factories concurrently until ``need`` results pass ``accept``.
+
+    Calls still pending at that point are cancelled. Returns
+    ``(results, accepted, cancelled)`` where ``results[i]`` is the envelope,
+    the raised exception, or ``None`` for a cancelled call.
+    """
+    accept = accept or _is_ok
+    delays_ms = delays_ms or [0] * len(factories)
+    wake = asyncio.Event()
+    tasks = {asyncio.ensure_future(_start_after(d, wake, f)): i for i, (f, d) in enumerate(zip(factories, delays_ms))}
+    results: List[Any] = [None] * len(factories)
+    accepted: List[int] = []
+    pending = set(tasks)
+    try:
+        while pending and len(accepted) < need:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for t in sorted(done, key=tasks.__getitem__):
+                i = tasks[t]
+                results[i] = t.exception() or t.result()
+                if not isinstance(results[i], BaseException) and accept(results[i]):
+                    accepted.append(i)
+                else:
+                    wake.set()
+            if len(accepted) + len(pending) < need:
+                break  # quorum can no longer be reached
+    finally:
+        for t in pending:
+            t.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+    return results, accepted, len(pending)
+
+
+def _failure_details(results) -> List[Any]:
+    return [repr(r) if isinstance(r, BaseException) else (r or {}).get("error") for r in results]
+
+
+async def race(factories, accept=None, delays_ms=None, kind: str = "race") -> Dict[str, Any]:
+    """First accepted envelope wins; the losers are cancelled."""
+    results, accepted, cancelled = await first_accepted(factories, 1, accept, delays_ms)
+    meta = {"started": len(factories), "cancelled": cancelled}
+    if not accepted:
+        return {
+            "status": "error",
+            "data": None,
+            "error": {"code": f"{kind}_failed", "message": "no call succeeded",
+                      "details": {"errors": _failure_details(results)}},
+            "meta": {kind: meta},
+        }
+    win = accepted[0]
+    env = dict(results[win])
+    env["meta"] = {**(env.get("meta") or {}), kind: {"winner": win, **meta}}
+    return env
+
+
+async def hedge(primary, backup, delay_ms: float, accept=None) -> Dict[str, Any]:
+    """Start ``backup`` if ``primary`` has not succeeded after ``delay_ms``; first success wins."""
+    return await race([primary, backup], accept, [0, delay_ms], kind="hedge")
+
+
+async def join(factories, mode: str = "all", quorum: Optional[int] = None, accept=None) -> Dict[str, Any]:
+    """Wait for all calls, or for ``quorum`` accepted ones (cancelling the rest)."""
+    need = len(factories) if mode == "all" else int(quorum or 1)
+    results, accepted, cancelled = await first_accepted(factories, need, accept)
+    ok = len(accepted) >= need
+    return {
+        "status": "ok" if ok else "error",
+        "data": {
+            "results": [None if isinstance(r, BaseException) else r for r in results],
+            "accepted": sorted(accepted),
+        },
+        "error": None if ok else {"code": "join_unsatisfied", "message": f"{len(accepted)}/{need} accepted",
+                                  "details": {"errors": _failure_details(results)}},
+        "meta": {"join": {"mode": mode, "need": need, "accepted": len(accepted), "cancelled": cancelled}},
+    }
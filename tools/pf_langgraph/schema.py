@@ -1,12 +1,71 @@
 from typing import Any, Dict, List, TypedDict
 
 
-class PFNode(TypedDict):
+class PFCache(TypedDict, total=False):
+    key: Any  # template rendered per call; defaults to [method, url, body]
+    ttl_s: float  # omitted/0 = never expires
+    backend: str  # memory | disk
+
+
+class PFMapConfig(TypedDict, total=False):
+    items: str  # list expression, e.g. ${nodes.narrative_outline.data.beats}
+    max_concurrency: int  # default 4
+    call: Dict[str, Any]  # http_call config; templates may use ${item}, ${item.x}, ${index}
+
+
+class PFJoinConfig(TypedDict, total=False):
+    calls: List[Dict[str, Any]]  # http_call configs started together
+    mode: str  # all | quorum
+    quorum: int  # accepted results needed in quorum mode; the rest are cancelled
+    accept: str  # e.g. ${result.data.flags.ok}; default: status == "ok"
+
+
+class PFRaceConfig(TypedDict, total=False):
+    calls: List[Dict[str, Any]]  # first accepted result wins, losers are cancelled
+    accept: str
+
+
+class PFHedgeConfig(TypedDict, total=False):
+    call: Dict[str, Any]
+    backup: Dict[str, Any]  # defaults to call
+    delay_ms: float  # start backup if call has not succeeded by then (default 200)
+    accept: str
+
+
+class PFLocalCallConfig(TypedDict, total=False):
+    target: str  # dotted path of an in-process callable (registered or under PF_LOCAL_CALL_PREFIXES)
+    args: List[Any]
+    kwargs: Dict[str, Any]
+    remote: Dict[str, Any]  # http_call config used when the mode env var says "remote"
+    mode_env: str  # env var selecting local|remote (default PF_CALL_MODE)
+
+
+class PFRetry(TypedDict, total=False):
+    count: int  # extra attempts after the first
+    backoff_ms: float  # delay before the first retry
+    backoff_factor: float  # multiplier per further retry (default 2.0)
+    retry_on: List[int]  # HTTP statuses worth retrying (default 429/502/503/504)
+
+
+class PFCircuitBreaker(TypedDict, total=False):
+    name: str  # defaults to the node id; share a name to share state
+    failure_threshold: int
+    cooldown_ms: int
+
+
+class _PFNodeBase(TypedDict):
     id: str
-    kind: str  # http_call | branch
+    kind: str  # http_call | branch | map | join | race | hedge | local_call
     config: Dict[str, Any]
 
 
+class PFNode(_PFNodeBase, total=False):
+    cache: PFCache
+    timeout_ms: int  # default 60000
+    retry: PFRetry
+    circuit_breaker: PFCircuitBreaker
+
+
 class PFSpec(TypedDict):
     version: int
     name: str